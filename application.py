@@ -1,123 +1,61 @@
-import sqlite3
+import logging
+import os
+import time
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from datetime import datetime
 
-
-class DatabaseManager:
-    def __init__(self, db_file) -> None:
-        self.db_file = db_file
-
-    def _connect(self):
-        return sqlite3.connect(self.db_file)
-
-    def query(self, query, params=()):
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.fetchall()
-
-    def execute(self, query, params=()):
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-
-    def add_product(
-        self, sku, description, id_department, id_class, id_family, stock,
-        quantity, record_delete, model, brand, record_data, discontinued
-    ):
-        query = """
-        INSERT OR IGNORE INTO Product (
-            sku, description, id_department, id_class, id_family, stock,
-            quantity, record_delete, model, brand, record_data, discontinued
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        self.execute(query, (
-            sku, description, id_department, id_class, id_family, stock,
-            quantity, record_delete, model, brand, record_data, discontinued
-        ))
-
-    def update_product(
-        self, sku, description, id_department, id_class, id_family, stock,
-        quantity, record_delete, model, brand, record_data, discontinued
-    ):
-        query = """
-        UPDATE Product
-        SET description = ?, id_department = ?, id_class = ?, id_family = ?,
-        stock = ?, quantity = ?, record_delete = ?, model = ?, brand = ?,
-        record_data = ?, discontinued = ?
-        WHERE sku = ?
-        """
-        self.execute(query, (
-            description, id_department, id_class, id_family, stock,
-            quantity, record_delete, model, brand, record_data, discontinued, 
-            sku))
-
-    def delete_product(self, sku):
-        query = "DELETE FROM Product WHERE sku = ?"
-        self.execute(query, (sku,))
-
-    def get_product_by_sku(self, sku):
-        query = """
-        SELECT p.sku, p.description, p.id_department, p.id_class, p.id_family,
-            p.brand, p.model, p.stock, p.quantity, p.discontinued,
-            p.record_delete, p.record_data,
-            d.name AS department_name,
-            c.name AS class_name,
-            f.name AS family_name
-        FROM Product p
-        JOIN Department d ON p.id_department = d.id
-        JOIN Class c ON p.id_class = c.id AND p.id_department = c.id_department
-        JOIN Family f ON p.id_family = f.id AND p.id_class = f.id_class
-        AND p.id_department = f.id_department
-        WHERE p.sku = ?
-        """
-        return self.query(query, (sku,))
-
-    def generate_hierarchical_data(self):
-        department_dict = {}
-        class_dict = {}
-        family_dict = {}
-
-        # Obtener la lista de departamentos
-        departments = self.query("SELECT id, name FROM Department")
-
-        # Para cada departamento, obtener sus clases
-        for dept_id, dept_name in departments:
-            department_dict[dept_name] = dept_id
-            classes = self.query(
-                "SELECT id, name FROM Class WHERE id_department = ?",
-                (dept_id,)
-                )
-            class_dict[dept_id] = {
-                class_name: class_id for class_id, class_name in classes
-            }
-
-            # Para cada clase, obtener sus familias
-            for class_id, class_name in classes:
-                families = self.query(
-                    "SELECT id, name FROM Family WHERE id_department = ? AND id_class = ?",
-                    (dept_id, class_id)
-                )
-                family_dict[(dept_id, class_id)] = {
-                    family_name: family_id for family_id,
-                    family_name in families}
-
-        return department_dict, class_dict, family_dict
+from browser import ProductBrowser
+from catalog import Catalog
+from database import ProductArchived, ProductNotFound, VersionConflict
+from rules import (
+    FIELD_RULES, PRODUCT_FIELDS, ValidationError, check_product, quantity_fits
+)
+from metrics import Metrics
+from shards import open_database
+from worker import DatabaseWorker
+
+
+logger = logging.getLogger(__name__)
+
+
+# Milisegundos sin teclear antes de lanzar la búsqueda.
+SEARCH_DELAY_MS = 200
+# Cada cuánto se leen las altas y bajas de SKU hechas por otros procesos.
+SKU_REFRESH_MS = 2000
+
+# Nombre de cada campo en los avisos de validación.
+FIELD_LABELS = {
+    "sku": "SKU",
+    "description": "Artículo",
+    "brand": "Marca",
+    "model": "Modelo",
+    "id_department": "Departamento",
+    "id_class": "Clase",
+    "id_family": "Familia",
+    "stock": "Stock",
+    "quantity": "Cantidad",
+    "discontinued": "Descontinuado",
+    "record_data": "Fecha de Registro",
+    "record_delete": "Fecha de Baja",
+}
 
 
 class ProductApp:
-    def __init__(self, root, db_file):
-        self.db_manager = DatabaseManager(db_file)
-
-        self.department_dict, self.class_dict, self.family_dict = (
-            self.db_manager.generate_hierarchical_data())
+    def __init__(self, root, db_file, metrics=None):
+        # El esquema y el catálogo se cargan en segundo plano; mientras tanto
+        # la ventana se muestra con el catálogo vacío.
+        self.metrics = metrics
+        self.db_manager = open_database(db_file, bootstrap=False, metrics=metrics)
+        self.catalog = Catalog([], [], [])
 
         self.root = root
         self.root.title("Gestión de Productos")
 
+        self.db_worker = DatabaseWorker(
+            root, on_busy=self.set_busy, on_error=self.show_db_error)
+
         # Define width for all Entry and ComboBox widgets
         field_width = 30
 
@@ -129,31 +67,36 @@ class ProductApp:
 
         tk.Label(root, text="SKU:").grid(row=0, column=0, padx=10, pady=5, sticky="e")
         self.sku_entry = tk.Entry(
-            root, width=field_width, validate="key", validatecommand=(validate_sku, '%S', '%P'))
+            root, width=field_width, validate="key", validatecommand=(validate_sku, '%P'))
         self.sku_entry.grid(row=0, column=1, padx=10, pady=5)
+        self.sku_mode_lbl = tk.Label(root, text="")
+        self.sku_mode_lbl.grid(row=0, column=2, columnspan=2, padx=10, pady=5, sticky="w")
+        self.sku_refresh_job = None
+        # Producto consultado: el Cambio sólo escribe lo que difiere de él.
+        self.current_product = None
 
         tk.Label(root, text="Descripción:").grid(row=1, column=0, padx=10, pady=5, sticky="e")
         self.description_entry = tk.Entry(
             root, width=field_width, validate="key",
-            validatecommand=(validate_text, '%S', '%P', 15))
+            validatecommand=(validate_text, '%P', 'description'))
         self.description_entry.grid(row=1, column=1, padx=10, pady=5)
 
         tk.Label(root, text="Marca:").grid(row=2, column=0, padx=10, pady=5, sticky="e")
         self.brand_entry = tk.Entry(
             root, width=field_width, validate="key",
-            validatecommand=(validate_text, '%S', '%P', 15))
+            validatecommand=(validate_text, '%P', 'brand'))
         self.brand_entry.grid(row=2, column=1, padx=10, pady=5)
 
         tk.Label(root, text="Modelo:").grid(row=3, column=0, padx=10, pady=5, sticky="e")
         self.model_entry = tk.Entry(
             root, width=field_width, validate="key",
-            validatecommand=(validate_text, '%S', '%P', 20))
+            validatecommand=(validate_text, '%P', 'model'))
         self.model_entry.grid(row=3, column=1, padx=10, pady=5)
 
         tk.Label(root, text="Departamento:").grid(row=4, column=0, padx=10, pady=5, sticky="e")
         self.department_combobox = ttk.Combobox(root, state=tk.DISABLED, width=field_width)
         self.department_combobox.grid(row=4, column=1, padx=10, pady=5)
-        self.department_combobox.config(values=list(self.department_dict.keys()))
+        self.department_combobox.config(values=self.catalog.department_names())
         self.department_combobox.bind("<<ComboboxSelected>>", self.update_classes)
 
         tk.Label(root, text="Clase:").grid(row=5, column=0, padx=10, pady=5, sticky="e")
@@ -167,12 +110,12 @@ class ProductApp:
 
         tk.Label(root, text="Stock:").grid(row=7, column=0, padx=10, pady=5, sticky="e")
         self.stock_entry = tk.Entry(root, width=field_width,
-            validate="key", validatecommand=(validate_stock, '%S', '%P'))
+            validate="key", validatecommand=(validate_stock, '%P'))
         self.stock_entry.grid(row=7, column=1, padx=10, pady=5)
 
         tk.Label(root, text="Cantidad:").grid(row=8, column=0, padx=10, pady=5, sticky="e")
         self.quantity_entry = tk.Entry(
-            root, width=field_width, validate="key", validatecommand=(validate_quantity, '%S', '%P'))
+            root, width=field_width, validate="key", validatecommand=(validate_quantity, '%P'))
         self.quantity_entry.grid(row=8, column=1, padx=10, pady=5)
 
         tk.Label(root, text="Fecha de Registro:").grid(row=9, column=0, padx=10, pady=5, sticky="e")
@@ -194,7 +137,8 @@ class ProductApp:
             row=11, column=0, columnspan=2, padx=10, pady=5
         )
 
-        self.msg_lbl = tk.Label(root, text="").grid(row=12, column=0, padx=10, pady=5, sticky="e")
+        self.msg_lbl = tk.Label(root, text="")
+        self.msg_lbl.grid(row=12, column=0, columnspan=2, padx=10, pady=5, sticky="w")
 
         # Create Buttons
         self.consult_button = tk.Button(root, text="Consultar", command=self.consult_product, state=tk.DISABLED)
@@ -208,26 +152,156 @@ class ProductApp:
         self.clean_button = tk.Button(root, text="Limpiar", command=self.clear_form, state=tk.DISABLED)
         self.clean_button.grid(row=4, column=3, padx=10, pady=5)
 
+        # Búsqueda por descripción, marca o modelo
+        self.search_job = None
+        self.search_results = []
+
+        tk.Label(root, text="Buscar:").grid(row=0, column=4, padx=10, pady=5, sticky="e")
+        self.search_entry = tk.Entry(root, width=field_width)
+        self.search_entry.grid(row=0, column=5, padx=10, pady=5)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+
+        self.search_listbox = tk.Listbox(root, width=45, height=12)
+        self.search_listbox.grid(
+            row=1, column=4, rowspan=8, columnspan=2, padx=10, pady=5, sticky="n")
+        self.search_listbox.bind("<<ListboxSelect>>", self.select_search_result)
+
+        # Lista de todos los productos; se filtra con los combobox de
+        # departamento, clase y familia cuando la casilla está marcada.
+        self.browse_filter_var = tk.BooleanVar()
+        tk.Checkbutton(
+            root, text="Filtrar la lista por departamento, clase y familia",
+            variable=self.browse_filter_var, command=self.filter_browser
+        ).grid(row=9, column=4, columnspan=2, padx=10, pady=5, sticky="w")
+        for combobox in (
+            self.department_combobox, self.class_combobox,
+            self.family_combobox
+        ):
+            combobox.bind("<<ComboboxSelected>>", self.filter_browser, add="+")
+
+        self.browser = ProductBrowser(
+            root, self.db_worker, self.db_manager, on_select=self.show_product)
+        self.browser.grid(
+            row=13, column=0, columnspan=6, padx=10, pady=5, sticky="nsew")
+        root.rowconfigure(13, weight=1)
+
         # Initialize date fields with current date
         self.clear_form()
 
+        self.db_worker.submit(self.load_catalog, write=True, on_done=self.set_catalog)
+
+    def close(self):
+        if self.sku_refresh_job is not None:
+            self.root.after_cancel(self.sku_refresh_job)
+        self.db_worker.close()
+        self.db_manager.close()
+
+    def load_catalog(self):
+        self.db_manager.ensure_schema()
+        self.db_manager.sku_index()
+        return self.db_manager.catalog()
+
+    def set_catalog(self, catalog):
+        self.catalog = catalog
+        self.department_combobox.config(values=catalog.department_names())
+        self.show_sku_mode(self.sku_entry.get())
+        self.schedule_sku_refresh()
+        self.browser.reload()
+
+    def filter_browser(self, event=None):
+        if self.browse_filter_var.get():
+            department_id, class_id, family_id = self.selected_hierarchy()
+            self.browser.set_filters(
+                id_department=department_id, id_class=class_id,
+                id_family=family_id)
+        else:
+            self.browser.set_filters()
+
+    def schedule_sku_refresh(self):
+        self.sku_refresh_job = self.root.after(
+            SKU_REFRESH_MS, self.refresh_sku_index)
+
+    def refresh_sku_index(self):
+        self.sku_refresh_job = None
+        self.db_worker.submit(
+            self.db_manager.refresh_sku_index, key="sku-index", busy=False,
+            on_done=self.sku_index_refreshed,
+            on_error=self.sku_refresh_failed)
+
+    def sku_index_refreshed(self, changes):
+        if changes:
+            self.show_sku_mode(self.sku_entry.get())
+        self.schedule_sku_refresh()
+
+    def sku_refresh_failed(self, error):
+        logger.warning("No se pudo actualizar el índice de SKU: %s", error)
+        self.schedule_sku_refresh()
+
+    def show_sku_mode(self, entry_value):
+        # Se decide con el índice en memoria, sin consultar la base.
+        exists = self.db_manager.sku_exists(entry_value) if entry_value else None
+        if exists is None:
+            text = ""
+        elif exists:
+            text = "Existente: Consulta, Cambio o Baja"
+        else:
+            text = "Nuevo: Alta"
+        self.sku_mode_lbl.config(text=text)
+        if exists is False:
+            # Los archivados no están en el índice; se revisan en la base.
+            self.db_worker.submit(
+                self.db_manager.is_archived, entry_value, key="sku_mode",
+                busy=False, on_done=self.show_archived_mode)
+        else:
+            self.db_worker.cancel("sku_mode")
+
+    def show_archived_mode(self, archived):
+        if archived:
+            self.sku_mode_lbl.config(text="Archivado: sólo consulta")
+
+    def set_busy(self, busy):
+        self.root.config(cursor="watch" if busy else "")
+        self.msg_lbl.config(text="Procesando..." if busy else "")
+
+    def show_db_error(self, error):
+        logger.error("Error de base de datos: %s", error)
+        messagebox.showerror("Error de base de datos", str(error))
+
+    def timed(self, handler, callback):
+        # Mide desde que se pulsa el botón hasta que el resultado se muestra.
+        if self.metrics is None:
+            return callback
+        started = time.perf_counter()
+
+        def done(result):
+            try:
+                callback(result)
+            finally:
+                self.metrics.observe(
+                    "abcc_ui_handler_seconds", time.perf_counter() - started,
+                    handler=handler)
+        return done
+
+    def selected_hierarchy(self):
+        department_id = self.catalog.department_id(self.department_combobox.get())
+        class_id = self.catalog.class_id(department_id, self.class_combobox.get())
+        family_id = self.catalog.family_id(
+            department_id, class_id, self.family_combobox.get())
+        return department_id, class_id, family_id
+
     def update_classes(self, event=None):
-        department = self.department_combobox.get()
-        department_id = self.department_dict.get(department)
+        department_id = self.catalog.department_id(self.department_combobox.get())
         if department_id:
-            classes = list(self.class_dict.get(department_id, {}).keys())
+            classes = self.catalog.class_names(department_id)
             self.class_combobox.config(values=classes)
-            self.class_combobox.set(classes[0])
+            self.class_combobox.set(classes[0] if classes else "")
 
     def update_families(self, event=None):
-        department = self.department_combobox.get()
-        department_id = self.department_dict.get(department)
-        class_name = self.class_combobox.get()
-        if department_id and class_name:
-            class_id = self.class_dict.get(department_id, {}).get(class_name)
-            families = list(self.family_dict.get((department_id, class_id), {}).keys()) if class_id else []
+        department_id, class_id, _ = self.selected_hierarchy()
+        if department_id and class_id:
+            families = self.catalog.family_names(department_id, class_id)
             self.family_combobox.config(values=families)
-            self.family_combobox.set(families[0])
+            self.family_combobox.set(families[0] if families else "")
 
     def edit_form(self):
         self.toogle_form_fields(True)
@@ -310,6 +384,7 @@ class ProductApp:
         self.class_combobox.set("")
         self.family_combobox.set("")
         self.discontinued_var.set(False)
+        self.current_product = None
 
         self.add_button.config(text="Agregar")
 
@@ -322,12 +397,30 @@ class ProductApp:
 
         # Deshabilitar los campos nuevamente después de limpiarlos
         self.disable_form()
+        self.show_sku_mode("")
 
     def consult_product(self):
         sku = self.sku_entry.get()
-        result = self.db_manager.get_product_by_sku(sku)
+        self.consult_button.config(state=tk.DISABLED)
+        self.db_worker.submit(
+            self.db_manager.get_product_by_sku, sku, key="product",
+            on_done=self.timed("consult_product", self.show_consult_result),
+            on_error=self.consult_failed)
 
-        if result:
+    def consult_failed(self, error):
+        self.consult_button.config(state=tk.NORMAL)
+        self.show_db_error(error)
+
+    def show_consult_result(self, result):
+        self.consult_button.config(state=tk.NORMAL)
+        if result and result[0].archived:
+            # Producto archivado: se muestra, pero ya no se modifica.
+            self.fill_form(result)
+            self.edit_button.config(state=tk.DISABLED)
+            self.delete_button.config(state=tk.DISABLED)
+            self.clean_button.config(state=tk.NORMAL)
+            self.sku_mode_lbl.config(text="Archivado: sólo consulta")
+        elif result:
             self.fill_form(result)
             self.edit_button.config(state=tk.NORMAL)
             self.delete_button.config(state=tk.NORMAL)
@@ -338,10 +431,43 @@ class ProductApp:
             self.delete_button.config(state=tk.DISABLED)
             self.clean_button.config(state=tk.NORMAL)
 
+    def schedule_search(self, event=None):
+        # Se espera a que el usuario deje de teclear antes de buscar.
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        # Una búsqueda nueva deja obsoleta a la anterior.
+        self.search_job = None
+        self.db_worker.submit(
+            self.db_manager.search_text, self.search_entry.get(),
+            key="search", busy=False, on_done=self.show_search_results,
+            on_error=lambda error: self.show_search_results([]))
+
+    def show_search_results(self, results):
+        self.search_results = results
+        self.search_listbox.delete(0, tk.END)
+        for sku, description, brand, model in results:
+            self.search_listbox.insert(
+                tk.END, f"{sku} - {description} {brand or ''} {model or ''}")
+
+    def select_search_result(self, event=None):
+        selection = self.search_listbox.curselection()
+        if not selection:
+            return
+        self.show_product(self.search_results[selection[0]][0])
+
+    def show_product(self, sku):
+        self.clear_form()
+        self.sku_entry.insert(0, str(sku))
+        self.consult_product()
+
     def fill_form(self, data):
         product_info = data[0]
+        self.current_product = product_info
 
-        print(product_info)
+        logger.debug("Producto consultado: %s", product_info)
 
         self.update_data_form(self.description_entry, product_info[1])
         self.update_data_form(self.brand_entry, product_info[5])
@@ -351,18 +477,15 @@ class ProductApp:
         self.update_data_form(self.record_delete_entry, product_info[10])
         self.update_data_form(self.record_data_entry, product_info[11])
 
-        try:
-            self.department_combobox.current(product_info[2] - 1)
-            self.update_classes()
-
-            self.class_combobox.current(product_info[3] - 1)
-            self.update_families()
-
-            self.family_combobox.current(product_info[4] - 1)
-        except IndexError as e:
-            print(f"IndexError: {e}. Verifica que 'product_info' tenga suficientes elementos.")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+        department_id, class_id, family_id = product_info[2:5]
+        self.department_combobox.set(
+            self.catalog.department_name(department_id) or "")
+        self.update_classes()
+        self.class_combobox.set(
+            self.catalog.class_name(department_id, class_id) or "")
+        self.update_families()
+        self.family_combobox.set(
+            self.catalog.family_name(department_id, class_id, family_id) or "")
 
     def update_data_form(self, field, value):
         field.config(state=tk.NORMAL)
@@ -372,7 +495,6 @@ class ProductApp:
         else:
             field.insert(0, value)
         field.config(state=tk.DISABLED)
-        print(value)
 
     def show_msg(self, field):
         messagebox.showwarning(
@@ -384,9 +506,7 @@ class ProductApp:
         sku = self.sku_entry.get()
         description = self.description_entry.get().strip()
         model = self.model_entry.get().strip()
-        id_department = self.department_combobox.current() + 1
-        id_class = self.class_combobox.current() + 1
-        id_family = self.family_combobox.current() + 1
+        id_department, id_class, id_family = self.selected_hierarchy()
         stock = self.stock_entry.get()
         quantity = self.quantity_entry.get()
         brand = self.brand_entry.get().strip()
@@ -394,67 +514,90 @@ class ProductApp:
         record_delete = self.record_delete_entry.get().strip()
         discontinued = self.discontinued_var.get()
 
-        if sku == '':
-            self.show_msg('SKU')
-            return None
-
-        if description == '':
-            self.show_msg('Artículo')
-            return None
-
-        if brand == '':
-            self.show_msg('Marca')
-            return None
-
-        if model == '':
-            self.show_msg('Modelo')
-            return None
-
-        if self.department_combobox.current() == -1:
-            self.show_msg('Departamento')
-            return None
-
-        if self.class_combobox.current() == -1:
-            self.show_msg('Clase')
-            return None
-
-        if self.family_combobox.current() == -1:
-            self.show_msg('Familia')
-            return None
-
-        if stock == '':
-            self.show_msg('Stock')
-            return None
-
-        if quantity == '':
-            self.show_msg('Cantidad')
-            return None
-
-        if description == '':
-            self.show_msg('Artículo')
-            return None
-
         action = self.add_button.cget('text')
 
         if discontinued:
             today = datetime.now().strftime("%Y-%m-%d")
             record_delete = today
 
+        # Las mismas reglas que la carga masiva y el servicio; se avisa del
+        # primer campo con error.
+        record = dict(zip(PRODUCT_FIELDS, (
+            sku, description, id_department, id_class, id_family, stock,
+            quantity, record_delete, model, brand, record_data, discontinued
+        )))
+        values, errors = check_product(record, self.catalog)
+        if errors:
+            field, message = errors[0]
+            self.show_msg(f"{FIELD_LABELS[field]}: {message}")
+            return None
+        self.add_button.config(state=tk.DISABLED)
+        self.db_worker.submit(
+            self.save_product, action, values, self.current_product, write=True,
+            on_done=self.timed("add_or_update_product", self.product_saved),
+            on_error=self.save_failed)
+
+    def save_product(self, action, values, current=None):
         if action == 'Agregar':
-            self.db_manager.add_product(
-                sku, description, id_department, id_class, id_family, stock,
-                quantity, record_delete, model, brand, record_data, discontinued
-            )
+            self.db_manager.add_product(*values)
+        elif current is None or str(current[0]) != str(values[0]):
+            self.db_manager.update_product(*values)
         else:
-            self.db_manager.update_product(
-                sku, description, id_department, id_class, id_family, stock,
-                quantity, record_delete, model, brand, record_data, discontinued
-            )
+            # current es la fila consultada; otra terminal pudo cambiarla
+            # desde entonces.
+            record = dict(zip(PRODUCT_FIELDS, values))
+            record["discontinued"] = int(record["discontinued"])
+            previous = {
+                "sku": current[0], "description": current[1],
+                "id_department": current[2], "id_class": current[3],
+                "id_family": current[4], "brand": current[5],
+                "model": current[6], "stock": current[7],
+                "quantity": current[8], "discontinued": current[9],
+                "record_delete": current[10], "record_data": current[11],
+            }
+            changes = {
+                field: value for field, value in record.items()
+                if field != "sku" and str(value) != str(previous[field])
+            }
+            if changes:
+                self.db_manager.update_product(
+                    values[0], **changes, expected_version=current[15])
+        return self.db_manager.get_product_by_sku(values[0])
 
+    def product_saved(self, result):
         self.add_button.config(text="Agregar", state=tk.DISABLED)
         self.disable_form()
+        self.show_sku_mode(self.sku_entry.get())
 
-        print(self.db_manager.get_product_by_sku(sku))
+        logger.info("Producto guardado: %s", result[0] if result else None)
+        if result:
+            self.browser.update_product(result[0])
+
+    def save_failed(self, error):
+        self.add_button.config(state=tk.NORMAL)
+        if isinstance(error, VersionConflict):
+            logger.warning("%s", error)
+            messagebox.showwarning(
+                "Producto modificado",
+                f"{error}. Consulte de nuevo el producto antes de guardar.")
+            return
+        if isinstance(error, (ProductNotFound, ProductArchived)):
+            self.show_not_writable(error)
+            return
+        if isinstance(error, ValidationError):
+            # La fila cambió entre la validación del formulario y el UPDATE
+            # (por ejemplo, la cantidad ya no cabe en el stock guardado).
+            field, message = error.errors[0]
+            logger.warning("%s", error)
+            self.show_msg(f"{FIELD_LABELS.get(field, field)}: {message}")
+            return
+        self.show_db_error(error)
+
+    def show_not_writable(self, error):
+        # Archivado o ya dado de baja en otra terminal; no es un error de la
+        # base de datos.
+        logger.warning("%s", error)
+        messagebox.showwarning("Producto no disponible", str(error))
 
     def delete_product(self):
         result = messagebox.askyesno(
@@ -463,46 +606,47 @@ class ProductApp:
         )
         if result:
             sku = self.sku_entry.get()
-            self.db_manager.delete_product(sku)
-            self.clear_form()
+            self.delete_button.config(state=tk.DISABLED)
+            self.db_worker.submit(
+                self.db_manager.delete_product, sku, write=True,
+                on_done=lambda _: self.product_deleted(sku),
+                on_error=self.delete_failed)
         else:
             pass
 
-    def validate_sku_key(self, char, entry_value):
-        if char.isdigit() and len(entry_value) <= 6:
-            self.update_consult_button(entry_value)
-            return True
-        elif char == "":
-            self.update_consult_button(entry_value[:-1])
-            return True
-        return False
-
-    def validate_stock_key(self, char, entry_value):
-        if char.isdigit() and len(entry_value) <= 9:
-            return True
-        elif char == "":
-            return True
-        return False
-
-    def validate_quantity_key(self, char, entry_value):
-        limit = int(self.stock_entry.get())
-        current = int(entry_value) if entry_value != "" else 0
-
-        if char.isdigit() and len(entry_value) <= 9 and limit >= current:
-            return True
-        elif char == "":
-            return True
-        return False
-
-    def validate_text_key(self, char, entry_value, max_length):
-        if char.isalpha() or char == "":
-            if len(entry_value) < int(max_length):
-                return True
-            else:
-                return False
-        return False
+    def product_deleted(self, sku):
+        self.browser.remove_product(sku)
+        self.clear_form()
+
+    def delete_failed(self, error):
+        self.delete_button.config(state=tk.NORMAL)
+        if isinstance(error, ProductNotFound):
+            self.show_not_writable(error)
+            return
+        self.show_db_error(error)
+
+    # Validaciones por tecla: entry_value es el contenido que quedaría en
+    # el campo; las reglas son las de rules.FIELD_RULES.
+    def validate_sku_key(self, entry_value):
+        if not FIELD_RULES["sku"].accepts_partial(entry_value):
+            return False
+        self.update_consult_button(entry_value)
+        return True
+
+    def validate_stock_key(self, entry_value):
+        return FIELD_RULES["stock"].accepts_partial(entry_value)
+
+    def validate_quantity_key(self, entry_value):
+        return FIELD_RULES["quantity"].accepts_partial(entry_value) \
+            and quantity_fits(entry_value, self.stock_entry.get())
+
+    def validate_text_key(self, entry_value, field):
+        return FIELD_RULES[field].accepts_partial(entry_value)
 
     def update_consult_button(self, entry_value):
+        # Una consulta en curso para un SKU que ya cambió deja de importar.
+        self.db_worker.cancel("product")
+        self.show_sku_mode(entry_value)
         if 0 < len(entry_value) <= 6:
             self.consult_button.config(state=tk.NORMAL)
         else:
@@ -510,7 +654,28 @@ class ProductApp:
             self.toogle_form_fields(False)
 
 
+def metrics_from_environment():
+    # ABCC_METRICS_PORT expone /metrics en formato Prometheus y
+    # ABCC_METRICS_FILE escribe el mismo contenido cada 15 segundos.
+    port = os.environ.get("ABCC_METRICS_PORT")
+    path = os.environ.get("ABCC_METRICS_FILE")
+    if not port and not path:
+        return None
+
+    metrics = Metrics(
+        slow_query_ms=float(os.environ.get("ABCC_SLOW_QUERY_MS", "100")))
+    if port:
+        metrics.serve(int(port))
+    if path:
+        metrics.export_periodically(path)
+    return metrics
+
+
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("ABCC_LOG_LEVEL", "WARNING").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     root = tk.Tk()
-    app = ProductApp(root, "data.db")
+    app = ProductApp(root, "data.db", metrics=metrics_from_environment())
     root.mainloop()
+    app.close()
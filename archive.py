@@ -0,0 +1,258 @@
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+from database import DatabaseManager, product_key
+from rules import PRODUCT_FIELDS
+from shards import single_file_error
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AGE_DAYS = 365
+# Después de mover al menos esta cantidad de productos se devuelven las
+# páginas libres y se actualizan las estadísticas del planificador.
+MAINTENANCE_THRESHOLD = 10_000
+
+ARCHIVE_COLUMNS = ", ".join(PRODUCT_FIELDS + ("row_version",))
+
+# Descontinuados con fecha de baja anterior al corte, por el índice parcial
+# de los descontinuados (sin ANALYZE el planificador no lo elegiría).
+CANDIDATES_QUERY = """
+    SELECT sku FROM Product INDEXED BY idx_product_archive_candidates
+    WHERE discontinued = 1 AND record_delete > '1900-01-01'
+    AND record_delete <= ?
+    LIMIT ?
+"""
+
+
+class ArchiveReport:
+    def __init__(self):
+        self.archived = 0
+        self.batches = 0
+        self.pages_before = 0
+        self.pages_after = 0
+        self.free_pages = 0
+        self.page_size = 0
+        # Páginas de Product y sus índices; None sin la tabla virtual dbstat.
+        self.live_pages_before = None
+        self.live_pages_after = None
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def pages_reclaimed(self):
+        return max(self.pages_before - self.pages_after, 0)
+
+    @property
+    def bytes_reclaimed(self):
+        return self.pages_reclaimed * self.page_size
+
+    def summary(self):
+        text = (
+            f"Archivados {self.archived} en {self.batches} lotes "
+            f"({self.elapsed:.2f} s). Páginas recuperadas: "
+            f"{self.pages_reclaimed} ({self.bytes_reclaimed:,} bytes); "
+            f"páginas libres sin devolver: {self.free_pages}"
+        )
+        if self.live_pages_before is not None:
+            text += (f". Páginas de Product: {self.live_pages_before} -> "
+                     f"{self.live_pages_after}")
+        return text
+
+
+def page_stats(db):
+    # (páginas, páginas libres, tamaño de página)
+    return tuple(
+        db.query(f"PRAGMA {name}")[0][0]
+        for name in ("page_count", "freelist_count", "page_size"))
+
+
+def live_pages(db):
+    # dbstat es opcional al compilar SQLite.
+    try:
+        return db.query("""
+            SELECT count(*) FROM dbstat
+            WHERE name = 'Product'
+            OR name IN (SELECT name FROM sqlite_master
+                        WHERE type = 'index' AND tbl_name = 'Product')
+        """)[0][0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def incremental_vacuum_enabled(db):
+    # 2 = INCREMENTAL. Con NONE las páginas libres se reutilizan, pero el
+    # archivo no se reduce sin un VACUUM completo.
+    return db.query("PRAGMA auto_vacuum")[0][0] == 2
+
+
+def enable_incremental_vacuum(db):
+    # Cambiar auto_vacuum en una base con tablas requiere un VACUUM
+    # completo, que bloquea la base mientras reescribe el archivo.
+    db.query("PRAGMA auto_vacuum = INCREMENTAL")
+    db.query("VACUUM")
+
+
+def archive_batch(db, cutoff, batch_size, today):
+    with db.transaction() as conn:
+        skus = [sku for sku, in conn.execute(
+            CANDIDATES_QUERY, (cutoff, batch_size))]
+        if not skus:
+            return []
+        placeholders = ", ".join("?" for _ in skus)
+        conn.execute(f"""
+            INSERT OR REPLACE INTO ProductArchive (
+                {ARCHIVE_COLUMNS}, archived_at
+            )
+            SELECT {ARCHIVE_COLUMNS}, ? FROM Product
+            WHERE sku IN ({placeholders})
+        """, (today, *skus))
+        conn.execute(
+            f"DELETE FROM Product WHERE sku IN ({placeholders})", skus)
+    for sku in skus:
+        db.product_cache.invalidate(product_key(sku))
+    return skus
+
+
+def reclaim_space(db, step_pages=1000, pause=0.05):
+    # Devuelve las páginas libres en pasos pequeños para no retener el
+    # candado de escritura mucho tiempo.
+    if incremental_vacuum_enabled(db):
+        free = db.query("PRAGMA freelist_count")[0][0]
+        while free:
+            db.query(f"PRAGMA incremental_vacuum({step_pages})")
+            remaining = db.query("PRAGMA freelist_count")[0][0]
+            if remaining >= free:
+                break
+            free = remaining
+            time.sleep(pause)
+    # analysis_limit acota el muestreo de cada índice.
+    db.query("PRAGMA analysis_limit = 1000")
+    db.execute("ANALYZE Product")
+    db.execute("ANALYZE ProductArchive")
+    db.query("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def archive_products(
+    db, age_days=DEFAULT_AGE_DAYS, batch_size=500, pause=0.05,
+    maintenance_threshold=MAINTENANCE_THRESHOLD, today=None
+):
+    today = today or date.today()
+    cutoff = (today - timedelta(days=age_days)).isoformat()
+    report = ArchiveReport()
+    report.pages_before, _, report.page_size = page_stats(db)
+    report.live_pages_before = live_pages(db)
+
+    while True:
+        skus = archive_batch(db, cutoff, batch_size, today.isoformat())
+        if not skus:
+            break
+        report.archived += len(skus)
+        report.batches += 1
+        # La pausa entre lotes deja pasar a las escrituras de la interfaz.
+        time.sleep(pause)
+
+    if report.archived >= maintenance_threshold:
+        logger.info("Recuperando espacio tras archivar %d productos",
+                    report.archived)
+        reclaim_space(db)
+    report.pages_after, report.free_pages, _ = page_stats(db)
+    report.live_pages_after = live_pages(db)
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def restore_product(db, sku):
+    # Devuelve un producto archivado a Product, salvo que el SKU ya se haya
+    # vuelto a dar de alta.
+    with db.transaction() as conn:
+        restored = conn.execute(f"""
+            INSERT INTO Product ({ARCHIVE_COLUMNS})
+            SELECT {ARCHIVE_COLUMNS} FROM ProductArchive WHERE sku = ?
+            ON CONFLICT (sku) DO NOTHING
+        """, (sku,)).rowcount
+        if restored:
+            conn.execute("DELETE FROM ProductArchive WHERE sku = ?", (sku,))
+    db.product_cache.invalidate(product_key(sku))
+    return bool(restored)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Archiva productos descontinuados fuera de la tabla "
+                    "Product.")
+    parser.add_argument("--db", default="data.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="Archiva los descontinuados más antiguos que --age días.")
+    run_parser.add_argument("--age", type=int, default=DEFAULT_AGE_DAYS)
+    run_parser.add_argument("--batch-size", type=int, default=500)
+    run_parser.add_argument(
+        "--pause", type=float, default=0.05,
+        help="Segundos de espera entre lotes.")
+    run_parser.add_argument(
+        "--maintenance-threshold", type=int, default=MAINTENANCE_THRESHOLD,
+        help="Productos archivados a partir de los cuales se ejecutan "
+             "incremental_vacuum y ANALYZE.")
+
+    restore_parser = subparsers.add_parser(
+        "restore", help="Devuelve un SKU archivado a Product.")
+    restore_parser.add_argument("sku", type=int)
+
+    subparsers.add_parser(
+        "status", help="Productos archivados y páginas libres.")
+    subparsers.add_parser(
+        "enable-incremental-vacuum",
+        help="Activa auto_vacuum=INCREMENTAL con un VACUUM completo "
+             "(bloquea la base mientras dura).")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    error = single_file_error(args.db, "archive.py")
+    if error:
+        print(error, file=sys.stderr)
+        return 1
+    db = DatabaseManager(args.db)
+    try:
+        if args.command == "run":
+            report = archive_products(
+                db, args.age, args.batch_size, args.pause,
+                args.maintenance_threshold)
+            print(report.summary())
+            if report.free_pages and not incremental_vacuum_enabled(db):
+                print("auto_vacuum no es INCREMENTAL: las páginas libres se "
+                      "reutilizan pero el archivo no se reduce (vea "
+                      "enable-incremental-vacuum).")
+        elif args.command == "restore":
+            if not restore_product(db, args.sku):
+                if db.is_archived(args.sku):
+                    print(f"El SKU {args.sku} se volvió a dar de alta; la "
+                          f"versión archivada se conserva.", file=sys.stderr)
+                else:
+                    print(f"El SKU {args.sku} no está archivado.",
+                          file=sys.stderr)
+                return 1
+            print(f"SKU {args.sku} restaurado.")
+        elif args.command == "status":
+            archived = db.query("SELECT count(*) FROM ProductArchive")[0][0]
+            pages, free, page_size = page_stats(db)
+            print(f"Productos archivados: {archived}")
+            print(f"Páginas: {pages} de {page_size} bytes, libres: {free}, "
+                  f"incremental_vacuum: "
+                  f"{'sí' if incremental_vacuum_enabled(db) else 'no'}")
+        else:
+            enable_incremental_vacuum(db)
+            print("auto_vacuum = INCREMENTAL")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from database import DatabaseManager
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SQL_FILE = os.path.join(BASE_DIR, "sql.sql")
+DATA_DIR = os.path.join(BASE_DIR, "benchmarks", "data")
+BASELINE_FILE = os.path.join(BASE_DIR, "benchmarks", "baseline.json")
+
+DEFAULT_SCALES = (10_000, 100_000, 1_000_000)
+WORDS = (
+    "Licuadora", "Batidora", "Cafetera", "Sala", "Sofa", "Colchon", "Estereo",
+    "Amplificador", "Bocina", "Procesador", "Picadora", "Puf", "Baul",
+    "Taburete", "Sillon", "Esquinera", "Alarma", "Receptor"
+)
+# Los modelos sólo llevan letras, igual que lo que acepta la interfaz.
+MODEL_SUFFIXES = ("X", "S", "PRO", "MAX", "LITE", "PLUS")
+BRANDS = (
+    "Mabe", "Oster", "Sony", "Pioneer", "Kenwood", "Spring", "Sealy",
+    "Hamilton", "Taurus", "Moulinex", "Alpine", "Coppel"
+)
+
+
+def family_weights(catalog, skew=1.1):
+    # Las familias se ordenan como en sql.sql y reciben un peso tipo Zipf:
+    # pocas familias concentran la mayor parte de los SKU.
+    departments, classes, families = catalog.rows()
+    keys = sorted((d, c, f) for d, c, f, _ in families)
+    weights = [1 / (rank ** skew) for rank in range(1, len(keys) + 1)]
+    return keys, weights
+
+
+def generate_catalog(path, skus, seed=0, batch_size=10_000):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    with open(SQL_FILE, encoding="utf-8") as fh:
+        conn.executescript(fh.read())
+    conn.execute("DELETE FROM Product")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(path, profile="bulk", cache_size=0)
+    rng = random.Random(seed)
+    keys, weights = family_weights(db.catalog())
+    start = date(2015, 1, 1)
+
+    def rows():
+        for sku in range(1, skus + 1):
+            d, c, f = rng.choices(keys, weights)[0]
+            stock = rng.randint(0, 5000)
+            discontinued = 1 if rng.random() < 0.1 else 0
+            record_data = (start + timedelta(days=rng.randint(0, 3650)))
+            record_delete = (
+                (record_data + timedelta(days=rng.randint(1, 365))).isoformat()
+                if discontinued else "1900-01-01")
+            yield (
+                sku, rng.choice(WORDS), d, c, f, stock,
+                rng.randint(0, stock), record_delete,
+                rng.choice(WORDS)[:3].upper() + rng.choice(MODEL_SUFFIXES),
+                rng.choice(BRANDS), record_data.isoformat(), discontinued
+            )
+
+    query = """
+    INSERT INTO Product (
+        sku, description, id_department, id_class, id_family, stock,
+        quantity, record_delete, model, brand, record_data, discontinued
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    iterator = rows()
+    while True:
+        batch = [row for _, row in zip(range(batch_size), iterator)]
+        if not batch:
+            break
+        with db.transaction() as conn:
+            conn.executemany(query, batch)
+    db.query("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.execute("ANALYZE")
+    db.close()
+
+
+def catalog_path(skus, seed):
+    return os.path.join(DATA_DIR, f"catalog-{skus}-{seed}.db")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1,
+                max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "ops": len(latencies),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+    }
+
+
+def measure(operation, args_list):
+    latencies = []
+    clock = time.perf_counter
+    started = clock()
+    for args in args_list:
+        t = clock()
+        operation(*args)
+        latencies.append(clock() - t)
+    return summarize(latencies, clock() - started)
+
+
+def calibrate(rows=10_000, lookups=5_000, samples=15, seed=0):
+    # Consultas por segundo de una tabla fija de SQLite en memoria, sin
+    # código de ABCC: mide la máquina, no el programa. compare() escala la
+    # línea base con este valor para que siga sirviendo si la máquina es
+    # más rápida o más lenta que cuando se guardó. Se usa la mediana de
+    # varias muestras cortas; el máximo varía demasiado en una máquina
+    # virtual.
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany(
+        "INSERT INTO t VALUES (?, ?)", ((i, f"n{i}") for i in range(rows)))
+    rng = random.Random(seed)
+    ids = [rng.randrange(rows) for _ in range(lookups)]
+    rates = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        for i in ids:
+            conn.execute("SELECT name FROM t WHERE id = ?", (i,)).fetchone()
+        rates.append(lookups / (time.perf_counter() - started))
+    conn.close()
+    return round(statistics.median(rates), 1)
+
+
+def product_values(rng, sku, keys):
+    d, c, f = rng.choice(keys)
+    stock = rng.randint(1, 5000)
+    return (
+        sku, rng.choice(WORDS), d, c, f, stock, rng.randint(0, stock),
+        "1900-01-01", "BNCPRO", rng.choice(BRANDS),
+        date.today().isoformat(), 0
+    )
+
+
+def single_threaded(db, skus, ops, rng):
+    keys, _ = family_weights(db.catalog())
+    lookups = [(rng.randint(1, skus),) for _ in range(ops)]
+    new_skus = range(skus + 1, skus + 1 + ops)
+    updates = [product_values(rng, rng.randint(1, skus), keys)
+               for _ in range(ops)]
+
+    results = {
+        "get_product_by_sku": measure(db.get_product_by_sku, lookups),
+        "add_product": measure(
+            db.add_product, [product_values(rng, sku, keys)
+                             for sku in new_skus]),
+        "update_product": measure(db.update_product, updates),
+        "delete_product": measure(
+            db.delete_product, [(sku,) for sku in new_skus]),
+        # La consulta de la jerarquía, sin la copia del catálogo en disco
+        # que catalog(refresh=True) vuelve a escribir.
+        "generate_hierarchical_data": measure(
+            lambda: db.read_catalog().as_dicts(), [()] * min(ops, 200)),
+    }
+    return results
+
+
+def best_of(runs):
+    # De varias repeticiones, la de más operaciones por segundo de cada
+    # operación: las demás sólo añaden el ruido de la máquina.
+    return {
+        name: max((run[name] for run in runs),
+                  key=lambda result: result["ops_per_sec"])
+        for name in runs[0]
+    }
+
+
+def concurrent(db, skus, readers, duration, rng):
+    keys, _ = family_weights(db.catalog())
+    stop = threading.Event()
+    read_latencies = [[] for _ in range(readers)]
+    write_latencies = []
+
+    def reader(latencies, seed):
+        local_rng = random.Random(seed)
+        clock = time.perf_counter
+        while not stop.is_set():
+            sku = local_rng.randint(1, skus)
+            t = clock()
+            db.get_product_by_sku(sku)
+            latencies.append(clock() - t)
+        db.pool.release()
+
+    def writer(seed):
+        local_rng = random.Random(seed)
+        clock = time.perf_counter
+        while not stop.is_set():
+            values = product_values(local_rng, local_rng.randint(1, skus), keys)
+            t = clock()
+            db.update_product(*values)
+            write_latencies.append(clock() - t)
+        db.pool.release()
+
+    threads = [
+        threading.Thread(target=reader, args=(latencies, rng.random()))
+        for latencies in read_latencies
+    ]
+    threads.append(threading.Thread(target=writer, args=(rng.random(),)))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        f"concurrent_get_product_by_sku_{readers}r": summarize(
+            [value for latencies in read_latencies for value in latencies],
+            elapsed),
+        "concurrent_update_product_1w": summarize(write_latencies, elapsed),
+    }
+
+
+def run(scales, ops, readers, duration, seed, regenerate=False, repeat=3):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+            "ops": ops,
+            "readers": readers,
+            "duration": duration,
+            "repeat": repeat,
+            "calibration_ops_per_sec": calibrate(),
+        },
+        "results": {},
+    }
+
+    for skus in scales:
+        path = catalog_path(skus, seed)
+        if regenerate or not os.path.exists(path):
+            started = time.perf_counter()
+            generate_catalog(path, skus, seed)
+            print(f"Catálogo de {skus} SKU generado en "
+                  f"{time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+        rng = random.Random(seed)
+        # Sin caché de productos para medir la base de datos en sí.
+        db = DatabaseManager(path, cache_size=0)
+        try:
+            results = best_of([single_threaded(db, skus, ops, rng)
+                               for _ in range(repeat)])
+            results.update(concurrent(db, skus, readers, duration, rng))
+        finally:
+            db.close()
+        report["results"][str(skus)] = results
+
+    return report
+
+
+# Parámetros que deben coincidir para que dos reportes sean comparables.
+COMPARABLE_META = ("python", "sqlite", "seed", "ops", "readers", "duration",
+                   "repeat")
+
+
+def incomparable(report, baseline):
+    # Motivo por el que la línea base no sirve para este reporte, o None.
+    meta, base_meta = report["meta"], baseline.get("meta", {})
+    if not base_meta.get("calibration_ops_per_sec"):
+        return "la línea base no tiene calibración"
+    for key in COMPARABLE_META:
+        if meta.get(key) != base_meta.get(key):
+            return (f"{key} distinto ({base_meta.get(key)} en la línea base, "
+                    f"{meta.get(key)} ahora)")
+    return None
+
+
+def compare(report, baseline, tolerance, p95_tolerance, min_delta_ms):
+    # Regresión: menos operaciones por segundo que la línea base por más de
+    # `tolerance`, o un p95 mayor por más de `p95_tolerance` y de
+    # `min_delta_ms`. La línea base se escala por la razón entre las
+    # calibraciones de ambas corridas. El p95 de las escrituras depende de
+    # cuándo caen los checkpoints del WAL y el de las lecturas son
+    # centésimas de milisegundo; sólo un salto grande, relativo y absoluto,
+    # es una señal.
+    speed = (report["meta"]["calibration_ops_per_sec"]
+             / baseline["meta"]["calibration_ops_per_sec"])
+    regressions = []
+    for scale, results in report["results"].items():
+        base_results = baseline.get("results", {}).get(scale)
+        if base_results is None:
+            continue
+        for name, result in results.items():
+            base = base_results.get(name)
+            if base is None:
+                continue
+            expected = round(base["ops_per_sec"] * speed, 1)
+            if result["ops_per_sec"] < expected * (1 - tolerance):
+                regressions.append(
+                    (scale, name, "ops_per_sec", expected,
+                     result["ops_per_sec"]))
+            expected = round(base["p95_ms"] / speed, 4)
+            if result["p95_ms"] > expected * (1 + p95_tolerance) \
+                    and result["p95_ms"] - expected > min_delta_ms:
+                regressions.append(
+                    (scale, name, "p95_ms", expected, result["p95_ms"]))
+    return regressions
+
+
+def print_report(report):
+    print(f"{'escala':>9} {'operación':<38} {'ops/s':>11} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for scale, results in report["results"].items():
+        for name, r in results.items():
+            print(f"{scale:>9} {name:<38} {r['ops_per_sec']:>11,.1f} "
+                  f"{r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mide el rendimiento de DatabaseManager sobre catálogos "
+                    "sintéticos.")
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=list(DEFAULT_SCALES))
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument(
+        "--duration", type=float, default=3.0,
+        help="Segundos de la prueba concurrente.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--output", help="Archivo JSON con los resultados.")
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="Repeticiones de las pruebas de un hilo; se conserva la mejor.")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.4,
+        help="Caída de ops/s tolerada, como fracción.")
+    parser.add_argument(
+        "--p95-tolerance", type=float, default=1.0,
+        help="Aumento del p95 tolerado, como fracción.")
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=2.0,
+        help="Aumento mínimo del p95, en ms, para contarlo como regresión.")
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help="Guarda los resultados como nueva línea base.")
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.scales, args.ops, args.readers, args.duration, args.seed,
+        args.regenerate, args.repeat)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Sin línea base para comparar.", file=sys.stderr)
+        return 0
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+
+    reason = incomparable(report, baseline)
+    if reason:
+        print(f"No se compara con la línea base: {reason}. Guarde una nueva "
+              f"en esta máquina con --save-baseline.", file=sys.stderr)
+        return 0
+    regressions = compare(
+        report, baseline, args.tolerance, args.p95_tolerance,
+        args.min_delta_ms)
+    for scale, name, metric, before, after in regressions:
+        print(f"REGRESIÓN {scale} {name} {metric}: {before} -> {after}",
+              file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+import logging
+import tkinter as tk
+from tkinter import ttk
+
+from database import (
+    BROWSE_COLUMNS, BROWSE_SORTS, PRODUCT_RECORD_FIELDS, browse_key
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Filas por consulta y filas que se conservan en el Treeview. Al pasar del
+# máximo se reutilizan las del extremo opuesto al desplazamiento. Para que
+# las cargas de un lado no provoquen las del otro, WINDOW_ROWS debe ser
+# mayor que 2 * PREFETCH_ROWS + PAGE_SIZE más las filas visibles.
+PAGE_SIZE = 100
+WINDOW_ROWS = 500
+# Se pide la página siguiente (o la anterior) cuando quedan menos de estas
+# filas cargadas fuera de la vista.
+PREFETCH_ROWS = 150
+COUNT_CAP = 10000
+
+HEADINGS = {
+    "sku": "SKU",
+    "description": "Artículo",
+    "brand": "Marca",
+    "model": "Modelo",
+    "stock": "Stock",
+    "quantity": "Cantidad",
+    "record_data": "Fecha de Registro",
+}
+WIDTHS = {
+    "sku": 70, "description": 130, "brand": 110, "model": 140,
+    "stock": 80, "quantity": 80, "record_data": 110,
+}
+
+
+class ProductBrowser:
+    def __init__(self, parent, db_worker, db_manager, on_select=None, height=12):
+        # Lista de productos paginada por llave: sólo se mantienen cargadas
+        # WINDOW_ROWS filas alrededor de la vista y las páginas se leen en
+        # el DatabaseWorker antes de que el usuario llegue al borde.
+        self.db_worker = db_worker
+        self.db_manager = db_manager
+        self.on_select = on_select
+        self.sort = "sku"
+        self.descending = False
+        self.filters = {}
+
+        # Cada recarga invalida las páginas que todavía vienen en camino.
+        self._generation = 0
+        self._items = []
+        self._keys = {}
+        self._has_before = False
+        self._has_after = False
+        self._loading = set()
+
+        self.frame = tk.Frame(parent)
+        self.tree = ttk.Treeview(
+            self.frame, columns=BROWSE_COLUMNS, show="headings",
+            height=height, selectmode="browse")
+        for column in BROWSE_COLUMNS:
+            if column in BROWSE_SORTS:
+                self.tree.heading(
+                    column, text=HEADINGS[column],
+                    command=lambda column=column: self.sort_by(column))
+            else:
+                self.tree.heading(column, text=HEADINGS[column])
+            self.tree.column(
+                column, width=WIDTHS[column],
+                anchor="e" if column in ("sku", "stock", "quantity") else "w")
+        self.scrollbar = ttk.Scrollbar(
+            self.frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.bind("<<TreeviewSelect>>", self.select_row)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.status_lbl = tk.Label(self.frame, text="", anchor="w")
+        self.status_lbl.grid(row=1, column=0, columnspan=2, sticky="w")
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(0, weight=1)
+
+    def grid(self, **options):
+        self.frame.grid(**options)
+
+    def set_filters(self, **filters):
+        filters = {k: v for k, v in filters.items() if v is not None}
+        if filters != self.filters:
+            self.filters = filters
+            self.reload()
+
+    def sort_by(self, column):
+        if column == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = column, False
+        for name in BROWSE_SORTS:
+            arrow = ""
+            if name == self.sort:
+                arrow = " ▼" if self.descending else " ▲"
+            self.tree.heading(name, text=HEADINGS[name] + arrow)
+        self.reload()
+
+    def reload(self):
+        self._generation += 1
+        self.db_worker.cancel("browse-after")
+        self.db_worker.cancel("browse-before")
+        self._loading.clear()
+        self.tree.delete(*self._items)
+        self._items = []
+        self._keys = {}
+        self._has_before = False
+        self._has_after = True
+        self.load(backward=False)
+
+        generation, filters = self._generation, dict(self.filters)
+        self.status_lbl.config(text="")
+        self.db_worker.submit(
+            lambda: self.db_manager.count_products(COUNT_CAP, **filters),
+            key="browse-count", busy=False,
+            on_done=lambda count: self.show_count(generation, count),
+            on_error=lambda error: logger.warning(
+                "No se pudieron contar los productos: %s", error))
+
+    def show_count(self, generation, count):
+        if generation != self._generation:
+            return
+        count, exact = count
+        self.status_lbl.config(
+            text=f"{count} productos" if exact else f"Más de {count} productos")
+
+    def load(self, backward):
+        direction = "before" if backward else "after"
+        if direction in self._loading:
+            return
+        self._loading.add(direction)
+
+        key = None
+        if self._items:
+            key = self._keys[self._items[0] if backward else self._items[-1]]
+        generation = self._generation
+        sort, descending, filters = self.sort, self.descending, dict(self.filters)
+        self.db_worker.submit(
+            lambda: self.db_manager.browse_products(
+                key, PAGE_SIZE, sort, descending, backward, **filters),
+            key=f"browse-{direction}", busy=False,
+            on_done=lambda rows: self.page_loaded(generation, backward, rows),
+            on_error=lambda error: self.page_failed(generation, direction, error))
+
+    def page_failed(self, generation, direction, error):
+        if generation == self._generation:
+            self._loading.discard(direction)
+        logger.warning("No se pudo cargar la lista de productos: %s", error)
+
+    def page_loaded(self, generation, backward, rows):
+        if generation != self._generation:
+            return
+        if backward:
+            self._loading.discard("before")
+            self._has_before = len(rows) == PAGE_SIZE
+            self.prepend(rows)
+        else:
+            self._loading.discard("after")
+            self._has_after = len(rows) == PAGE_SIZE
+            self.append(rows)
+
+    def _first_visible(self):
+        return round(self.tree.yview()[0] * len(self._items))
+
+    def _show(self, iid, row):
+        self._keys[iid] = browse_key(row, self.sort)
+        return tuple("" if value is None else value for value in row)
+
+    def _recycle(self, iids):
+        # Las filas que salen de la ventana se reutilizan para la página
+        # nueva en lugar de borrarlas y crear otras.
+        selected = set(self.tree.selection())
+        if selected.intersection(iids):
+            self.tree.selection_remove(*selected.intersection(iids))
+        for iid in iids:
+            del self._keys[iid]
+        return list(iids)
+
+    def append(self, rows):
+        if not rows:
+            return
+        first = self._first_visible()
+        excess = max(len(self._items) + len(rows) - WINDOW_ROWS, 0)
+        reuse = self._recycle(self._items[:excess])
+        self._items = self._items[excess:]
+        for row in rows:
+            if reuse:
+                iid = reuse.pop()
+                self.tree.item(iid, values=self._show(iid, row))
+                self.tree.move(iid, "", "end")
+            else:
+                iid = self.tree.insert("", "end")
+                self.tree.item(iid, values=self._show(iid, row))
+            self._items.append(iid)
+        if excess:
+            self._has_before = True
+            self.tree.yview_moveto((first - excess) / len(self._items))
+
+    def prepend(self, rows):
+        if not rows:
+            return
+        first = self._first_visible()
+        excess = max(len(self._items) + len(rows) - WINDOW_ROWS, 0)
+        reuse = self._recycle(self._items[len(self._items) - excess:])
+        self._items = self._items[:len(self._items) - excess]
+        new_items = []
+        for index, row in enumerate(rows):
+            if reuse:
+                iid = reuse.pop()
+                self.tree.move(iid, "", index)
+            else:
+                iid = self.tree.insert("", index)
+            self.tree.item(iid, values=self._show(iid, row))
+            new_items.append(iid)
+        self._items = new_items + self._items
+        if excess:
+            self._has_after = True
+        self.tree.yview_moveto((first + len(rows)) / len(self._items))
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        loaded = len(self._items)
+        if not loaded:
+            return
+        if self._has_after and loaded - float(last) * loaded < PREFETCH_ROWS:
+            self.load(backward=False)
+        if self._has_before and float(first) * loaded < PREFETCH_ROWS:
+            self.load(backward=True)
+
+    def select_row(self, event=None):
+        selection = self.tree.selection()
+        if selection and self.on_select is not None:
+            self.on_select(self._keys[selection[0]][1])
+
+    def _find(self, sku):
+        for iid in self._items:
+            if self._keys[iid][1] == sku:
+                return iid
+        return None
+
+    def update_product(self, product):
+        # Refleja en la lista un producto guardado (una fila completa de
+        # get_product_by_sku) si está cargado; no cambia su posición.
+        record = dict(zip(PRODUCT_RECORD_FIELDS, product))
+        iid = self._find(record["sku"])
+        if iid is not None:
+            row = tuple(record[column] for column in BROWSE_COLUMNS)
+            self.tree.item(iid, values=self._show(iid, row))
+
+    def remove_product(self, sku):
+        iid = self._find(int(sku))
+        if iid is not None:
+            self._items.remove(iid)
+            del self._keys[iid]
+            self.tree.delete(iid)
@@ -0,0 +1,573 @@
+import argparse
+import csv
+import heapq
+import json
+import os
+import re
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from itertools import chain, islice
+
+from database import ProductArchived, ProductNotFound, product_filters
+from rules import (
+    PRODUCT_FIELDS, ValidationError, check_products, columns_from_records
+)
+from shards import ShardedDatabaseManager, open_database
+
+
+IMPORT_MODES = ("insert", "upsert", "replace")
+
+_COLUMNS = ", ".join(PRODUCT_FIELDS)
+_PLACEHOLDERS = ", ".join("?" for _ in PRODUCT_FIELDS)
+# En un upsert se conserva la fecha de alta del producto existente.
+_UPSERT_SET = ", ".join(
+    [f"{field} = excluded.{field}" for field in PRODUCT_FIELDS
+     if field not in ("sku", "record_data")]
+    + ["row_version = row_version + 1"]
+)
+# replace sobrescribe la fila completa con un UPDATE en lugar de
+# INSERT OR REPLACE, para que los triggers de Product vean el cambio.
+_REPLACE_SET = ", ".join(
+    [f"{field} = excluded.{field}" for field in PRODUCT_FIELDS
+     if field != "sku"]
+    + ["row_version = row_version + 1"]
+)
+
+IMPORT_QUERIES = {
+    "insert": f"""
+        INSERT INTO Product ({_COLUMNS}) VALUES ({_PLACEHOLDERS})
+        ON CONFLICT (sku) DO NOTHING
+    """,
+    "upsert": f"""
+        INSERT INTO Product ({_COLUMNS}) VALUES ({_PLACEHOLDERS})
+        ON CONFLICT (sku) DO UPDATE SET {_UPSERT_SET}
+    """,
+    "replace": f"""
+        INSERT INTO Product ({_COLUMNS}) VALUES ({_PLACEHOLDERS})
+        ON CONFLICT (sku) DO UPDATE SET {_REPLACE_SET}
+    """,
+}
+
+
+EXPORT_FORMATS = ("csv", "jsonl", "columnar")
+EXPORT_COLUMNS = (
+    "sku", "description", "brand", "model", "id_department",
+    "department_name", "id_class", "class_name", "id_family", "family_name",
+    "stock", "quantity", "discontinued", "record_data", "record_delete"
+)
+
+EXPORT_QUERY = """
+    SELECT p.sku, p.description, p.brand, p.model,
+        p.id_department, d.name, p.id_class, c.name, p.id_family, f.name,
+        p.stock, p.quantity, p.discontinued, p.record_data, p.record_delete
+    FROM Product p
+    LEFT JOIN Department d ON p.id_department = d.id
+    LEFT JOIN Class c ON p.id_class = c.id AND p.id_department = c.id_department
+    LEFT JOIN Family f ON p.id_family = f.id AND p.id_class = f.id_class
+    AND p.id_department = f.id_department
+    WHERE p.sku > ? {filters}
+    ORDER BY p.sku
+    LIMIT ?
+"""
+
+
+class ImportReport:
+    def __init__(self, on_reject=None, max_samples=100):
+        self.on_reject = on_reject
+        self.read = 0
+        self.written = 0
+        self.rejected = 0
+        self.samples = []
+        self.max_samples = max_samples
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line_no, field, message):
+        self.rejected += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append((line_no, field, message))
+        if self.on_reject is not None:
+            self.on_reject(line_no, field, message)
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (
+            f"Leídos {self.read}, escritos {self.written}, "
+            f"rechazados {self.rejected} en {self.elapsed:.2f} s "
+            f"({self.rows_per_second:,.0f} filas/s)"
+        )
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    return "jsonl" if extension in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+def read_records(path, fmt=None):
+    # Genera (línea, registro, error) sin cargar el archivo en memoria.
+    fmt = fmt or detect_format(path)
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            reader = csv.DictReader(fh)
+            for record in reader:
+                yield reader.line_num, record, None
+        else:
+            for line_no, line in enumerate(fh, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_no, None, f"JSON inválido: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield line_no, None, "se esperaba un objeto JSON"
+                    continue
+                yield line_no, record, None
+
+
+def validate_records(records, catalog, report, batch_size=1000):
+    # Valida por lotes con check_products(). Genera (línea, valores) de los
+    # registros válidos; los rechazos se reportan en orden de línea.
+    today = datetime.now().strftime("%Y-%m-%d")
+    for batch in batched(records, batch_size):
+        report.read += len(batch)
+        rejects = [(line_no, "", error)
+                   for line_no, _, error in batch if error]
+        lines = [line_no for line_no, _, error in batch if not error]
+        checked = check_products(
+            columns_from_records(
+                [record for _, record, error in batch if not error]),
+            catalog, today)
+        for row in checked.invalid_rows():
+            rejects.extend(
+                (lines[row], field, message)
+                for field, message in checked.errors(row))
+        for reject in sorted(rejects, key=lambda reject: reject[0]):
+            report.reject(*reject)
+        for row, values in checked.valid_values():
+            yield lines[row], values
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _existing_skus(conn, skus):
+    placeholders = ", ".join("?" for _ in skus)
+    rows = conn.execute(
+        f"SELECT sku FROM Product WHERE sku IN ({placeholders})", skus)
+    return {sku for sku, in rows}
+
+
+def import_products(
+    db, path, mode="upsert", fmt=None, batch_size=1000, commit_every=50000,
+    on_reject=None
+):
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"mode must be one of {IMPORT_MODES}")
+
+    report = ImportReport(on_reject)
+    rows = validate_records(
+        read_records(path, fmt), db.catalog(), report, batch_size)
+    batches_per_transaction = max(1, commit_every // batch_size)
+    chunks = batched(batched(rows, batch_size), batches_per_transaction)
+
+    if isinstance(db, ShardedDatabaseManager):
+        _import_sharded(db, chunks, mode, report)
+    else:
+        _import_file(db, chunks, mode, report)
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def _import_file(db, chunks, mode, report):
+    query = IMPORT_QUERIES[mode]
+    for chunk in chunks:
+        with db.transaction() as conn:
+            for batch in chunk:
+                # Un SKU archivado se restaura con archive.py restore;
+                # cargarlo otra vez dejaría dos versiones. En insert, los
+                # SKU existentes se reportan en lugar de ignorarse.
+                skus = [values[0] for _, values in batch]
+                archived = db.archived_skus(skus)
+                existing = _existing_skus(conn, skus) \
+                    if mode == "insert" else set()
+                seen = set()
+                accepted = []
+                for line_no, values in batch:
+                    if values[0] in archived:
+                        report.reject(
+                            line_no, "sku", str(ProductArchived(values[0])))
+                    elif values[0] in existing or values[0] in seen:
+                        report.reject(line_no, "sku", "el SKU ya existe")
+                    else:
+                        if mode == "insert":
+                            seen.add(values[0])
+                        accepted.append((line_no, values))
+                batch = accepted
+                # rowcount no incluye las filas que modifican los triggers.
+                cursor = conn.executemany(
+                    query, [values for _, values in batch])
+                report.written += max(cursor.rowcount, 0)
+
+    db.product_cache.clear()
+    # Una carga grande deja una entrada de SkuLog por SKU nuevo.
+    db.prune_sku_log()
+
+
+def _import_sharded(db, chunks, mode, report):
+    # Cada fila se escribe en el archivo de su departamento, con una
+    # transacción por archivo y bloque. El SKU es único entre todos los
+    # archivos: su ubicación se busca en el índice de SKU de cada shard.
+    # Un upsert o replace que cambia el departamento de un SKU existente
+    # pasa por update_product(), que mueve la fila de un archivo a otro.
+    query = IMPORT_QUERIES[mode]
+    kept = ("sku", "record_data") if mode == "upsert" else ("sku",)
+    for chunk in chunks:
+        db.refresh_sku_index()
+        groups = {}
+        moves = []
+        located = {}
+        moving = set()
+        archived = set().union(*(
+            db.archived_skus(values[0] for _, values in batch)
+            for batch in chunk))
+        for line_no, values in chain.from_iterable(chunk):
+            sku, dept = values[0], values[2]
+            if sku in archived:
+                report.reject(line_no, "sku", str(ProductArchived(sku)))
+                continue
+            if dept not in db.shards:
+                report.reject(line_no, "id_department",
+                              "el departamento no tiene archivo de productos")
+                continue
+            if sku not in located:
+                located[sku] = db.shard_for(sku)
+            if mode == "insert" and located[sku] is not None:
+                report.reject(line_no, "sku", "el SKU ya existe")
+                continue
+            if sku in moving or located[sku] not in (None, dept):
+                # Después de las filas anteriores del mismo SKU.
+                moving.add(sku)
+                moves.append((line_no, values))
+                continue
+            located[sku] = dept
+            groups.setdefault(dept, []).append(values)
+
+        for dept, rows in sorted(groups.items()):
+            with db.shards[dept].transaction() as conn:
+                # rowcount no incluye las filas que modifican los triggers.
+                cursor = conn.executemany(query, rows)
+                report.written += max(cursor.rowcount, 0)
+        db.refresh_sku_index()
+        for line_no, values in moves:
+            changes = {field: value for field, value
+                       in zip(PRODUCT_FIELDS, values) if field not in kept}
+            try:
+                report.written += db.update_product(values[0], **changes)
+            except ValidationError as e:
+                for field, message in e.errors:
+                    report.reject(line_no, field, message)
+            except ProductNotFound as e:
+                report.reject(line_no, "sku", str(e))
+
+    for manager in db.shards.values():
+        manager.product_cache.clear()
+        manager.prune_sku_log()
+    db.refresh_sku_index()
+
+
+def _signed_int(value):
+    value = "" if value is None else str(value).strip()
+    return int(value) if re.fullmatch(r"[+-]?\d{1,9}", value) else None
+
+
+def read_movements(records, report):
+    # Registros con sku, delta_stock y delta_quantity (opcional, 0 por
+    # omisión). Genera (sku, delta_stock, delta_quantity, línea).
+    for line_no, record, error in records:
+        report.read += 1
+        if error:
+            report.reject(line_no, "", error)
+            continue
+        sku = _signed_int(record.get("sku"))
+        delta_stock = _signed_int(record.get("delta_stock"))
+        delta_quantity = _signed_int(record.get("delta_quantity") or 0)
+        if sku is None or sku < 0:
+            report.reject(line_no, "sku", "se espera un SKU numérico")
+        elif delta_stock is None:
+            report.reject(line_no, "delta_stock", "se espera un entero")
+        elif delta_quantity is None:
+            report.reject(line_no, "delta_quantity", "se espera un entero")
+        else:
+            yield sku, delta_stock, delta_quantity, line_no
+
+
+def apply_movements(db, path, fmt=None, batch_size=1000, on_reject=None):
+    report = ImportReport(on_reject)
+    movements = read_movements(read_records(path, fmt), report)
+    report.written, _ = db.apply_movements(
+        movements, batch_size,
+        on_reject=lambda movement, field, message: report.reject(
+            movement[3], field, message))
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def product_files(db, id_department=None):
+    # Los DatabaseManager con productos: el archivo único o los shards (sólo
+    # el del departamento, si se filtra por uno).
+    if not isinstance(db, ShardedDatabaseManager):
+        return [db]
+    if id_department is not None:
+        return [db.shard(id_department)]
+    return list(db.shards.values())
+
+
+def iter_product_pages(db, page_size=1000, **filters):
+    # Con shards, las páginas de cada archivo se mezclan en orden de SKU.
+    files = product_files(db, filters.get("id_department"))
+    if len(files) == 1:
+        return _iter_file_pages(files[0], page_size, **filters)
+    rows = heapq.merge(
+        *(chain.from_iterable(_iter_file_pages(manager, page_size, **filters))
+          for manager in files),
+        key=lambda row: row[0])
+    return batched(rows, page_size)
+
+
+def _iter_file_pages(db, page_size=1000, **filters):
+    # Paginación por llave: cada página continúa desde el último SKU leído,
+    # así que el costo por página no crece con el tamaño del catálogo.
+    conditions, params = product_filters(**filters)
+    query = EXPORT_QUERY.format(filters=conditions)
+    last_sku = -1
+    while True:
+        page = list(db.iter_query(
+            query, (last_sku, *params, page_size), size=page_size))
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_sku = page[-1][0]
+
+
+def write_csv(pages, fh):
+    writer = csv.writer(fh)
+    writer.writerow(EXPORT_COLUMNS)
+    for page in pages:
+        writer.writerows(page)
+
+
+def write_jsonl(pages, fh):
+    for page in pages:
+        fh.writelines(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False)
+            + "\n" for row in page)
+
+
+def write_columnar(pages, fh):
+    # Un bloque por línea con los valores agrupados por columna.
+    fh.write(json.dumps({"columns": EXPORT_COLUMNS}) + "\n")
+    for page in pages:
+        fh.write(json.dumps(
+            [list(column) for column in zip(*page)],
+            ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+EXPORT_WRITERS = {
+    "csv": write_csv,
+    "jsonl": write_jsonl,
+    "columnar": write_columnar,
+}
+
+
+def export_products(
+    db, fh, fmt="csv", page_size=1000, snapshot=False, **filters
+):
+    started = time.perf_counter()
+    exported = 0
+
+    def counted(pages):
+        nonlocal exported
+        for page in pages:
+            exported += len(page)
+            yield page
+
+    pages = counted(iter_product_pages(db, page_size, **filters))
+    if snapshot:
+        # Una sola transacción de lectura: en modo WAL la exportación ve una
+        # foto fija de la base sin bloquear a quienes escriben. Con shards,
+        # cada archivo es una foto fija por separado.
+        with ExitStack() as stack:
+            for manager in product_files(db, filters.get("id_department")):
+                stack.enter_context(manager.transaction("DEFERRED"))
+            EXPORT_WRITERS[fmt](pages, fh)
+    else:
+        EXPORT_WRITERS[fmt](pages, fh)
+
+    return exported, time.perf_counter() - started
+
+
+def _import_command(args):
+    db = open_database(args.db, profile="bulk")
+    rejects_file = open(args.rejects, "w", newline="", encoding="utf-8") \
+        if args.rejects else sys.stderr
+    writer = csv.writer(rejects_file)
+    writer.writerow(("linea", "campo", "motivo"))
+
+    try:
+        report = import_products(
+            db, args.file, mode=args.mode, fmt=args.format,
+            batch_size=args.batch_size, commit_every=args.commit_every,
+            on_reject=lambda *reject: writer.writerow(reject)
+        )
+    finally:
+        if rejects_file is not sys.stderr:
+            rejects_file.close()
+        db.close()
+
+    print(report.summary())
+    return 0 if report.rejected == 0 else 1
+
+
+def _move_command(args):
+    db = open_database(args.db, profile="bulk")
+    rejects_file = open(args.rejects, "w", newline="", encoding="utf-8") \
+        if args.rejects else sys.stderr
+    writer = csv.writer(rejects_file)
+    writer.writerow(("linea", "campo", "motivo"))
+
+    try:
+        report = apply_movements(
+            db, args.file, fmt=args.format, batch_size=args.batch_size,
+            on_reject=lambda *reject: writer.writerow(reject))
+    finally:
+        if rejects_file is not sys.stderr:
+            rejects_file.close()
+        db.close()
+
+    print(report.summary())
+    return 0 if report.rejected == 0 else 1
+
+
+def _export_command(args):
+    db = open_database(args.db, profile="readonly", bootstrap=False)
+    fmt = args.format or detect_format(args.file)
+    fh = sys.stdout if args.file == "-" else \
+        open(args.file, "w", newline="", encoding="utf-8")
+
+    try:
+        exported, elapsed = export_products(
+            db, fh, fmt=fmt, page_size=args.page_size, snapshot=args.snapshot,
+            id_department=args.department, id_class=args.class_id,
+            id_family=args.family, discontinued=args.discontinued,
+            since=args.since, until=args.until
+        )
+    finally:
+        if fh is not sys.stdout:
+            fh.close()
+        db.close()
+
+    rate = exported / elapsed if elapsed else 0.0
+    print(
+        f"Exportados {exported} en {elapsed:.2f} s ({rate:,.0f} filas/s)",
+        file=sys.stderr)
+    return 0
+
+
+def _skus_command(args):
+    db = open_database(args.db)
+    try:
+        index = db.sku_index()
+        print(f"SKU ocupados: {index.count} de {index.size}")
+        next_free = db.next_free_sku(args.next_free)
+        print(f"Siguiente SKU libre desde {args.next_free}: "
+              f"{'ninguno' if next_free is None else next_free}")
+        if args.range:
+            low, high = args.range
+            used = db.sku_occupancy(low, high)
+            size = max(high - low + 1, 0)
+            print(f"Rango {low}-{high}: {used} ocupados, {size - used} libres")
+    finally:
+        db.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Carga y descarga masiva de productos.")
+    parser.add_argument("--db", default="data.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser(
+        "import", help="Importa productos desde CSV o JSONL.")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"))
+    import_parser.add_argument(
+        "--mode", choices=IMPORT_MODES, default="upsert")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    import_parser.add_argument("--commit-every", type=int, default=50000)
+    import_parser.add_argument(
+        "--rejects", help="Archivo CSV para los rechazos (stderr por omisión).")
+    import_parser.set_defaults(func=_import_command)
+
+    move_parser = subparsers.add_parser(
+        "move",
+        help="Aplica movimientos de inventario (sku, delta_stock, "
+             "delta_quantity) desde CSV o JSONL.")
+    move_parser.add_argument("file")
+    move_parser.add_argument("--format", choices=("csv", "jsonl"))
+    move_parser.add_argument("--batch-size", type=int, default=1000)
+    move_parser.add_argument(
+        "--rejects", help="Archivo CSV para los rechazos (stderr por omisión).")
+    move_parser.set_defaults(func=_move_command)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Exporta productos a CSV, JSONL o formato columnar.")
+    export_parser.add_argument("file", help="Archivo de salida o - para stdout.")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS)
+    export_parser.add_argument("--page-size", type=int, default=1000)
+    export_parser.add_argument("--department", type=int)
+    export_parser.add_argument("--class", dest="class_id", type=int)
+    export_parser.add_argument("--family", type=int)
+    export_parser.add_argument("--discontinued", type=int, choices=(0, 1))
+    export_parser.add_argument("--since", help="Fecha de alta mínima.")
+    export_parser.add_argument("--until", help="Fecha de alta máxima.")
+    export_parser.add_argument(
+        "--snapshot", action="store_true",
+        help="Exporta una foto consistente sin bloquear escrituras.")
+    export_parser.set_defaults(func=_export_command)
+
+    skus_parser = subparsers.add_parser(
+        "skus", help="Ocupación del espacio de SKU y siguiente SKU libre.")
+    skus_parser.add_argument(
+        "--next-free", type=int, default=1, metavar="DESDE",
+        help="Busca el primer SKU libre a partir de este valor.")
+    skus_parser.add_argument(
+        "--range", type=int, nargs=2, metavar=("DESDE", "HASTA"),
+        help="Cuenta los SKU ocupados en el rango cerrado.")
+    skus_parser.set_defaults(func=_skus_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import json
+import os
+from types import MappingProxyType
+
+
+CATALOG_TABLES = ("Department", "Class", "Family")
+
+
+class Catalog:
+    __slots__ = (
+        "versions", "_departments", "_department_ids", "_classes",
+        "_class_ids", "_families", "_family_ids"
+    )
+
+    def __init__(self, departments, classes, families, versions=None):
+        # departments: [(id, name)]
+        # classes: [(id_department, id, name)]
+        # families: [(id_department, id_class, id, name)]
+        department_names = {}
+        class_names = {}
+        family_names = {}
+
+        for dept_id, name in sorted(departments):
+            department_names[dept_id] = name
+        for dept_id, class_id, name in sorted(classes):
+            class_names.setdefault(dept_id, {})[class_id] = name
+        for dept_id, class_id, family_id, name in sorted(families):
+            family_names.setdefault(
+                (dept_id, class_id), {})[family_id] = name
+
+        self.versions = MappingProxyType(dict(versions or {}))
+        self._departments = MappingProxyType(department_names)
+        self._department_ids = MappingProxyType(
+            {name: dept_id for dept_id, name in department_names.items()})
+        self._classes = MappingProxyType(
+            {key: MappingProxyType(value)
+             for key, value in class_names.items()})
+        self._class_ids = MappingProxyType(
+            {key: MappingProxyType({name: i for i, name in value.items()})
+             for key, value in class_names.items()})
+        self._families = MappingProxyType(
+            {key: MappingProxyType(value)
+             for key, value in family_names.items()})
+        self._family_ids = MappingProxyType(
+            {key: MappingProxyType({name: i for i, name in value.items()})
+             for key, value in family_names.items()})
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_family_ids"):
+            raise AttributeError("Catalog is immutable")
+        object.__setattr__(self, name, value)
+
+    # Departamentos
+    def department_names(self):
+        return list(self._departments.values())
+
+    def department_name(self, dept_id):
+        return self._departments.get(dept_id)
+
+    def department_id(self, name):
+        return self._department_ids.get(name)
+
+    # Clases
+    def class_names(self, dept_id):
+        return list(self._classes.get(dept_id, {}).values())
+
+    def class_name(self, dept_id, class_id):
+        return self._classes.get(dept_id, {}).get(class_id)
+
+    def class_id(self, dept_id, name):
+        return self._class_ids.get(dept_id, {}).get(name)
+
+    # Familias
+    def family_names(self, dept_id, class_id):
+        return list(self._families.get((dept_id, class_id), {}).values())
+
+    def family_name(self, dept_id, class_id, family_id):
+        return self._families.get((dept_id, class_id), {}).get(family_id)
+
+    def family_id(self, dept_id, class_id, name):
+        return self._family_ids.get((dept_id, class_id), {}).get(name)
+
+    def contains(self, dept_id, class_id=None, family_id=None):
+        if dept_id not in self._departments:
+            return False
+        if class_id is None:
+            return True
+        if class_id not in self._classes.get(dept_id, {}):
+            return False
+        if family_id is None:
+            return True
+        return family_id in self._families.get((dept_id, class_id), {})
+
+    def rows(self):
+        departments = list(self._departments.items())
+        classes = [
+            (dept_id, class_id, name)
+            for dept_id, names in self._classes.items()
+            for class_id, name in names.items()
+        ]
+        families = [
+            (dept_id, class_id, family_id, name)
+            for (dept_id, class_id), names in self._families.items()
+            for family_id, name in names.items()
+        ]
+        return departments, classes, families
+
+    def replace(self, versions, departments=None, classes=None, families=None):
+        # Devuelve un catálogo nuevo sustituyendo sólo las tablas indicadas.
+        current = self.rows()
+        return Catalog(
+            current[0] if departments is None else departments,
+            current[1] if classes is None else classes,
+            current[2] if families is None else families,
+            versions
+        )
+
+    def as_dicts(self):
+        # Formato histórico de generate_hierarchical_data().
+        department_dict = dict(self._department_ids)
+        class_dict = {
+            dept_id: dict(self._class_ids.get(dept_id, {}))
+            for dept_id in self._departments
+        }
+        family_dict = {key: dict(value)
+                       for key, value in self._family_ids.items()}
+        return department_dict, class_dict, family_dict
+
+
+def cache_path(db_file):
+    if db_file == ":memory:" or str(db_file).startswith("file:"):
+        return None
+    return f"{db_file}.catalog.json"
+
+
+def load_cached(path):
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return Catalog(
+            [tuple(row) for row in data["departments"]],
+            [tuple(row) for row in data["classes"]],
+            [tuple(row) for row in data["families"]],
+            data["versions"]
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_cached(path, catalog):
+    if path is None:
+        return
+    departments, classes, families = catalog.rows()
+    data = {
+        "versions": dict(catalog.versions),
+        "departments": departments,
+        "classes": classes,
+        "families": families,
+    }
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
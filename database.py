@@ -0,0 +1,1214 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from cache import ProductCache
+from catalog import CATALOG_TABLES, Catalog, cache_path, load_cached, save_cached
+from procedures import STATEMENT_CACHE_SIZE, load_procedures
+from rules import STOCK_DIGITS, ValidationError
+from skuindex import SkuIndex
+
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+
+# Perfiles de PRAGMA aplicados a cada conexión nueva del pool.
+PRAGMA_PROFILES = {
+    "default": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -8000,
+        "mmap_size": 64 * 1024 * 1024,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8000,
+        "mmap_size": 0,
+        "busy_timeout": 10000,
+    },
+    "bulk": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "busy_timeout": 30000,
+        "temp_store": "MEMORY",
+    },
+    "readonly": {
+        "query_only": "ON",
+        "cache_size": -8000,
+        "mmap_size": 64 * 1024 * 1024,
+        "busy_timeout": 5000,
+    },
+}
+
+
+# Entradas de SkuLog que se conservan al podarla. Un índice de SKU que se
+# quedó más atrás se vuelve a cargar completo.
+SKU_LOG_KEEP = 100_000
+
+
+def load_migrations(path=SCHEMA_FILE):
+    with open(path, encoding="utf-8") as fh:
+        text = fh.read()
+    parts = re.split(r"^-- migration: (\d+)[ \t]*$", text, flags=re.MULTILINE)
+    return [
+        (int(parts[i]), split_statements(parts[i + 1]))
+        for i in range(1, len(parts), 2)
+    ]
+
+
+def split_statements(script):
+    statements = []
+    buffer = ""
+    for line in script.splitlines(keepends=True):
+        if not buffer and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    if buffer.strip():
+        statements.append(buffer.strip())
+    return statements
+
+
+_SELF_HEALING_OBJECT = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?(INDEX|TRIGGER)\s+IF\s+NOT\s+EXISTS\s+(\w+)",
+    re.IGNORECASE)
+
+
+def healing_statements(migrations):
+    # Índices y triggers de schema.sql por nombre; se pueden volver a crear
+    # sin perder datos si alguien los borró.
+    statements = {}
+    for _, migration in migrations:
+        for statement in migration:
+            match = _SELF_HEALING_OBJECT.match(statement)
+            if match:
+                statements[match.group(2)] = statement
+    return statements
+
+
+PRODUCT_COLUMNS = """
+    p.sku, p.description, p.id_department, p.id_class, p.id_family,
+    p.brand, p.model, p.stock, p.quantity, p.discontinued,
+    p.record_delete, p.record_data,
+    d.name AS department_name,
+    c.name AS class_name,
+    f.name AS family_name,
+    p.row_version,
+    0 AS archived
+"""
+
+# Nombres de las columnas de PRODUCT_COLUMNS, en el mismo orden.
+PRODUCT_RECORD_FIELDS = (
+    "sku", "description", "id_department", "id_class", "id_family",
+    "brand", "model", "stock", "quantity", "discontinued",
+    "record_delete", "record_data",
+    "department_name", "class_name", "family_name", "row_version",
+    "archived"
+)
+
+# Columnas que update_product() puede escribir, en el orden de sus
+# argumentos.
+UPDATABLE_FIELDS = (
+    "description", "id_department", "id_class", "id_family", "stock",
+    "quantity", "record_delete", "model", "brand", "record_data",
+    "discontinued"
+)
+
+MAX_STOCK = 10 ** STOCK_DIGITS - 1
+
+_UNSET = object()
+
+# Columnas que agrupan cada nivel de los totales de ProductRollup.
+ROLLUP_LEVELS = {
+    "department": ("id_department",),
+    "class": ("id_department", "id_class"),
+    "family": ("id_department", "id_class", "id_family"),
+}
+
+# Recálculo completo de ProductRollup desde Product; es la misma consulta
+# con la que la migración 6 llena la tabla.
+ROLLUP_RECOMPUTE = """
+    SELECT id_department, id_class, id_family, count(*), sum(stock),
+        sum(quantity), sum(discontinued <> 0)
+    FROM Product
+    GROUP BY id_department, id_class, id_family
+"""
+
+SEARCH_QUERY = f"""
+    SELECT {PRODUCT_COLUMNS}
+    FROM Product p {{hint}}
+    LEFT JOIN Department d ON p.id_department = d.id
+    LEFT JOIN Class c ON p.id_class = c.id AND p.id_department = c.id_department
+    LEFT JOIN Family f ON p.id_family = f.id AND p.id_class = f.id_class
+    AND p.id_department = f.id_department
+    WHERE p.sku > ? {{filters}}
+    ORDER BY p.sku
+    LIMIT ?
+"""
+
+# Columnas de la lista de productos de la ventana y las que se pueden
+# ordenar; cada orden se resuelve con un índice que termina en sku.
+BROWSE_COLUMNS = (
+    "sku", "description", "brand", "model", "stock", "quantity",
+    "record_data"
+)
+BROWSE_SORTS = ("sku", "description", "brand", "stock", "record_data")
+# Con un filtro de jerarquía de hasta estas filas conviene leerlas con
+# idx_product_hierarchy y ordenarlas; con más, recorrer el índice del orden
+# y descartar las de otra jerarquía.
+BROWSE_SORT_ROWS = 5000
+
+
+def product_filters(
+    id_department=None, id_class=None, id_family=None, brand=None,
+    min_stock=None, max_stock=None, discontinued=None, since=None,
+    until=None
+):
+    # Devuelve el fragmento " AND ..." y sus parámetros para la tabla p.
+    conditions = []
+    params = []
+    for condition, value in (
+        ("p.id_department = ?", id_department),
+        ("p.id_class = ?", id_class),
+        ("p.id_family = ?", id_family),
+        ("p.brand = ?", brand),
+        ("p.stock >= ?", min_stock),
+        ("p.stock <= ?", max_stock),
+        ("p.discontinued = ?", None if discontinued is None
+         else int(discontinued)),
+        ("p.record_data >= ?", since),
+        ("p.record_data <= ?", until),
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    return "".join(f" AND {c}" for c in conditions), params
+
+
+def search_index(filters):
+    # Índice por el que search_products() lee Product, o None para recorrer
+    # la llave primaria desde after_sku. Con una igualdad (jerarquía
+    # completa, marca, departamento, descontinuados) las filas salen del
+    # índice en orden de sku; los rangos cerrados de stock y de fecha se
+    # leen por su índice y se ordenan. Sin filtro, o con un rango abierto
+    # que abarca casi todo el catálogo, la llave primaria llena la página
+    # antes.
+    given = {name for name, value in filters.items() if value is not None}
+    if {"id_department", "id_class", "id_family"} <= given:
+        return "idx_product_hierarchy"
+    if "brand" in given:
+        return "idx_product_brand"
+    if "id_department" in given:
+        return "idx_product_department"
+    if "discontinued" in given and int(filters["discontinued"]):
+        return "idx_product_discontinued"
+    if {"min_stock", "max_stock"} <= given:
+        return "idx_product_stock"
+    if {"since", "until"} <= given:
+        return "idx_product_record_data"
+    return None
+
+
+def search_query(filters):
+    # SEARCH_QUERY con el índice de search_index() escrito en la consulta,
+    # para que el plan no dependa de las estadísticas de ANALYZE.
+    conditions, params = product_filters(**filters)
+    index = search_index(filters)
+    hint = f"INDEXED BY {index}" if index else "NOT INDEXED"
+    return SEARCH_QUERY.format(hint=hint, filters=conditions), params
+
+
+def keyset_conditions(sort, key, greater):
+    # Filas posteriores (greater) o anteriores a key = (valor, sku) en el
+    # orden ascendente (sort, sku), con los NULL primero como en ORDER BY.
+    # Se devuelven como tramos que se consultan uno tras otro: primero el
+    # resto de las filas con el mismo valor, luego los demás valores. Así
+    # cada consulta lee un rango del índice (valor, sku); con (valor, sku)
+    # > (?, ?) o con OR, SQLite recorre todas las filas del mismo valor.
+    if key is None:
+        return [("", [])]
+    value, sku = key
+    op = ">" if greater else "<"
+    if sort == "sku":
+        return [(f" AND p.sku {op} ?", [sku])]
+    column = f"p.{sort}"
+    if value is None:
+        same = (f" AND {column} IS NULL AND p.sku {op} ?", [sku])
+        return [same, (f" AND {column} IS NOT NULL", [])] if greater \
+            else [same]
+    segments = [(f" AND {column} = ? AND p.sku {op} ?", [value, sku]),
+                (f" AND {column} {op} ?", [value])]
+    if not greater:
+        segments.append((f" AND {column} IS NULL", []))
+    return segments
+
+
+def browse_key(row, sort):
+    # Llave (valor, sku) de una fila de browse_products().
+    return row[BROWSE_COLUMNS.index(sort)], row[0]
+
+
+def browse_sort_key(row, sort):
+    # Para ordenar filas de browse_products() en Python igual que SQLite.
+    value, sku = browse_key(row, sort)
+    return value is not None, value, sku
+
+
+# Combinaciones de filtros cuyo plan se revisa con verify_search_plans(),
+# con el índice por el que se debe leer Product. None: sin filtro, o un
+# rango abierto o los no descontinuados, que abarcan casi todo el catálogo;
+# se recorre la llave primaria desde after_sku y sólo se exige que no haya
+# un SCAN.
+SEARCH_PLAN_CASES = (
+    ({}, None),
+    ({"id_department": 1}, "idx_product_department"),
+    ({"id_department": 1, "id_class": 1}, "idx_product_department"),
+    ({"id_department": 1, "id_class": 1, "id_family": 1},
+     "idx_product_hierarchy"),
+    ({"discontinued": 1, "id_department": 1, "id_class": 1, "id_family": 1},
+     "idx_product_hierarchy"),
+    ({"brand": "Mabe"}, "idx_product_brand"),
+    ({"brand": "Mabe", "id_department": 1}, "idx_product_brand"),
+    ({"brand": "Mabe", "min_stock": 1, "discontinued": 0},
+     "idx_product_brand"),
+    ({"discontinued": 1}, "idx_product_discontinued"),
+    ({"discontinued": 1, "since": "2024-01-01"}, "idx_product_discontinued"),
+    ({"discontinued": 0, "id_department": 1, "id_class": 1},
+     "idx_product_department"),
+    ({"min_stock": 10}, None),
+    ({"min_stock": 10, "max_stock": 20}, "idx_product_stock"),
+    ({"min_stock": 10, "id_department": 1}, "idx_product_department"),
+    ({"since": "2024-01-01"}, None),
+    ({"since": "2024-01-01", "until": "2024-12-31"},
+     "idx_product_record_data"),
+    ({"since": "2024-01-01", "discontinued": 0}, None),
+)
+
+
+def is_table_scan(detail):
+    return re.match(r"SCAN \w+( USING (COVERING )?INDEX \w+)?$", detail) \
+        is not None
+
+
+def uses_index(plan, index):
+    # La tabla p se lee con una búsqueda (no un SCAN) sobre `index`.
+    return any(
+        re.match(rf"SEARCH p USING (COVERING )?INDEX {index} ", detail)
+        for detail in plan)
+
+
+_SEARCH_TOKEN = re.compile(r"\w+")
+
+
+def text_match_expression(text):
+    # Cada palabra se busca como prefijo; las comillas evitan que la
+    # entrada del usuario se interprete como sintaxis de FTS5.
+    tokens = _SEARCH_TOKEN.findall(text)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class VersionConflict(Exception):
+    def __init__(self, sku, expected, current):
+        self.sku = sku
+        self.expected = expected
+        self.current = current
+        super().__init__(
+            f"El SKU {sku} cambió mientras se editaba "
+            f"(versión {expected}, ahora {current})")
+
+
+class ProductNotFound(LookupError):
+    # Cambio o Baja de un SKU que no está en Product. Si está archivado hay
+    # que restaurarlo antes; escribir sobre él no tendría efecto.
+    def __init__(self, sku, archived=False):
+        self.sku = sku
+        self.archived = archived
+        if archived:
+            message = (f"El SKU {sku} está archivado; restáurelo primero "
+                       f"(archive.py restore {sku})")
+        else:
+            message = f"El SKU {sku} no existe"
+        super().__init__(message)
+
+
+class ProductArchived(ValueError):
+    # Alta de un SKU que está en ProductArchive. Se restaura en lugar de
+    # darlo de alta otra vez: quedarían dos versiones y la restauración ya
+    # no podría devolverlo a Product.
+    def __init__(self, sku):
+        self.sku = sku
+        super().__init__(
+            f"El SKU {sku} está archivado; restáurelo en lugar de darlo de "
+            f"alta (archive.py restore {sku})")
+
+
+def movement_rejection(row, delta_stock, delta_quantity):
+    # Motivo por el que MOVEMENT_QUERY no actualizó la fila, como
+    # (campo, mensaje).
+    if row is None:
+        return "sku", "el SKU no existe"
+    stock, quantity = row[0] + delta_stock, row[1] + delta_quantity
+    if stock < 0:
+        return "stock", "el stock quedaría negativo"
+    if stock > MAX_STOCK:
+        return "stock", f"el stock excedería {STOCK_DIGITS} dígitos"
+    if quantity < 0:
+        return "quantity", "la cantidad quedaría negativa"
+    return "quantity", "la cantidad no debe ser mayor al stock"
+
+
+def product_key(sku):
+    # El SKU llega como texto desde la interfaz y como entero desde otros
+    # caminos; ambos deben dar la misma llave de caché.
+    try:
+        return int(sku)
+    except (TypeError, ValueError):
+        return sku
+
+
+class ConnectionPool:
+    def __init__(
+        self, db_file, pragmas=None, max_connections=8, timeout=30.0,
+        cached_statements=STATEMENT_CACHE_SIZE
+    ):
+        self.db_file = db_file
+        self.pragmas = dict(PRAGMA_PROFILES["default"] if pragmas is None
+                            else pragmas)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = {}
+        self._threads = {}
+        self._cond = threading.Condition()
+        self.metrics = None
+
+    def _open(self):
+        # isolation_level=None: las transacciones se controlan explícitamente
+        # con BEGIN/COMMIT desde DatabaseManager.transaction(). Cada conexión
+        # vive mientras viva su hilo y conserva preparadas las últimas
+        # cached_statements sentencias, entre ellas los procedimientos.
+        started = time.perf_counter()
+        conn = sqlite3.connect(
+            self.db_file, timeout=self.timeout, isolation_level=None,
+            check_same_thread=False, cached_statements=self.cached_statements
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.metrics is not None:
+            self.metrics.observe(
+                "abcc_connection_open_seconds", time.perf_counter() - started)
+        return conn
+
+    def _has_room(self):
+        # Cierra las conexiones de hilos que ya terminaron.
+        for ident, thread in list(self._threads.items()):
+            if not thread.is_alive():
+                self._connections.pop(ident).close()
+                del self._threads[ident]
+        return len(self._connections) < self.max_connections
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        ident = threading.get_ident()
+        with self._cond:
+            if not self._cond.wait_for(self._has_room, timeout=self.timeout):
+                raise sqlite3.OperationalError(
+                    f"connection pool exhausted ({self.max_connections})")
+            conn = self._open()
+            self._connections[ident] = conn
+            self._threads[ident] = threading.current_thread()
+
+        self._local.conn = conn
+        self._local.depth = 0
+        self._local.data_version = None
+        return conn
+
+    def release(self):
+        # Devuelve al pool la conexión del hilo actual.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._cond:
+            self._connections.pop(threading.get_ident(), None)
+            self._threads.pop(threading.get_ident(), None)
+            self._cond.notify()
+        conn.close()
+
+    def close_all(self):
+        with self._cond:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._threads.clear()
+            self._cond.notify_all()
+        self._local = threading.local()
+
+
+class DatabaseManager:
+    def __init__(
+        self, db_file, profile="default", max_connections=8, bootstrap=True,
+        cache_size=1024, cache_ttl=None, metrics=None,
+        statement_cache=STATEMENT_CACHE_SIZE
+    ) -> None:
+        self.db_file = db_file
+        self.pool = ConnectionPool(
+            db_file, PRAGMA_PROFILES[profile], max_connections,
+            cached_statements=statement_cache)
+        self.product_cache = ProductCache(cache_size, cache_ttl)
+        # Alta, Baja, Cambio y Consulta, definidos en procedures.sql.
+        self.procedures = load_procedures()
+        self._catalog = None
+        self._sku_index = None
+        self._sku_lock = threading.Lock()
+
+        # Con metrics=None no se toma ningún tiempo.
+        self.metrics = metrics
+        if metrics is not None:
+            self.pool.metrics = metrics
+            metrics.add_collector(lambda: {
+                f"abcc_product_cache_{name}": value
+                for name, value in self.product_cache.stats().items()
+            })
+            metrics.add_collector(lambda: {} if self._sku_index is None else {
+                "abcc_sku_index_count": self._sku_index.count,
+                "abcc_sku_index_seq": self._sku_index.last_seq,
+            })
+
+        if bootstrap:
+            self.ensure_schema()
+
+    def _connect(self):
+        return self.pool.connection()
+
+    def close(self):
+        self.pool.close_all()
+
+    @contextmanager
+    def transaction(self, mode="IMMEDIATE"):
+        conn = self._connect()
+        local = self.pool._local
+
+        # Las transacciones anidadas se resuelven con SAVEPOINT.
+        if conn.in_transaction:
+            local.depth += 1
+            savepoint = f"sp_{local.depth}"
+            conn.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+                raise
+            else:
+                conn.execute(f"RELEASE {savepoint}")
+            finally:
+                local.depth -= 1
+            return
+
+        started = time.perf_counter()
+        conn.execute(f"BEGIN {mode}")
+        outcome = "commit"
+        try:
+            yield conn
+        except BaseException:
+            outcome = "rollback"
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe(
+                    "abcc_transaction_seconds", time.perf_counter() - started,
+                    mode=mode.lower(), outcome=outcome)
+
+    def ensure_schema(self):
+        conn = self._connect()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        migrations = load_migrations()
+        pending = [m for m in migrations if m[0] > version]
+        if self.pool.pragmas.get("query_only") == "ON":
+            return version
+
+        for number, statements in pending:
+            with self.transaction() as conn:
+                # Otro proceso pudo aplicar la migración mientras esperábamos.
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+            version = number
+
+        missing = self.missing_schema_objects(migrations)
+        if missing:
+            healing = healing_statements(migrations)
+            with self.transaction() as conn:
+                for name in missing:
+                    conn.execute(healing[name])
+        return version
+
+    def missing_schema_objects(self, migrations=None):
+        expected = healing_statements(migrations or load_migrations())
+        existing = {name for name, in self.query(
+            "SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+        return [name for name in expected if name not in existing]
+
+    def _record(self, conn, query, params, started, rows):
+        self.metrics.record_statement(
+            query, time.perf_counter() - started, rows,
+            explain=lambda: [row[3] for row in conn.execute(
+                f"EXPLAIN QUERY PLAN {query}", params)])
+
+    def query(self, query, params=()):
+        conn = self._connect()
+        if self.metrics is None:
+            return conn.execute(query, params).fetchall()
+
+        started = time.perf_counter()
+        rows = conn.execute(query, params).fetchall()
+        self._record(conn, query, params, started, len(rows))
+        return rows
+
+    def iter_query(self, query, params=(), size=1000):
+        conn = self._connect()
+        started = time.perf_counter()
+        count = 0
+        cursor = conn.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    return
+                count += len(rows)
+                yield from rows
+        finally:
+            cursor.close()
+            if self.metrics is not None:
+                self._record(conn, query, params, started, count)
+
+    def execute(self, query, params=()):
+        with self.transaction() as conn:
+            if self.metrics is None:
+                return conn.execute(query, params).rowcount
+
+            started = time.perf_counter()
+            rowcount = conn.execute(query, params).rowcount
+            self._record(conn, query, params, started, rowcount)
+            return rowcount
+
+    def call(self, name, *args, **kwargs):
+        # Ejecuta el procedimiento `name` de procedures.sql. Devuelve las
+        # filas como tuplas con nombre, o las filas afectadas si escribe.
+        procedure = self.procedures[name]
+        params = procedure.bind(args, kwargs)
+        conn = self._connect()
+        if procedure.writes and not conn.in_transaction:
+            with self.transaction():
+                return self._call(conn, procedure, params)
+        return self._call(conn, procedure, params)
+
+    def _call(self, conn, procedure, params):
+        if self.metrics is None:
+            return procedure.decode(conn.execute(procedure.sql, params))
+
+        started = time.perf_counter()
+        result = procedure.decode(conn.execute(procedure.sql, params))
+        self._record(conn, procedure.sql, params, started,
+                     result if procedure.writes else len(result))
+        self.metrics.observe(
+            "abcc_procedure_seconds", time.perf_counter() - started,
+            procedure=procedure.name)
+        self.metrics.increment(
+            "abcc_procedure_calls_total", procedure=procedure.name)
+        return result
+
+    def call_many(self, name, param_sets):
+        # El mismo procedimiento con muchos juegos de parámetros (tuplas en
+        # el orden de declaración o diccionarios), en una sola transacción.
+        # Si escribe devuelve el total de filas afectadas; si no, una lista
+        # de resultados en el orden de param_sets.
+        procedure = self.procedures[name]
+        bound = [
+            procedure.bind(params, None) if not isinstance(params, dict)
+            else procedure.bind((), params)
+            for params in param_sets
+        ]
+        started = time.perf_counter()
+        with self.transaction("IMMEDIATE" if procedure.writes
+                              else "DEFERRED") as conn:
+            if procedure.writes:
+                result = conn.executemany(procedure.sql, bound).rowcount
+            else:
+                result = [procedure.decode(conn.execute(procedure.sql, params))
+                          for params in bound]
+        if self.metrics is not None:
+            self.metrics.observe(
+                "abcc_procedure_batch_seconds", time.perf_counter() - started,
+                procedure=name)
+            self.metrics.increment(
+                "abcc_procedure_calls_total", len(bound), procedure=name)
+        return result
+
+    def verify_procedures(self):
+        # Prepara cada procedimiento con EXPLAIN contra el esquema actual;
+        # devuelve [(nombre, error)] de los que no compilan.
+        conn = self._connect()
+        failures = []
+        for name, procedure in self.procedures.items():
+            try:
+                conn.execute(
+                    f"EXPLAIN {procedure.sql}",
+                    dict.fromkeys(p.name for p in procedure.parameters))
+            except sqlite3.Error as e:
+                failures.append((name, str(e)))
+        return failures
+
+    def check_data_version(self):
+        # PRAGMA data_version cambia cuando otra conexión (de este u otro
+        # proceso) confirma una escritura; en ese caso ya no se puede
+        # confiar en el caché. Una conexión nueva tampoco sabe qué cambió
+        # antes de abrirse.
+        conn = self._connect()
+        local = self.pool._local
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if local.data_version != version:
+            local.data_version = version
+            self.product_cache.clear()
+        return conn
+
+    def add_product(
+        self, sku, description, id_department, id_class, id_family, stock,
+        quantity, record_delete, model, brand, record_data, discontinued
+    ):
+        added = self.call(
+            "product_add", sku, description, id_department, id_class,
+            id_family, stock, quantity, record_delete, model, brand,
+            record_data, discontinued)
+        self.product_cache.invalidate(product_key(sku))
+        if added:
+            self._track_sku(sku, True)
+        elif self.is_archived(sku):
+            raise ProductArchived(sku)
+        return bool(added)
+
+    def update_product(
+        self, sku, description=_UNSET, id_department=_UNSET, id_class=_UNSET,
+        id_family=_UNSET, stock=_UNSET, quantity=_UNSET, record_delete=_UNSET,
+        model=_UNSET, brand=_UNSET, record_data=_UNSET, discontinued=_UNSET,
+        *, expected_version=None
+    ):
+        # Con todos los campos es el Cambio completo; con sólo algunos se
+        # escriben únicamente esos (un campo en None también se conserva).
+        # Con expected_version el UPDATE sólo se aplica si nadie modificó la
+        # fila desde que se leyó esa versión. Devuelve cuántas filas se
+        # actualizaron; si el SKU no está en Product lanza ProductNotFound.
+        arguments = (
+            description, id_department, id_class, id_family, stock,
+            quantity, record_delete, model, brand, record_data, discontinued)
+        changes = {
+            field: value for field, value in zip(UPDATABLE_FIELDS, arguments)
+            if value is not _UNSET
+        }
+        if not changes:
+            raise ValueError("update_product() sin campos que actualizar")
+
+        procedure = "product_update"
+        if changes.keys() <= {"stock", "quantity"}:
+            procedure = "product_update_stock"
+        with self.transaction():
+            updated = self.call(
+                procedure, sku, **changes, expected_version=expected_version)
+            if not updated:
+                row = self.call("product_version", sku)
+                if row and expected_version is not None \
+                        and row[0].row_version != expected_version:
+                    raise VersionConflict(
+                        sku, expected_version, row[0].row_version)
+                if row:
+                    raise ValidationError(
+                        [("quantity", "la cantidad no debe ser mayor al stock")])
+                raise ProductNotFound(sku, self.is_archived(sku))
+        self.product_cache.invalidate(product_key(sku))
+        return updated
+
+    def is_archived(self, sku):
+        return bool(self.call("product_get_archived", sku))
+
+    def archived_skus(self, skus):
+        # Los de `skus` que están en ProductArchive.
+        skus = list(skus)
+        if not skus:
+            return set()
+        placeholders = ", ".join("?" for _ in skus)
+        return {sku for sku, in self.query(
+            f"SELECT sku FROM ProductArchive WHERE sku IN ({placeholders})",
+            skus)}
+
+    def apply_movements(self, movements, batch_size=1000, on_reject=None):
+        # Cada movimiento es (sku, delta_stock, delta_quantity); lo que venga
+        # después se ignora y llega tal cual a on_reject(movimiento, campo,
+        # mensaje). Los movimientos se confirman en lotes de batch_size y un
+        # rechazo no deshace a los demás del lote.
+        # Devuelve (aplicados, rechazados).
+        applied = rejected = 0
+        iterator = iter(movements)
+        while True:
+            batch = [m for _, m in zip(range(batch_size), iterator)]
+            if not batch:
+                return applied, rejected
+
+            started = time.perf_counter()
+            with self.transaction():
+                for movement in batch:
+                    sku, delta_stock, delta_quantity = movement[:3]
+                    if self.call(
+                        "product_move", sku, delta_stock, delta_quantity
+                    ):
+                        applied += 1
+                        continue
+                    rejected += 1
+                    if on_reject is not None:
+                        row = self.call("product_stock", sku)
+                        on_reject(movement, *movement_rejection(
+                            row[0] if row else None, delta_stock,
+                            delta_quantity))
+            for movement in batch:
+                self.product_cache.invalidate(product_key(movement[0]))
+            if self.metrics is not None:
+                self.metrics.observe(
+                    "abcc_movement_batch_seconds", time.perf_counter() - started)
+                self.metrics.increment("abcc_movements_total", len(batch))
+
+    def delete_product(self, sku):
+        deleted = self.call("product_delete", sku)
+        self.product_cache.invalidate(product_key(sku))
+        if not deleted:
+            raise ProductNotFound(sku, self.is_archived(sku))
+        self._track_sku(sku, False)
+
+    def _track_sku(self, sku, present):
+        # Dentro de una transacción el cambio todavía puede deshacerse; el
+        # índice lo verá en SkuLog cuando se confirme.
+        index = self._sku_index
+        if index is None or self._connect().in_transaction:
+            return
+        if present:
+            index.add(product_key(sku))
+        else:
+            index.discard(product_key(sku))
+
+    def _sku_log_position(self):
+        row = self.query(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'SkuLog'")
+        return row[0][0] if row else 0
+
+    def load_sku_index(self):
+        # Un solo recorrido de la llave primaria; la posición de SkuLog se lee
+        # en la misma transacción para no perder ni repetir cambios.
+        index = SkuIndex()
+        with self.transaction("DEFERRED"):
+            index.last_seq = self._sku_log_position()
+            index.load(sku for sku, in self.iter_query(
+                "SELECT sku FROM Product", size=10000))
+        return index
+
+    def sku_index(self):
+        with self._sku_lock:
+            if self._sku_index is None:
+                self._sku_index = self.load_sku_index()
+            return self._sku_index
+
+    def refresh_sku_index(self):
+        # Aplica las altas y bajas de SkuLog posteriores a la última posición
+        # leída, incluidas las de otros procesos. Devuelve cuántas aplicó.
+        index = self.sku_index()
+        with self._sku_lock, self.transaction("DEFERRED"):
+            oldest = self.query("SELECT min(seq) FROM SkuLog")[0][0]
+            position = self._sku_log_position()
+            if position == index.last_seq:
+                return 0
+            if oldest is None or oldest > index.last_seq + 1:
+                # SkuLog se podó más allá de lo que este índice ya leyó.
+                self._sku_index = self.load_sku_index()
+                return self._sku_index.count
+
+            changes = self.query(
+                "SELECT seq, sku, present FROM SkuLog WHERE seq > ? "
+                "ORDER BY seq", (index.last_seq,))
+            for seq, sku, present in changes:
+                if present:
+                    index.add(sku)
+                else:
+                    index.discard(sku)
+            index.last_seq = position
+            return len(changes)
+
+    def prune_sku_log(self, keep=SKU_LOG_KEEP):
+        return self.execute(
+            "DELETE FROM SkuLog WHERE seq <= "
+            "(SELECT seq FROM sqlite_sequence WHERE name = 'SkuLog') - ?",
+            (keep,))
+
+    def sku_exists(self, sku):
+        # Sólo memoria, pensado para validar cada tecla: no espera a la base
+        # y devuelve None mientras el índice no se ha cargado.
+        index = self._sku_index
+        return None if index is None else index.contains(sku)
+
+    def next_free_sku(self, start=1):
+        self.refresh_sku_index()
+        return self.sku_index().next_free(start)
+
+    def sku_occupancy(self, low, high):
+        self.refresh_sku_index()
+        return self.sku_index().occupancy(low, high)
+
+    def search_products(self, after_sku=None, limit=50, **filters):
+        # Paginación por llave: se pasa como after_sku el último SKU de la
+        # página anterior. Devuelve (filas, after_sku de la siguiente página).
+        query, params = search_query(filters)
+        rows = self.query(
+            query, (-1 if after_sku is None else after_sku, *params, limit))
+        next_sku = rows[-1][0] if len(rows) == limit else None
+        return rows, next_sku
+
+    def count_products(self, cap=10000, **filters):
+        # Conteo exacto hasta cap; a partir de ahí sólo se sabe que hay más.
+        # Devuelve (conteo, es_exacto).
+        conditions, params = product_filters(**filters)
+        query = f"""
+        SELECT count(*) FROM (
+            SELECT 1 FROM Product p WHERE 1 {conditions} LIMIT ?
+        )
+        """
+        count = self.query(query, (*params, cap + 1))[0][0]
+        return min(count, cap), count <= cap
+
+    def browse_products(
+        self, key=None, limit=100, sort="sku", descending=False,
+        backward=False, **filters
+    ):
+        # Página de la lista de la ventana en el orden (sort, sku): las
+        # filas que siguen a la llave de la última fila mostrada o, con
+        # backward, las que preceden a la de la primera. Vienen en el orden
+        # de la lista.
+        if sort not in BROWSE_SORTS:
+            raise ValueError(f"No se puede ordenar por {sort}")
+        greater = backward == descending
+        conditions, params = product_filters(**filters)
+        if self._hierarchy_size(**filters) > BROWSE_SORT_ROWS:
+            # El + impide usar idx_product_hierarchy para esas columnas.
+            conditions = conditions.replace(" AND p.id_", " AND +p.id_")
+        direction = "ASC" if greater else "DESC"
+        order = f"p.sku {direction}"
+        if sort != "sku":
+            order = f"p.{sort} {direction}, {order}"
+        columns = ", ".join(f"p.{column}" for column in BROWSE_COLUMNS)
+        rows = []
+        for keyset, key_params in keyset_conditions(sort, key, greater):
+            query = f"""
+            SELECT {columns}
+            FROM Product p
+            WHERE 1 {conditions}{keyset}
+            ORDER BY {order}
+            LIMIT ?
+            """
+            rows += self.query(
+                query, (*params, *key_params, limit - len(rows)))
+            if len(rows) == limit:
+                break
+        return rows[::-1] if backward else rows
+
+    def _hierarchy_size(
+        self, id_department=None, id_class=None, id_family=None, **filters
+    ):
+        # Productos de la jerarquía filtrada, según ProductRollup; 0 sin
+        # filtro de jerarquía.
+        conditions = [
+            (column, value) for column, value in (
+                ("id_department", id_department), ("id_class", id_class),
+                ("id_family", id_family))
+            if value is not None
+        ]
+        if not conditions:
+            return 0
+        where = " AND ".join(f"{column} = ?" for column, _ in conditions)
+        return self.query(
+            f"SELECT coalesce(sum(products), 0) FROM ProductRollup "
+            f"WHERE {where}", [value for _, value in conditions])[0][0]
+
+    def search_text(self, text, limit=20):
+        # Coincidencias por prefijo en descripción, marca y modelo, sin
+        # distinguir acentos ni mayúsculas, de la más a la menos relevante.
+        return [row[1:] for row in self.search_text_ranked(text, limit)]
+
+    def search_text_ranked(self, text, limit=20):
+        # Como search_text(), con la puntuación bm25 (menor es mejor) como
+        # primera columna, para combinar resultados de varias bases. El
+        # índice ordena todas las coincidencias y sólo las primeras `limit`
+        # se juntan con Product; con un prefijo que coincide con casi todo
+        # el catálogo la consulta recorre todas, pero el orden es exacto.
+        expression = text_match_expression(text)
+        if not expression:
+            return []
+        query = """
+        SELECT s.score, p.sku, p.description, p.brand, p.model
+        FROM (
+            SELECT rowid, bm25(ProductSearch, 10.0, 5.0, 2.0) AS score
+            FROM ProductSearch
+            WHERE ProductSearch MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ) s
+        JOIN Product p ON p.sku = s.rowid
+        ORDER BY s.score
+        """
+        return self.query(query, (expression, limit))
+
+    def explain(self, query, params=()):
+        return [row[3] for row in self.query(
+            f"EXPLAIN QUERY PLAN {query}", params)]
+
+    def verify_search_plans(self, cases=SEARCH_PLAN_CASES):
+        # Devuelve [(filtros, índice esperado, plan)] de las combinaciones
+        # cuyo plan recorre una tabla completa o no usa su índice. Si falta
+        # el índice que nombra search_query(), el plan es el error.
+        failures = []
+        for filters, index in cases:
+            query, params = search_query(filters)
+            try:
+                plan = self.explain(query, (-1, *params, 50))
+            except sqlite3.OperationalError as e:
+                failures.append((filters, index, [str(e)]))
+                continue
+            if any(is_table_scan(detail) for detail in plan) or (
+                    index is not None and not uses_index(plan, index)):
+                failures.append((filters, index, plan))
+        return failures
+
+    def get_product_by_sku(self, sku):
+        key = product_key(sku)
+        if not isinstance(key, int):
+            return []
+        conn = self.check_data_version()
+        cached = self.product_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
+        rows = self.call("product_get", key)
+        if not rows:
+            # Un SKU archivado ya no está en Product; su última versión se
+            # consulta en ProductArchive (columna archived = 1).
+            rows = self.call("product_get_archived", key)
+        # Dentro de una transacción la fila podría no confirmarse nunca.
+        if not conn.in_transaction:
+            self.product_cache.put(key, tuple(rows))
+        return rows
+
+    def stock_rollup(self, level="department", id_department=None,
+                     id_class=None):
+        # Totales (llave..., productos, stock, cantidad, descontinuados) por
+        # departamento, clase o familia. Lee sólo ProductRollup, que tiene
+        # una fila por familia.
+        keys = ", ".join(ROLLUP_LEVELS[level])
+        conditions = []
+        params = []
+        for column, value in (
+            ("id_department", id_department), ("id_class", id_class)
+        ):
+            if value is not None:
+                conditions.append(f" AND {column} = ?")
+                params.append(value)
+        query = f"""
+        SELECT {keys}, sum(products), sum(stock), sum(quantity),
+            sum(discontinued)
+        FROM ProductRollup
+        WHERE 1 {"".join(conditions)}
+        GROUP BY {keys}
+        HAVING sum(products) > 0
+        ORDER BY {keys}
+        """
+        return self.query(query, params)
+
+    def verify_rollups(self):
+        # Devuelve [(departamento, clase, familia, guardado, recalculado)]
+        # para cada familia cuyos totales no coinciden con Product.
+        with self.transaction("DEFERRED"):
+            stored = {
+                row[:3]: row[3:] for row in self.query(
+                    "SELECT id_department, id_class, id_family, products, "
+                    "stock, quantity, discontinued FROM ProductRollup")
+                if any(row[3:])
+            }
+            actual = {row[:3]: row[3:] for row in self.query(ROLLUP_RECOMPUTE)}
+        return [
+            (*key, stored.get(key), actual.get(key))
+            for key in sorted(stored.keys() | actual.keys())
+            if stored.get(key) != actual.get(key)
+        ]
+
+    def rebuild_rollups(self):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM ProductRollup")
+            conn.execute(f"""
+            INSERT INTO ProductRollup (
+                id_department, id_class, id_family, products, stock,
+                quantity, discontinued
+            )
+            {ROLLUP_RECOMPUTE}
+            """)
+            return conn.execute("SELECT count(*) FROM ProductRollup").fetchone()[0]
+
+    def _catalog_versions(self):
+        rows = self.query("SELECT name, version FROM CatalogVersion")
+        return {name: version for name, version in rows}
+
+    def catalog(self, refresh=False):
+        # Se revisa el contador de cada tabla del catálogo y sólo se vuelven
+        # a leer las que cambiaron.
+        versions = self._catalog_versions()
+        catalog = self._catalog
+        if catalog is None and not refresh:
+            catalog = load_cached(cache_path(self.db_file))
+        if catalog is not None and not refresh:
+            if dict(catalog.versions) == versions:
+                self._catalog = catalog
+                return catalog
+            changed = {name for name in CATALOG_TABLES
+                       if catalog.versions.get(name) != versions.get(name)}
+        else:
+            changed = set(CATALOG_TABLES)
+
+        catalog = self.read_catalog(changed, catalog)
+        self._catalog = catalog
+        save_cached(cache_path(self.db_file), catalog)
+        return catalog
+
+    def read_catalog(self, changed=CATALOG_TABLES, catalog=None):
+        # Lee de la base las tablas del catálogo en `changed` y las combina
+        # con `catalog`; no usa ni escribe la copia en disco.
+        with self.transaction("DEFERRED"):
+            # Se leen de nuevo las versiones dentro de la misma lectura que
+            # las tablas para que ambas correspondan.
+            versions = self._catalog_versions()
+            tables = {
+                "departments": None, "classes": None, "families": None
+            }
+            if "Department" in changed:
+                tables["departments"] = self.query(
+                    "SELECT id, name FROM Department")
+            if "Class" in changed:
+                tables["classes"] = self.query(
+                    "SELECT id_department, id, name FROM Class")
+            if "Family" in changed:
+                tables["families"] = self.query(
+                    "SELECT id_department, id_class, id, name FROM Family")
+
+        if catalog is None:
+            return Catalog(
+                tables["departments"], tables["classes"], tables["families"],
+                versions)
+        return catalog.replace(versions, **tables)
+
+    def generate_hierarchical_data(self):
+        return self.catalog().as_dicts()
+
+
+def _rollup_label(catalog, key):
+    names = [catalog.department_name(key[0])]
+    if len(key) > 1:
+        names.append(catalog.class_name(key[0], key[1]))
+    if len(key) > 2:
+        names.append(catalog.family_name(*key))
+    return " / ".join(name or "?" for name in names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mantenimiento del esquema de la base de productos.")
+    parser.add_argument("--db", default="data.db")
+    parser.add_argument(
+        "command",
+        choices=("check", "procedures", "rollup", "verify-rollups",
+                 "rebuild-rollups"),
+        help="check: aplica migraciones, repara índices y revisa los planes "
+             "de búsqueda y los procedimientos. procedures: lista los "
+             "procedimientos de procedures.sql. rollup: totales de "
+             "productos, stock y cantidad. verify-rollups / rebuild-rollups: "
+             "compara o recalcula esos totales contra la tabla Product.")
+    parser.add_argument(
+        "--level", choices=tuple(ROLLUP_LEVELS), default="department",
+        help="Nivel de los totales de rollup.")
+    args = parser.parse_args(argv)
+
+    db = DatabaseManager(args.db)
+    status = 0
+    try:
+        if args.command == "check":
+            print(f"Versión del esquema: {db.ensure_schema()}")
+            failures = db.verify_search_plans()
+            for filters, index, plan in failures:
+                expected = f"se esperaba {index}" if index else "sin SCAN"
+                print(f"Plan inesperado con {filters} ({expected}): "
+                      f"{'; '.join(plan)}")
+            if not failures:
+                print("Todas las búsquedas usan sus índices.")
+            broken = db.verify_procedures()
+            for name, error in broken:
+                print(f"El procedimiento {name} no compila: {error}")
+            if not broken:
+                print(f"{len(db.procedures)} procedimientos compilan.")
+            status = 1 if failures or broken else 0
+        elif args.command == "procedures":
+            broken = dict(db.verify_procedures())
+            for name, procedure in db.procedures.items():
+                params = ", ".join(
+                    f"{p.name} {p.type}{' NULL' if p.nullable else ''}"
+                    for p in procedure.parameters)
+                print(f"{name}({params}) -> {procedure.returns}")
+                print(f"    {broken.get(name, procedure.description)}")
+            status = 1 if broken else 0
+        elif args.command == "rollup":
+            catalog = db.catalog()
+            size = len(ROLLUP_LEVELS[args.level])
+            print(f"{'nivel':<50} {'productos':>10} {'stock':>14} "
+                  f"{'cantidad':>14} {'descont.':>9}")
+            for row in db.stock_rollup(args.level):
+                key, totals = row[:size], row[size:]
+                print(f"{_rollup_label(catalog, key):<50} {totals[0]:>10} "
+                      f"{totals[1]:>14} {totals[2]:>14} {totals[3]:>9}")
+        elif args.command == "verify-rollups":
+            differences = db.verify_rollups()
+            for *key, stored, actual in differences:
+                print(f"Familia {tuple(key)}: guardado {stored}, "
+                      f"recalculado {actual}")
+            if not differences:
+                print("Los totales coinciden con Product.")
+            status = 1 if differences else 0
+        else:
+            print(f"Totales recalculados para {db.rebuild_rollups()} familias.")
+    finally:
+        db.close()
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
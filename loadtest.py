@@ -0,0 +1,95 @@
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+
+from benchmark import summarize
+
+
+def client(host, port, duration, write_ratio, skus, seed, results):
+    # Una conexión keep-alive por cliente.
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    latencies = {"read": [], "write": []}
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        sku = rng.randint(1, skus)
+        if rng.random() < write_ratio:
+            kind = "write"
+            method, path = "PUT", f"/products/{sku}"
+            body = json.dumps({"stock": rng.randint(1000, 5000)})
+        else:
+            kind = "read"
+            method, path, body = "GET", f"/products/{sku}", None
+
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=body,
+                         headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies[kind].append(time.perf_counter() - started)
+
+    conn.close()
+    results.append((latencies, errors))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Prueba de carga del servicio HTTP de service.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--write-ratio", type=float, default=0.1,
+        help="Fracción de peticiones que son Cambio (PUT).")
+    parser.add_argument(
+        "--skus", type=int, default=10_000,
+        help="Los SKU se eligen al azar entre 1 y este valor.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = []
+    threads = [
+        threading.Thread(target=client, args=(
+            args.host, args.port, args.duration, args.write_ratio, args.skus,
+            args.seed + i, results))
+        for i in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    reads = [value for latencies, _ in results for value in latencies["read"]]
+    writes = [value for latencies, _ in results for value in latencies["write"]]
+    errors = sum(count for _, count in results)
+    total = len(reads) + len(writes)
+
+    print(f"{total} peticiones en {elapsed:.1f} s: {total / elapsed:,.0f} req/s, "
+          f"{errors} errores")
+    for kind, values in (("lectura", reads), ("escritura", writes)):
+        summary = summarize(values, elapsed)
+        print(f"  {kind:<10} {summary['ops_per_sec']:>10,.0f} req/s  "
+              f"p50 {summary['p50_ms']:.2f} ms  p95 {summary['p95_ms']:.2f} ms  "
+              f"p99 {summary['p99_ms']:.2f} ms")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("abcc.slow_query")
+
+# Límites superiores de las cubetas de los histogramas, en segundos.
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_label(query, max_length=120):
+    label = _WHITESPACE.sub(" ", query).strip()
+    return label if len(label) <= max_length else label[:max_length - 3] + "..."
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        # Aproximación: límite superior de la cubeta que contiene el cuantil.
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+         .replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metrics:
+    def __init__(self, slow_query_ms=100.0, explain_slow_queries=True):
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow_queries = explain_slow_queries
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, collector):
+        # collector() devuelve {nombre: valor} con métricas instantáneas.
+        self._collectors.append(collector)
+
+    def time(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    def record_statement(self, query, seconds, rows, explain=None):
+        label = statement_label(query)
+        self.observe("abcc_statement_seconds", seconds, statement=label)
+        if rows is not None:
+            self.increment("abcc_statement_rows_total", rows, statement=label)
+
+        if seconds * 1000 >= self.slow_query_ms:
+            plan = ""
+            if explain is not None and self.explain_slow_queries:
+                try:
+                    plan = "; ".join(explain())
+                except Exception as e:
+                    plan = f"(sin plan: {e})"
+            slow_logger.warning(
+                "%.1f ms, %s filas: %s | plan: %s",
+                seconds * 1000, "-" if rows is None else rows, label, plan)
+
+    def _gauges(self):
+        gauges = {}
+        for collector in self._collectors:
+            try:
+                gauges.update(collector())
+            except Exception:
+                logger.exception("Falló un colector de métricas")
+        return gauges
+
+    def snapshot_text(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for (name, labels), h in histograms:
+            lines.append(
+                f"{name}{_format_labels(labels)} count={h.count} "
+                f"sum={h.total:.6f} p50<={h.quantile(0.5)} "
+                f"p95<={h.quantile(0.95)} p99<={h.quantile(0.99)}")
+        for (name, labels), value in counters:
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        declared = set()
+        for (name, labels), h in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), h.counts):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket"
+                    f"{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {h.total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt="prometheus"):
+        text = self.prometheus() if fmt == "prometheus" else self.snapshot_text()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        # Reemplazo atómico para que un lector nunca vea el archivo a medias.
+        os.replace(tmp_path, path)
+
+    def export_periodically(self, path, interval=15.0, fmt="prometheus"):
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.write(path, fmt)
+                except OSError:
+                    logger.exception("No se pudieron escribir las métricas")
+
+        threading.Thread(target=loop, name="metrics-export", daemon=True).start()
+        return stop
+
+    def serve(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=server.serve_forever, name="metrics-http", daemon=True
+        ).start()
+        return server
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(
+            self.name, time.perf_counter() - self.started, **self.labels)
+        return False
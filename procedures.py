@@ -0,0 +1,174 @@
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+from rules import ValidationError
+
+
+PROCEDURES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "procedures.sql")
+
+# Cuántas sentencias preparadas conserva cada conexión (cached_statements de
+# sqlite3). Deben caber los procedimientos y las búsquedas con filtros más
+# comunes; al pasar del límite se descarta la menos usada.
+STATEMENT_CACHE_SIZE = 256
+
+# Resultado de los procedimientos que escriben: filas afectadas.
+ROWCOUNT = "rowcount"
+
+
+def _boolean(value):
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("1", "true"):
+            return 1
+        if text in ("0", "false"):
+            return 0
+        raise ValueError(value)
+    return int(bool(value))
+
+
+PARAMETER_TYPES = {
+    "INTEGER": int,
+    "TEXT": str,
+    "DATE": str,
+    "BOOLEAN": _boolean,
+}
+
+_PROCEDURE = re.compile(r"^-- procedure: (\w+)[ \t]*$", re.MULTILINE)
+_PARAM = re.compile(r"^-- param: (\w+) (\w+)( NULL)?[ \t]*$")
+_RETURNS = re.compile(r"^-- returns: (\w+)[ \t]*$")
+_PLACEHOLDER = re.compile(r":(\w+)")
+
+
+class Parameter:
+    __slots__ = ("name", "type", "nullable", "_convert")
+
+    def __init__(self, name, type, nullable=False):
+        if type not in PARAMETER_TYPES:
+            raise ValueError(f"Tipo de parámetro desconocido: {type}")
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+        self._convert = PARAMETER_TYPES[type]
+
+    def convert(self, value):
+        if value is None:
+            if self.nullable:
+                return None
+            raise ValidationError([(self.name, "es obligatorio")])
+        try:
+            return self._convert(value)
+        except (TypeError, ValueError):
+            raise ValidationError(
+                [(self.name, f"se espera un valor {self.type}")]) from None
+
+
+class Procedure:
+    def __init__(self, name, parameters, returns, sql, description=""):
+        self.name = name
+        self.parameters = tuple(parameters)
+        self.returns = returns
+        self.sql = sql
+        self.description = description
+        self._record = None
+
+        declared = [parameter.name for parameter in self.parameters]
+        used = set(_PLACEHOLDER.findall(sql))
+        if used != set(declared) or len(declared) != len(set(declared)):
+            raise ValueError(
+                f"{name}: parámetros declarados {declared}, usados "
+                f"{sorted(used)}")
+
+    @property
+    def writes(self):
+        return self.returns == ROWCOUNT
+
+    def bind(self, args=(), kwargs=None):
+        # Parámetros posicionales en el orden de declaración y con nombre;
+        # los que admiten NULL se pueden omitir.
+        kwargs = dict(kwargs or {})
+        if len(args) > len(self.parameters):
+            raise TypeError(
+                f"{self.name}() recibe a lo más {len(self.parameters)} "
+                f"argumentos ({len(args)} dados)")
+        for parameter, value in zip(self.parameters, args):
+            if parameter.name in kwargs:
+                raise TypeError(
+                    f"{self.name}() recibió dos veces {parameter.name}")
+            kwargs[parameter.name] = value
+        unknown = kwargs.keys() - {p.name for p in self.parameters}
+        if unknown:
+            raise TypeError(
+                f"{self.name}() no tiene los parámetros {sorted(unknown)}")
+        return {
+            parameter.name: parameter.convert(kwargs.get(parameter.name))
+            for parameter in self.parameters
+        }
+
+    def record_type(self, cursor):
+        # Tupla con nombre cuyos campos son las columnas del SELECT; se crea
+        # con la primera llamada. Sigue siendo una tupla, así que quien lee
+        # las filas por posición no nota la diferencia.
+        if self._record is None:
+            self._record = namedtuple(
+                self.returns, [column[0] for column in cursor.description])
+        return self._record
+
+    def decode(self, cursor):
+        if self.writes:
+            return cursor.rowcount
+        record = self.record_type(cursor)
+        return [record._make(row) for row in cursor.fetchall()]
+
+
+def _parse(name, text):
+    parameters = []
+    returns = None
+    description = []
+    body = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if body or not stripped.startswith("--"):
+            if stripped or body:
+                body.append(line)
+            continue
+        param = _PARAM.match(stripped)
+        result = _RETURNS.match(stripped)
+        if param:
+            parameters.append(Parameter(
+                param.group(1), param.group(2), bool(param.group(3))))
+        elif result:
+            returns = result.group(1)
+        else:
+            description.append(stripped[2:].strip())
+
+    if returns is None:
+        raise ValueError(f"{name}: falta la línea '-- returns:'")
+    statements = []
+    buffer = ""
+    for line in body:
+        buffer += line + "\n"
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    if buffer.strip() or len(statements) != 1:
+        raise ValueError(f"{name}: se espera una sola sentencia completa")
+    return Procedure(
+        name, parameters, returns, statements[0].rstrip(";").rstrip(),
+        " ".join(description))
+
+
+def load_procedures(path=PROCEDURES_FILE):
+    # {nombre: Procedure} en el orden del archivo.
+    with open(path, encoding="utf-8") as fh:
+        text = fh.read()
+    parts = _PROCEDURE.split(text)
+    procedures = {}
+    for i in range(1, len(parts), 2):
+        name = parts[i]
+        if name in procedures:
+            raise ValueError(f"Procedimiento repetido: {name}")
+        procedures[name] = _parse(name, parts[i + 1])
+    return procedures
@@ -0,0 +1,162 @@
+-- Procedimientos de Alta, Baja, Cambio y Consulta.
+-- Cada procedimiento se declara con:
+--   -- procedure: nombre
+--   -- param: nombre TIPO [NULL]   (uno por parámetro, en el orden de los
+--                                   argumentos posicionales; TIPO es
+--                                   INTEGER, TEXT, DATE o BOOLEAN y NULL
+--                                   indica que se puede omitir)
+--   -- returns: rowcount | NombreDelRegistro
+-- seguidos de una sola sentencia con parámetros :nombre. procedures.py los
+-- carga al abrir la base y DatabaseManager.call() los ejecuta; el texto de
+-- cada sentencia no cambia entre llamadas, así que sqlite3 la prepara una
+-- vez por conexión y la reutiliza desde su caché de sentencias.
+
+-- procedure: product_get
+-- Consulta: el producto con los nombres de su departamento, clase y familia.
+-- param: sku INTEGER
+-- returns: Product
+SELECT
+    p.sku, p.description, p.id_department, p.id_class, p.id_family,
+    p.brand, p.model, p.stock, p.quantity, p.discontinued,
+    p.record_delete, p.record_data,
+    d.name AS department_name,
+    c.name AS class_name,
+    f.name AS family_name,
+    p.row_version,
+    0 AS archived
+FROM Product p
+JOIN Department d ON p.id_department = d.id
+JOIN Class c ON p.id_class = c.id AND p.id_department = c.id_department
+JOIN Family f ON p.id_family = f.id AND p.id_class = f.id_class
+AND p.id_department = f.id_department
+WHERE p.sku = :sku;
+
+-- procedure: product_get_archived
+-- Consulta de un producto archivado (sólo lectura), con archived = 1.
+-- param: sku INTEGER
+-- returns: Product
+SELECT
+    p.sku, p.description, p.id_department, p.id_class, p.id_family,
+    p.brand, p.model, p.stock, p.quantity, p.discontinued,
+    p.record_delete, p.record_data,
+    d.name AS department_name,
+    c.name AS class_name,
+    f.name AS family_name,
+    p.row_version,
+    1 AS archived
+FROM ProductArchive p
+JOIN Department d ON p.id_department = d.id
+JOIN Class c ON p.id_class = c.id AND p.id_department = c.id_department
+JOIN Family f ON p.id_family = f.id AND p.id_class = f.id_class
+AND p.id_department = f.id_department
+WHERE p.sku = :sku;
+
+-- procedure: product_add
+-- Alta. Si el SKU ya existe, o está archivado (se restaura, no se vuelve a
+-- dar de alta), no inserta nada (rowcount 0).
+-- param: sku INTEGER
+-- param: description TEXT
+-- param: id_department INTEGER
+-- param: id_class INTEGER
+-- param: id_family INTEGER
+-- param: stock INTEGER
+-- param: quantity INTEGER
+-- param: record_delete DATE
+-- param: model TEXT NULL
+-- param: brand TEXT NULL
+-- param: record_data DATE
+-- param: discontinued BOOLEAN
+-- returns: rowcount
+INSERT OR IGNORE INTO Product (
+    sku, description, id_department, id_class, id_family, stock,
+    quantity, record_delete, model, brand, record_data, discontinued
+)
+SELECT
+    :sku, :description, :id_department, :id_class, :id_family, :stock,
+    :quantity, :record_delete, :model, :brand, :record_data, :discontinued
+WHERE NOT EXISTS (SELECT 1 FROM ProductArchive WHERE sku = :sku);
+
+-- procedure: product_update
+-- Cambio. Un campo en NULL conserva su valor actual. Con expected_version
+-- sólo se aplica si la fila sigue en esa versión. La cantidad no puede
+-- superar el stock, con los valores nuevos o con los que ya tiene la fila.
+-- param: sku INTEGER
+-- param: description TEXT NULL
+-- param: id_department INTEGER NULL
+-- param: id_class INTEGER NULL
+-- param: id_family INTEGER NULL
+-- param: stock INTEGER NULL
+-- param: quantity INTEGER NULL
+-- param: record_delete DATE NULL
+-- param: model TEXT NULL
+-- param: brand TEXT NULL
+-- param: record_data DATE NULL
+-- param: discontinued BOOLEAN NULL
+-- param: expected_version INTEGER NULL
+-- returns: rowcount
+UPDATE Product
+SET description = coalesce(:description, description),
+    id_department = coalesce(:id_department, id_department),
+    id_class = coalesce(:id_class, id_class),
+    id_family = coalesce(:id_family, id_family),
+    stock = coalesce(:stock, stock),
+    quantity = coalesce(:quantity, quantity),
+    record_delete = coalesce(:record_delete, record_delete),
+    model = coalesce(:model, model),
+    brand = coalesce(:brand, brand),
+    record_data = coalesce(:record_data, record_data),
+    discontinued = coalesce(:discontinued, discontinued),
+    row_version = row_version + 1
+WHERE sku = :sku
+AND (:expected_version IS NULL OR row_version = :expected_version)
+AND coalesce(:quantity, quantity) <= coalesce(:stock, stock);
+
+-- procedure: product_update_stock
+-- Cambio de sólo stock y cantidad, el más frecuente. product_update asigna
+-- todas las columnas y SQLite reescribe las entradas de todos sus índices;
+-- aquí sólo se tocan las de idx_product_stock.
+-- param: sku INTEGER
+-- param: stock INTEGER NULL
+-- param: quantity INTEGER NULL
+-- param: expected_version INTEGER NULL
+-- returns: rowcount
+UPDATE Product
+SET stock = coalesce(:stock, stock),
+    quantity = coalesce(:quantity, quantity),
+    row_version = row_version + 1
+WHERE sku = :sku
+AND (:expected_version IS NULL OR row_version = :expected_version)
+AND coalesce(:quantity, quantity) <= coalesce(:stock, stock);
+
+-- procedure: product_version
+-- Versión actual de la fila, para explicar un Cambio que no se aplicó.
+-- param: sku INTEGER
+-- returns: ProductVersion
+SELECT row_version FROM Product WHERE sku = :sku;
+
+-- procedure: product_delete
+-- Baja.
+-- param: sku INTEGER
+-- returns: rowcount
+DELETE FROM Product WHERE sku = :sku;
+
+-- procedure: product_move
+-- Movimiento relativo de inventario. La regla cantidad <= stock y el límite
+-- de 9 dígitos del stock se revisan sobre los valores resultantes dentro del
+-- mismo UPDATE.
+-- param: sku INTEGER
+-- param: delta_stock INTEGER
+-- param: delta_quantity INTEGER
+-- returns: rowcount
+UPDATE Product
+SET stock = stock + :delta_stock, quantity = quantity + :delta_quantity,
+    row_version = row_version + 1
+WHERE sku = :sku
+AND stock + :delta_stock BETWEEN 0 AND 999999999
+AND quantity + :delta_quantity BETWEEN 0 AND stock + :delta_stock;
+
+-- procedure: product_stock
+-- Stock y cantidad actuales, para explicar un movimiento rechazado.
+-- param: sku INTEGER
+-- returns: ProductStock
+SELECT stock, quantity FROM Product WHERE sku = :sku;
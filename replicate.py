@@ -0,0 +1,277 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+from database import DatabaseManager
+from shards import single_file_error
+
+
+logger = logging.getLogger(__name__)
+
+# Llave de cada tabla que registra ChangeJournal.
+JOURNAL_TABLES = {
+    "Product": ("sku",),
+    "ProductArchive": ("sku",),
+    "Department": ("id",),
+    "Class": ("id_department", "id"),
+    "Family": ("id_department", "id_class", "id"),
+}
+
+# Entradas que se conservan al podar si no hay réplicas registradas.
+JOURNAL_KEEP = 100_000
+
+REPLICA_STATE = """
+    CREATE TABLE IF NOT EXISTS ReplicaState (
+        source TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        applied_at TEXT NOT NULL,
+        PRIMARY KEY (source)
+    )
+"""
+
+
+class ReplicationGap(RuntimeError):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def replica_name(path):
+    return os.path.abspath(path)
+
+
+def journal_position(conn):
+    row = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'ChangeJournal'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def snapshot(db, dest, pages=256, sleep=0.01, progress=None):
+    # Copia en línea con la API de respaldo. La conexión de origen mantiene
+    # abierta una transacción de lectura: en WAL eso no detiene a quienes
+    # escriben y el respaldo ve una sola versión de la base, en lugar de
+    # reiniciarse cada vez que otra conexión confirma.
+    source = sqlite3.connect(db.db_file, isolation_level=None)
+    target = sqlite3.connect(dest, isolation_level=None)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        source.execute("COMMIT")
+
+        # La posición de la réplica es la de la bitácora copiada, que
+        # corresponde exactamente a la foto.
+        seq = journal_position(target)
+        target.execute("BEGIN IMMEDIATE")
+        target.execute(REPLICA_STATE)
+        target.execute("DELETE FROM ReplicaState")
+        target.execute(
+            "INSERT INTO ReplicaState (source, seq, applied_at) "
+            "VALUES (?, ?, ?)", (replica_name(db.db_file), seq, _now()))
+        target.execute("DELETE FROM ChangeJournal")
+        target.execute("DELETE FROM ReplicaCursor")
+        target.execute("COMMIT")
+    finally:
+        target.close()
+        source.close()
+
+    register_replica(db, dest, seq)
+    return seq
+
+
+def register_replica(db, path, seq):
+    db.execute(
+        "INSERT INTO ReplicaCursor (replica, seq, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (replica) DO UPDATE SET seq = excluded.seq, "
+        "updated_at = excluded.updated_at",
+        (replica_name(path), seq, _now()))
+
+
+def _upsert_query(table, columns):
+    keys = JOURNAL_TABLES[table]
+    updates = ", ".join(
+        f"{column} = excluded.{column}" for column in columns
+        if column not in keys)
+    placeholders = ", ".join("?" for _ in columns)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO "
+        + (f"UPDATE SET {updates}" if updates else "NOTHING"))
+
+
+def _delete_query(table):
+    keys = JOURNAL_TABLES[table]
+    return f"DELETE FROM {table} WHERE " + " AND ".join(
+        f"{key} = ?" for key in keys)
+
+
+def apply_entries(conn, entries):
+    # Los UPSERT disparan los triggers de la réplica (texto completo, totales,
+    # SkuLog) igual que en el origen; INSERT OR REPLACE no lo haría.
+    for seq, table, operation, row in entries:
+        if table not in JOURNAL_TABLES:
+            raise ValueError(f"Tabla desconocida en la bitácora: {table}")
+        row = json.loads(row)
+        if operation == "upsert":
+            conn.execute(_upsert_query(table, tuple(row)), tuple(row.values()))
+        else:
+            conn.execute(
+                _delete_query(table),
+                [row[key] for key in JOURNAL_TABLES[table]])
+
+
+def ship(db, replica_path, batch_size=1000):
+    # Envía a la réplica las entradas posteriores a su posición, en lotes.
+    # Cada lote y la nueva posición se confirman juntos en la réplica.
+    # Devuelve cuántas entradas aplicó.
+    source_name = replica_name(db.db_file)
+    replica = DatabaseManager(replica_path, bootstrap=False, cache_size=0)
+    applied = 0
+    try:
+        row = replica.query(
+            "SELECT seq FROM ReplicaState WHERE source = ?", (source_name,))
+        if not row:
+            raise ReplicationGap(
+                f"{replica_path} no es una réplica de {db.db_file}; "
+                f"cree una con snapshot")
+        seq = row[0][0]
+        oldest = db.query("SELECT min(seq) FROM ChangeJournal")[0][0]
+        if oldest is not None and oldest > seq + 1:
+            raise ReplicationGap(
+                f"La bitácora ya no tiene las entradas {seq + 1}-{oldest - 1}; "
+                f"vuelva a crear la réplica con snapshot")
+
+        while True:
+            entries = db.query(
+                "SELECT seq, table_name, operation, row FROM ChangeJournal "
+                "WHERE seq > ? ORDER BY seq LIMIT ?", (seq, batch_size))
+            if not entries:
+                break
+            with replica.transaction() as conn:
+                apply_entries(conn, entries)
+                seq = entries[-1][0]
+                conn.execute(
+                    "UPDATE ReplicaState SET seq = ?, applied_at = ? "
+                    "WHERE source = ?", (seq, _now(), source_name))
+                # La réplica no se replica a su vez.
+                conn.execute("DELETE FROM ChangeJournal")
+            applied += len(entries)
+            register_replica(db, replica_path, seq)
+        replica.prune_sku_log()
+    finally:
+        replica.close()
+    return applied
+
+
+def replica_lag(db):
+    # [(réplica, seq aplicado, entradas pendientes, segundos de atraso,
+    #   última actualización)]. El atraso en segundos es la antigüedad de la
+    # entrada más vieja que la réplica todavía no aplica.
+    return db.query("""
+        SELECT r.replica, r.seq,
+            (SELECT count(*) FROM ChangeJournal j WHERE j.seq > r.seq),
+            coalesce(
+                (SELECT round((julianday('now') - julianday(j.changed_at))
+                              * 86400, 3)
+                 FROM ChangeJournal j WHERE j.seq > r.seq
+                 ORDER BY j.seq LIMIT 1),
+                0),
+            r.updated_at
+        FROM ReplicaCursor r
+        ORDER BY r.replica
+    """)
+
+
+def prune_journal(db, keep=JOURNAL_KEEP):
+    # Borra lo que todas las réplicas registradas ya aplicaron; sin réplicas
+    # sólo se conservan las últimas `keep` entradas.
+    applied = db.query("SELECT min(seq) FROM ReplicaCursor")[0][0]
+    if applied is None:
+        return db.execute(
+            "DELETE FROM ChangeJournal WHERE seq <= "
+            "(SELECT seq FROM sqlite_sequence WHERE name = 'ChangeJournal') "
+            "- ?", (keep,))
+    return db.execute("DELETE FROM ChangeJournal WHERE seq <= ?", (applied,))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Réplicas de solo lectura y respaldos en línea de la base "
+                    "de productos.")
+    parser.add_argument("--db", default="data.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Copia en línea que también sirve como réplica.")
+    snapshot_parser.add_argument("dest")
+    snapshot_parser.add_argument(
+        "--pages", type=int, default=256, help="Páginas por paso.")
+    snapshot_parser.add_argument(
+        "--sleep", type=float, default=0.01,
+        help="Segundos de espera entre pasos.")
+
+    ship_parser = subparsers.add_parser(
+        "ship", help="Aplica en las réplicas los cambios pendientes.")
+    ship_parser.add_argument("replicas", nargs="+")
+    ship_parser.add_argument("--batch-size", type=int, default=1000)
+    ship_parser.add_argument(
+        "--follow", type=float, metavar="SEGUNDOS",
+        help="Repite el envío cada SEGUNDOS hasta interrumpirlo.")
+
+    subparsers.add_parser("status", help="Atraso de cada réplica.")
+    subparsers.add_parser(
+        "prune", help="Poda la bitácora ya aplicada en todas las réplicas.")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    error = single_file_error(args.db, "replicate.py")
+    if error:
+        print(error, file=sys.stderr)
+        return 1
+    db = DatabaseManager(args.db)
+    try:
+        if args.command == "snapshot":
+            started = time.perf_counter()
+            seq = snapshot(
+                db, args.dest, args.pages, args.sleep,
+                progress=lambda status, remaining, total: logger.debug(
+                    "%d de %d páginas", total - remaining, total))
+            print(f"Copia en {args.dest} en posición {seq} "
+                  f"({time.perf_counter() - started:.1f} s)")
+        elif args.command == "ship":
+            while True:
+                for path in args.replicas:
+                    try:
+                        applied = ship(db, path, args.batch_size)
+                    except ReplicationGap as e:
+                        print(e, file=sys.stderr)
+                        return 1
+                    if applied or not args.follow:
+                        print(f"{path}: {applied} cambios aplicados")
+                if not args.follow:
+                    break
+                time.sleep(args.follow)
+        elif args.command == "status":
+            for replica, seq, pending, seconds, updated_at in replica_lag(db):
+                print(f"{replica}: posición {seq}, {pending} pendientes, "
+                      f"{seconds:.1f} s de atraso (actualizada {updated_at})")
+        else:
+            print(f"Entradas podadas: {prune_journal(db)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import operator
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import repeat
+
+
+SKU_DIGITS = 6
+STOCK_DIGITS = 9
+QUANTITY_DIGITS = 9
+TEXT_LIMITS = {"description": 15, "brand": 15, "model": 20}
+DEFAULT_RECORD_DELETE = "1900-01-01"
+
+# Mismo orden que los argumentos de DatabaseManager.add_product()
+PRODUCT_FIELDS = (
+    "sku", "description", "id_department", "id_class", "id_family", "stock",
+    "quantity", "record_delete", "model", "brand", "record_data",
+    "discontinued"
+)
+
+
+class ValidationError(ValueError):
+    def __init__(self, errors):
+        # errors: lista de tuplas (campo, mensaje)
+        self.errors = errors
+        super().__init__(
+            "; ".join(f"{field}: {message}" for field, message in errors))
+
+
+class FieldRule:
+    # Restricción de un campo capturado como texto: sólo dígitos o sólo
+    # letras, con longitud máxima. La usan las validaciones por tecla de la
+    # ventana, check_product() y check_products().
+    __slots__ = ("field", "kind", "limit", "message")
+
+    def __init__(self, field, kind, limit):
+        self.field = field
+        self.kind = kind
+        self.limit = limit
+        if kind == "digits":
+            self.message = f"se esperan hasta {limit} dígitos"
+        else:
+            self.message = f"se esperan hasta {limit} letras"
+
+    def accepts(self, value):
+        # isdecimal() acepta exactamente lo que int() convierte.
+        if len(value) > self.limit:
+            return False
+        return value.isdecimal() if self.kind == "digits" else value.isalpha()
+
+    def accepts_partial(self, value):
+        # Mientras se teclea el campo puede quedar vacío.
+        return value == "" or self.accepts(value)
+
+    def check_column(self, values):
+        # Máscara con 1 en cada valor inválido. Sólo se encadenan map() de
+        # funciones en C, sin ejecutar código Python por valor; el largo se
+        # revisa valor por valor sólo si alguno excede el límite.
+        test = str.isdecimal if self.kind == "digits" else str.isalpha
+        valid = map(test, values)
+        if values and max(map(len, values)) > self.limit:
+            fits = map(operator.le, map(len, values), repeat(self.limit))
+            valid = map(operator.and_, valid, fits)
+        return _invalid(valid)
+
+
+FIELD_RULES = {
+    "sku": FieldRule("sku", "digits", SKU_DIGITS),
+    **{field: FieldRule(field, "letters", limit)
+       for field, limit in TEXT_LIMITS.items()},
+    "stock": FieldRule("stock", "digits", STOCK_DIGITS),
+    "quantity": FieldRule("quantity", "digits", QUANTITY_DIGITS),
+}
+
+# Campos que revisa check_products(), en el orden en que se reportan sus
+# errores, y el mensaje de cada código de su máscara (el código 0 es "sin
+# error").
+CHECKED_FIELDS = (
+    "sku", "description", "brand", "model", "stock", "quantity",
+    "id_department", "id_class", "id_family", "discontinued", "record_data",
+    "record_delete"
+)
+QUANTITY_OVER_STOCK = "la cantidad no debe ser mayor al stock"
+QUANTITY_REQUIRED = "la cantidad es obligatoria"
+ERROR_MESSAGES = {
+    **{field: (None, rule.message) for field, rule in FIELD_RULES.items()},
+    "quantity": (
+        None, FIELD_RULES["quantity"].message, QUANTITY_OVER_STOCK,
+        QUANTITY_REQUIRED),
+    "id_department": (None, "departamento inexistente"),
+    "id_class": (None, "clase inexistente en el departamento"),
+    "id_family": (None, "familia inexistente en la clase"),
+    "discontinued": (None, "se espera 0 o 1"),
+    "record_data": (None, "fecha inválida (AAAA-MM-DD)"),
+    "record_delete": (None, "fecha inválida (AAAA-MM-DD)"),
+}
+
+_DISCONTINUED = {"": 0, "0": 0, "false": 0, "1": 1, "true": 1}
+_NONZERO = re.compile(rb"[^\x00]")
+_AS_FLAG = bytes([0] + [1] * 255)
+_INVERT = bytes([1, 0] + [0] * 254)
+
+
+def _invalid(valid):
+    # Máscara de error a partir de un iterable de bool "es válido".
+    return bytearray(valid).translate(_INVERT)
+
+
+def quantity_fits(quantity, stock):
+    # La cantidad no debe ser mayor al stock; sin stock capturado sólo cabe
+    # una cantidad vacía.
+    if quantity == "":
+        return True
+    return stock.isdecimal() and int(quantity) <= int(stock)
+
+
+@lru_cache(maxsize=4096)
+def is_date(value):
+    if len(value) != 10:
+        return False
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def text_column(values, size):
+    # Columna como lista de str sin espacios, "" para None o faltantes.
+    # Acepta listas, tuplas o arreglos con tolist() (NumPy, pandas).
+    if values is None:
+        return [""] * size
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    try:
+        column = list(map(str.strip, values))
+    except TypeError:
+        column = ["" if v is None else str(v).strip() for v in values]
+    if len(column) != size:
+        raise ValueError("todas las columnas deben tener el mismo largo")
+    return column
+
+
+def _integers(values, mask):
+    # int() de cada valor válido según mask; 0 en los inválidos.
+    if 1 not in mask:
+        return list(map(int, values))
+    return [0 if bad else int(v) for v, bad in zip(values, mask)]
+
+
+def _rows(mask):
+    # Índices de las filas con un código distinto de 0.
+    return [m.start() for m in _NONZERO.finditer(mask)]
+
+
+def columns_from_records(records, fields=PRODUCT_FIELDS):
+    # Transpone una lista de registros (dict) a {campo: columna}.
+    return {field: [record.get(field) for record in records]
+            for field in fields}
+
+
+class ProductBatch:
+    # Resultado de check_products(): una máscara por campo de CHECKED_FIELDS
+    # (bytearray con un código por fila; 0 = válido, n = ERROR_MESSAGES[n])
+    # y las columnas ya convertidas, en el orden de PRODUCT_FIELDS.
+    __slots__ = ("size", "masks", "columns")
+
+    def __init__(self, size, masks, columns):
+        self.size = size
+        self.masks = masks
+        self.columns = columns
+
+    def row_mask(self):
+        # 1 en cada fila con al menos un error.
+        combined = 0
+        for mask in self.masks.values():
+            combined |= int.from_bytes(mask, "little")
+        return bytearray(
+            combined.to_bytes(self.size, "little").translate(_AS_FLAG))
+
+    def invalid_rows(self):
+        return _rows(self.row_mask())
+
+    def errors(self, row):
+        # [(campo, mensaje)] de una fila, como los devuelve check_product().
+        return [
+            (field, ERROR_MESSAGES[field][self.masks[field][row]])
+            for field in CHECKED_FIELDS if self.masks[field][row]
+        ]
+
+    def values(self, row):
+        return tuple(self.columns[field][row] for field in PRODUCT_FIELDS)
+
+    def valid_values(self):
+        # (fila, valores) de las filas sin errores.
+        invalid = self.row_mask()
+        for row, values in enumerate(zip(
+                *(self.columns[field] for field in PRODUCT_FIELDS))):
+            if not invalid[row]:
+                yield row, values
+
+
+def check_products(columns, catalog, today=None):
+    # Valida un lote por columnas: `columns` es {campo: secuencia} con los
+    # campos de PRODUCT_FIELDS. Cada regla recorre una columna completa en
+    # lugar de revisar el registro campo por campo.
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    size = max((len(v) for v in columns.values() if v is not None), default=0)
+    text = {field: text_column(columns.get(field), size)
+            for field in PRODUCT_FIELDS}
+    masks = {field: FIELD_RULES[field].check_column(text[field])
+             for field in ("sku", *TEXT_LIMITS, "stock")}
+
+    # La cantidad es obligatoria, igual que en la ventana: vacía no vale 0.
+    quantity_mask = FIELD_RULES["quantity"].check_column(text["quantity"])
+    quantity = _integers(text["quantity"], quantity_mask)
+    for row in _rows(_invalid(map(bool, text["quantity"]))):
+        quantity_mask[row] = 3
+    stock_mask = masks["stock"]
+    stock = _integers(text["stock"], stock_mask)
+    over_stock = bytearray(map(operator.gt, quantity, stock))
+    for row in _rows(over_stock):
+        if not stock_mask[row] and not quantity_mask[row]:
+            quantity_mask[row] = 2
+    masks["quantity"] = quantity_mask
+
+    # Jerarquía: los ids se repiten mucho, así que se convierten una vez
+    # por valor distinto. Sólo las filas fuera del catálogo se revisan
+    # nivel por nivel, para reportar el primero que falla.
+    departments, classes, families = catalog.rows()
+    department_ids = {dept for dept, _ in departments}
+    class_ids = {(dept, cls) for dept, cls, _ in classes}
+    family_ids = {(dept, cls, fam) for dept, cls, fam, _ in families}
+    hierarchy = []
+    for field in ("id_department", "id_class", "id_family"):
+        ids = {v: int(v) if v.isdecimal() else None
+               for v in set(text[field])}
+        hierarchy.append(list(map(ids.__getitem__, text[field])))
+    department_mask = bytearray(size)
+    class_mask = bytearray(size)
+    family_mask = bytearray(size)
+    unknown = _invalid(map(family_ids.__contains__, zip(*hierarchy)))
+    for row in _rows(unknown):
+        key = tuple(ids[row] for ids in hierarchy)
+        if key[0] not in department_ids:
+            department_mask[row] = 1
+        elif key[:2] not in class_ids:
+            class_mask[row] = 1
+        else:
+            family_mask[row] = 1
+    masks.update(id_department=department_mask, id_class=class_mask,
+                 id_family=family_mask)
+
+    discontinued = list(map(
+        _DISCONTINUED.get, map(str.lower, text["discontinued"])))
+    masks["discontinued"] = bytearray(
+        map(operator.is_, discontinued, repeat(None)))
+
+    record_data = [v or today for v in text["record_data"]]
+    masks["record_data"] = _invalid(map(is_date, record_data))
+
+    # La fecha de baja es hoy cuando el producto está descontinuado.
+    record_delete = [
+        v or (today if flag == 1 else DEFAULT_RECORD_DELETE)
+        for v, flag in zip(text["record_delete"], discontinued)
+    ]
+    masks["record_delete"] = _invalid(map(is_date, record_delete))
+
+    converted = dict(text)
+    converted.update(
+        sku=_integers(text["sku"], masks["sku"]),
+        id_department=hierarchy[0], id_class=hierarchy[1],
+        id_family=hierarchy[2], stock=stock, quantity=quantity,
+        discontinued=discontinued, record_data=record_data,
+        record_delete=record_delete)
+    return ProductBatch(size, masks, converted)
+
+
+def check_product(record, catalog, today=None):
+    # Devuelve (valores en el orden de PRODUCT_FIELDS, errores).
+    # Cada error es una tupla (campo, mensaje). Es check_products() con un
+    # lote de un solo registro.
+    batch = check_products(
+        {field: [record.get(field)] for field in PRODUCT_FIELDS},
+        catalog, today)
+    errors = batch.errors(0)
+    if errors:
+        return None, errors
+    return batch.values(0), errors
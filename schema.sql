@@ -0,0 +1,483 @@
+-- Objetos de base de datos adicionales a sql.sql.
+-- DatabaseManager.ensure_schema() aplica, en orden, cada sección
+-- "-- migration: N" cuyo número sea mayor que PRAGMA user_version.
+
+-- migration: 1
+-- Versiones del catálogo Departamento/Clase/Familia
+CREATE TABLE IF NOT EXISTS CatalogVersion (
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name)
+);
+
+-- Se parte de la hora actual para no coincidir con un caché de una base
+-- recreada desde sql.sql.
+INSERT OR IGNORE INTO CatalogVersion (name, version)
+VALUES
+    ('Department', CAST(strftime('%s', 'now') AS INTEGER)),
+    ('Class', CAST(strftime('%s', 'now') AS INTEGER)),
+    ('Family', CAST(strftime('%s', 'now') AS INTEGER));
+
+CREATE TRIGGER IF NOT EXISTS department_version_insert
+AFTER INSERT ON Department BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Department';
+END;
+
+CREATE TRIGGER IF NOT EXISTS department_version_update
+AFTER UPDATE ON Department BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Department';
+END;
+
+CREATE TRIGGER IF NOT EXISTS department_version_delete
+AFTER DELETE ON Department BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Department';
+END;
+
+CREATE TRIGGER IF NOT EXISTS class_version_insert
+AFTER INSERT ON Class BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Class';
+END;
+
+CREATE TRIGGER IF NOT EXISTS class_version_update
+AFTER UPDATE ON Class BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Class';
+END;
+
+CREATE TRIGGER IF NOT EXISTS class_version_delete
+AFTER DELETE ON Class BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Class';
+END;
+
+CREATE TRIGGER IF NOT EXISTS family_version_insert
+AFTER INSERT ON Family BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Family';
+END;
+
+CREATE TRIGGER IF NOT EXISTS family_version_update
+AFTER UPDATE ON Family BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Family';
+END;
+
+CREATE TRIGGER IF NOT EXISTS family_version_delete
+AFTER DELETE ON Family BEGIN
+    UPDATE CatalogVersion SET version = version + 1 WHERE name = 'Family';
+END;
+
+-- migration: 2
+-- Índices secundarios. Las búsquedas paginan por sku, que es el rowid y
+-- va implícito al final de cada índice.
+CREATE INDEX IF NOT EXISTS idx_product_hierarchy
+ON Product (id_department, id_class, id_family);
+
+CREATE INDEX IF NOT EXISTS idx_product_discontinued
+ON Product (discontinued, record_delete);
+
+CREATE INDEX IF NOT EXISTS idx_product_brand
+ON Product (brand);
+
+CREATE INDEX IF NOT EXISTS idx_product_record_data
+ON Product (record_data);
+
+CREATE INDEX IF NOT EXISTS idx_product_stock
+ON Product (stock);
+
+CREATE INDEX IF NOT EXISTS idx_class_department
+ON Class (id_department, id);
+
+CREATE INDEX IF NOT EXISTS idx_family_class
+ON Family (id_department, id_class, id);
+
+-- migration: 3
+-- Índice de texto completo sobre descripción, marca y modelo. Es una tabla
+-- de contenido externo: el texto vive en Product y los triggers mantienen
+-- el índice al día.
+CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5 (
+    description, brand, model,
+    content = 'Product',
+    content_rowid = 'sku',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+INSERT INTO ProductSearch (ProductSearch) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS product_search_insert
+AFTER INSERT ON Product BEGIN
+    INSERT INTO ProductSearch (rowid, description, brand, model)
+    VALUES (new.sku, new.description, new.brand, new.model);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_search_delete
+AFTER DELETE ON Product BEGIN
+    INSERT INTO ProductSearch (ProductSearch, rowid, description, brand, model)
+    VALUES ('delete', old.sku, old.description, old.brand, old.model);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_search_update
+AFTER UPDATE OF sku, description, brand, model ON Product BEGIN
+    INSERT INTO ProductSearch (ProductSearch, rowid, description, brand, model)
+    VALUES ('delete', old.sku, old.description, old.brand, old.model);
+    INSERT INTO ProductSearch (rowid, description, brand, model)
+    VALUES (new.sku, new.description, new.brand, new.model);
+END;
+
+-- migration: 4
+-- Altas y bajas de SKU en orden. El índice de SKU en memoria de cada proceso
+-- lee desde su última posición para enterarse de escrituras ajenas.
+CREATE TABLE IF NOT EXISTS SkuLog (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    sku INTEGER NOT NULL,
+    present INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS sku_log_insert
+AFTER INSERT ON Product BEGIN
+    INSERT INTO SkuLog (sku, present) VALUES (new.sku, 1);
+END;
+
+CREATE TRIGGER IF NOT EXISTS sku_log_delete
+AFTER DELETE ON Product BEGIN
+    INSERT INTO SkuLog (sku, present) VALUES (old.sku, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS sku_log_update
+AFTER UPDATE OF sku ON Product WHEN new.sku <> old.sku BEGIN
+    INSERT INTO SkuLog (sku, present) VALUES (old.sku, 0);
+    INSERT INTO SkuLog (sku, present) VALUES (new.sku, 1);
+END;
+
+-- migration: 5
+-- Versión de fila para la concurrencia optimista. update_product(), los
+-- movimientos de inventario y la carga masiva la incrementan en el mismo
+-- UPDATE; el trigger cubre a cualquier otro escritor.
+ALTER TABLE Product ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS product_row_version
+AFTER UPDATE ON Product WHEN new.row_version = old.row_version BEGIN
+    UPDATE Product SET row_version = old.row_version + 1 WHERE sku = new.sku;
+END;
+
+-- migration: 6
+-- Totales por familia: productos, stock, cantidad y descontinuados. Los
+-- totales por clase y departamento se suman desde aquí. Los triggers los
+-- mantienen al día; "python database.py verify-rollups" los compara contra
+-- un recálculo completo.
+CREATE TABLE IF NOT EXISTS ProductRollup (
+    id_department INTEGER NOT NULL,
+    id_class INTEGER NOT NULL,
+    id_family INTEGER NOT NULL,
+    products INTEGER NOT NULL DEFAULT 0,
+    stock INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    discontinued INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_department, id_class, id_family)
+) WITHOUT ROWID;
+
+DELETE FROM ProductRollup;
+
+INSERT INTO ProductRollup (
+    id_department, id_class, id_family, products, stock, quantity,
+    discontinued
+)
+SELECT id_department, id_class, id_family, count(*), sum(stock),
+    sum(quantity), sum(discontinued <> 0)
+FROM Product
+GROUP BY id_department, id_class, id_family;
+
+CREATE TRIGGER IF NOT EXISTS product_rollup_insert
+AFTER INSERT ON Product BEGIN
+    INSERT INTO ProductRollup (
+        id_department, id_class, id_family, products, stock, quantity,
+        discontinued
+    )
+    VALUES (
+        new.id_department, new.id_class, new.id_family, 1, new.stock,
+        new.quantity, new.discontinued <> 0
+    )
+    ON CONFLICT (id_department, id_class, id_family) DO UPDATE SET
+        products = products + 1,
+        stock = stock + excluded.stock,
+        quantity = quantity + excluded.quantity,
+        discontinued = discontinued + excluded.discontinued;
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_rollup_delete
+AFTER DELETE ON Product BEGIN
+    UPDATE ProductRollup
+    SET products = products - 1,
+        stock = stock - old.stock,
+        quantity = quantity - old.quantity,
+        discontinued = discontinued - (old.discontinued <> 0)
+    WHERE id_department = old.id_department AND id_class = old.id_class
+    AND id_family = old.id_family;
+END;
+
+-- Mismo departamento, clase y familia: un solo UPDATE con las diferencias.
+CREATE TRIGGER IF NOT EXISTS product_rollup_update
+AFTER UPDATE OF stock, quantity, discontinued ON Product
+WHEN new.id_department = old.id_department AND new.id_class = old.id_class
+AND new.id_family = old.id_family BEGIN
+    UPDATE ProductRollup
+    SET stock = stock + new.stock - old.stock,
+        quantity = quantity + new.quantity - old.quantity,
+        discontinued = discontinued + (new.discontinued <> 0)
+            - (old.discontinued <> 0)
+    WHERE id_department = new.id_department AND id_class = new.id_class
+    AND id_family = new.id_family;
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_rollup_move
+AFTER UPDATE OF id_department, id_class, id_family ON Product
+WHEN new.id_department <> old.id_department OR new.id_class <> old.id_class
+OR new.id_family <> old.id_family BEGIN
+    UPDATE ProductRollup
+    SET products = products - 1,
+        stock = stock - old.stock,
+        quantity = quantity - old.quantity,
+        discontinued = discontinued - (old.discontinued <> 0)
+    WHERE id_department = old.id_department AND id_class = old.id_class
+    AND id_family = old.id_family;
+    INSERT INTO ProductRollup (
+        id_department, id_class, id_family, products, stock, quantity,
+        discontinued
+    )
+    VALUES (
+        new.id_department, new.id_class, new.id_family, 1, new.stock,
+        new.quantity, new.discontinued <> 0
+    )
+    ON CONFLICT (id_department, id_class, id_family) DO UPDATE SET
+        products = products + 1,
+        stock = stock + excluded.stock,
+        quantity = quantity + excluded.quantity,
+        discontinued = discontinued + excluded.discontinued;
+END;
+
+-- migration: 7
+-- Productos descontinuados hace tiempo, fuera de la tabla Product. Los
+-- mueve archive.py en lotes pequeños; get_product_by_sku() los sigue
+-- encontrando aquí.
+CREATE TABLE IF NOT EXISTS ProductArchive (
+    sku INTEGER NOT NULL,
+    id_department INTEGER NOT NULL,
+    id_class INTEGER NOT NULL,
+    id_family INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    brand TEXT,
+    model TEXT,
+    stock INTEGER NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    discontinued BOOLEAN NOT NULL DEFAULT FALSE,
+    record_delete DATE NOT NULL DEFAULT "1900-01-01",
+    record_data DATE NOT NULL,
+    row_version INTEGER NOT NULL DEFAULT 0,
+    archived_at DATE NOT NULL,
+    PRIMARY KEY (sku)
+);
+
+-- migration: 8
+-- Bitácora de cambios para las réplicas: una entrada por fila insertada,
+-- modificada o borrada en Product, ProductArchive y el catálogo, en orden
+-- de seq. La fila se lee de la tabla después del cambio, así que la última
+-- entrada de cada llave tiene la fila completa. replicate.py envía a cada
+-- réplica las entradas posteriores a su posición en ReplicaCursor.
+CREATE TABLE IF NOT EXISTS ChangeJournal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    row TEXT NOT NULL,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS ReplicaCursor (
+    replica TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (replica)
+);
+
+CREATE TRIGGER IF NOT EXISTS product_journal_insert
+AFTER INSERT ON Product BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Product', 'upsert', json_object(
+        'sku', r.sku, 'id_department', r.id_department,
+        'id_class', r.id_class, 'id_family', r.id_family,
+        'description', r.description, 'brand', r.brand, 'model', r.model,
+        'stock', r.stock, 'quantity', r.quantity,
+        'discontinued', r.discontinued, 'record_delete', r.record_delete,
+        'record_data', r.record_data, 'row_version', r.row_version)
+    FROM Product r WHERE r.sku = new.sku;
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_journal_update
+AFTER UPDATE ON Product BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Product', 'delete', json_object('sku', old.sku)
+    WHERE new.sku <> old.sku;
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Product', 'upsert', json_object(
+        'sku', r.sku, 'id_department', r.id_department,
+        'id_class', r.id_class, 'id_family', r.id_family,
+        'description', r.description, 'brand', r.brand, 'model', r.model,
+        'stock', r.stock, 'quantity', r.quantity,
+        'discontinued', r.discontinued, 'record_delete', r.record_delete,
+        'record_data', r.record_data, 'row_version', r.row_version)
+    FROM Product r WHERE r.sku = new.sku;
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_journal_delete
+AFTER DELETE ON Product BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    VALUES ('Product', 'delete', json_object('sku', old.sku));
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_archive_journal_insert
+AFTER INSERT ON ProductArchive BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'ProductArchive', 'upsert', json_object(
+        'sku', r.sku, 'id_department', r.id_department,
+        'id_class', r.id_class, 'id_family', r.id_family,
+        'description', r.description, 'brand', r.brand, 'model', r.model,
+        'stock', r.stock, 'quantity', r.quantity,
+        'discontinued', r.discontinued, 'record_delete', r.record_delete,
+        'record_data', r.record_data, 'row_version', r.row_version,
+        'archived_at', r.archived_at)
+    FROM ProductArchive r WHERE r.sku = new.sku;
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_archive_journal_delete
+AFTER DELETE ON ProductArchive BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    VALUES ('ProductArchive', 'delete', json_object('sku', old.sku));
+END;
+
+CREATE TRIGGER IF NOT EXISTS department_journal_insert
+AFTER INSERT ON Department BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Department', 'upsert', json_object('id', r.id, 'name', r.name)
+    FROM Department r WHERE r.id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS department_journal_update
+AFTER UPDATE ON Department BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Department', 'delete', json_object('id', old.id)
+    WHERE new.id <> old.id;
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Department', 'upsert', json_object('id', r.id, 'name', r.name)
+    FROM Department r WHERE r.id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS department_journal_delete
+AFTER DELETE ON Department BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    VALUES ('Department', 'delete', json_object('id', old.id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS class_journal_insert
+AFTER INSERT ON Class BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Class', 'upsert', json_object(
+        'id_department', r.id_department, 'id', r.id, 'name', r.name)
+    FROM Class r WHERE r.id_department = new.id_department AND r.id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS class_journal_update
+AFTER UPDATE ON Class BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Class', 'delete', json_object(
+        'id_department', old.id_department, 'id', old.id)
+    WHERE new.id_department <> old.id_department OR new.id <> old.id;
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Class', 'upsert', json_object(
+        'id_department', r.id_department, 'id', r.id, 'name', r.name)
+    FROM Class r WHERE r.id_department = new.id_department AND r.id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS class_journal_delete
+AFTER DELETE ON Class BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    VALUES ('Class', 'delete', json_object(
+        'id_department', old.id_department, 'id', old.id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS family_journal_insert
+AFTER INSERT ON Family BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Family', 'upsert', json_object(
+        'id_department', r.id_department, 'id_class', r.id_class, 'id', r.id,
+        'name', r.name)
+    FROM Family r WHERE r.id_department = new.id_department
+    AND r.id_class = new.id_class AND r.id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS family_journal_update
+AFTER UPDATE ON Family BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Family', 'delete', json_object(
+        'id_department', old.id_department, 'id_class', old.id_class,
+        'id', old.id)
+    WHERE new.id_department <> old.id_department
+    OR new.id_class <> old.id_class OR new.id <> old.id;
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    SELECT 'Family', 'upsert', json_object(
+        'id_department', r.id_department, 'id_class', r.id_class, 'id', r.id,
+        'name', r.name)
+    FROM Family r WHERE r.id_department = new.id_department
+    AND r.id_class = new.id_class AND r.id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS family_journal_delete
+AFTER DELETE ON Family BEGIN
+    INSERT INTO ChangeJournal (table_name, operation, row)
+    VALUES ('Family', 'delete', json_object(
+        'id_department', old.id_department, 'id_class', old.id_class,
+        'id', old.id));
+END;
+
+-- migration: 9
+-- Modo por departamentos: cada fila indica el archivo con los productos de
+-- un departamento. Vacía en el modo de un solo archivo (ver shards.py).
+CREATE TABLE IF NOT EXISTS Shard (
+    id_department INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (id_department)
+);
+
+-- migration: 10
+-- Orden por artículo en la lista de productos de la ventana; los demás
+-- órdenes ya tienen índice (sku, marca, stock, fecha de registro).
+CREATE INDEX IF NOT EXISTS idx_product_description
+ON Product (description);
+
+-- migration: 11
+-- El Cambio de procedures.sql asigna todas las columnas (las que no cambian
+-- conservan su valor); el índice de texto sólo se rehace si cambió el
+-- texto.
+DROP TRIGGER IF EXISTS product_search_update;
+
+CREATE TRIGGER IF NOT EXISTS product_search_update
+AFTER UPDATE OF sku, description, brand, model ON Product
+WHEN new.sku <> old.sku OR new.description IS NOT old.description
+OR new.brand IS NOT old.brand OR new.model IS NOT old.model BEGIN
+    INSERT INTO ProductSearch (ProductSearch, rowid, description, brand, model)
+    VALUES ('delete', old.sku, old.description, old.brand, old.model);
+    INSERT INTO ProductSearch (rowid, description, brand, model)
+    VALUES (new.sku, new.description, new.brand, new.model);
+END;
+
+-- migration: 12
+-- search_products() nombra su índice (INDEXED BY). Con un departamento o
+-- con los descontinuados lee índices de una columna, que entregan las filas
+-- en orden de sku y permiten empezar la página en after_sku sin ordenar.
+-- Los candidatos de archive.py pasan a un índice parcial de los
+-- descontinuados por fecha de baja.
+CREATE INDEX IF NOT EXISTS idx_product_department
+ON Product (id_department);
+
+DROP INDEX IF EXISTS idx_product_discontinued;
+
+CREATE INDEX IF NOT EXISTS idx_product_discontinued
+ON Product (discontinued);
+
+CREATE INDEX IF NOT EXISTS idx_product_archive_candidates
+ON Product (record_delete) WHERE discontinued = 1;
@@ -0,0 +1,437 @@
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from database import (
+    PRODUCT_RECORD_FIELDS, ROLLUP_LEVELS, ProductArchived, ProductNotFound,
+    VersionConflict
+)
+from procedures import STATEMENT_CACHE_SIZE
+from rules import (
+    DEFAULT_RECORD_DELETE, PRODUCT_FIELDS, ValidationError, check_product
+)
+from shards import open_database
+
+
+logger = logging.getLogger(__name__)
+
+# Campos que se capturan en Alta y se pueden modificar en Cambio.
+EDITABLE_FIELDS = (
+    "description", "brand", "model", "id_department", "id_class",
+    "id_family", "stock", "quantity"
+)
+SEARCH_FILTERS = {
+    "id_department": int, "id_class": int, "id_family": int, "brand": str,
+    "min_stock": int, "max_stock": int, "discontinued": int, "since": str,
+    "until": str,
+}
+
+
+class NotFound(LookupError):
+    pass
+
+
+class Conflict(ValueError):
+    pass
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _not_writable(error):
+    # Un SKU archivado existe pero hay que restaurarlo (409); uno que ya no
+    # está en ninguna tabla es 404.
+    if error.archived:
+        return Conflict(str(error))
+    return NotFound(str(error))
+
+
+def product_record(row):
+    return dict(zip(PRODUCT_RECORD_FIELDS, row))
+
+
+class ProductService:
+    def __init__(self, db):
+        # Las lecturas corren en el hilo de quien llama; todas las
+        # escrituras se encolan en un único hilo escritor.
+        self.db = db
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="abcc-writer")
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+
+    def _write(self, fn, *args):
+        return self._writer.submit(fn, *args).result()
+
+    def consult(self, sku):
+        rows = self.db.get_product_by_sku(sku)
+        if not rows:
+            raise NotFound(f"El SKU {sku} no existe")
+        return product_record(rows[0])
+
+    def search(self, text=None, after_sku=None, limit=50, **filters):
+        if text:
+            return {
+                "products": [
+                    dict(zip(("sku", "description", "brand", "model"), row))
+                    for row in self.db.search_text(text, limit)
+                ],
+            }
+        rows, next_sku = self.db.search_products(
+            after_sku=after_sku, limit=limit, **filters)
+        return {
+            "products": [product_record(row) for row in rows],
+            "next_after_sku": next_sku,
+        }
+
+    def catalog(self):
+        catalog = self.db.catalog()
+        departments, classes, families = catalog.rows()
+        return {
+            "departments": [
+                {"id": dept_id, "name": name} for dept_id, name in departments],
+            "classes": [
+                {"id_department": dept_id, "id": class_id, "name": name}
+                for dept_id, class_id, name in classes],
+            "families": [
+                {"id_department": dept_id, "id_class": class_id,
+                 "id": family_id, "name": name}
+                for dept_id, class_id, family_id, name in families],
+        }
+
+    def rollups(self, level="department", id_department=None, id_class=None):
+        if level not in ROLLUP_LEVELS:
+            raise ValueError(f"Nivel desconocido: {level}")
+        keys = ROLLUP_LEVELS[level]
+        return {
+            "level": level,
+            "rollups": [
+                dict(zip(
+                    keys + ("products", "stock", "quantity", "discontinued"),
+                    row))
+                for row in self.db.stock_rollup(level, id_department, id_class)
+            ],
+        }
+
+    def add(self, data):
+        return self._write(self._add, data)
+
+    def update(self, sku, data):
+        return self._write(self._update, sku, data)
+
+    def delete(self, sku):
+        return self._write(self._delete, sku)
+
+    def _add(self, data):
+        # Alta: fecha de alta actual, no descontinuado y fecha de baja
+        # 1900-01-01.
+        today = _today()
+        record = {field: data.get(field) for field in EDITABLE_FIELDS}
+        record.update(
+            sku=data.get("sku"), discontinued=0, record_data=today,
+            record_delete=DEFAULT_RECORD_DELETE)
+        values, errors = check_product(record, self.db.catalog(), today)
+        if errors:
+            raise ValidationError(errors)
+
+        # add_product() no inserta si el SKU ya existe.
+        try:
+            added = self.db.add_product(*values)
+        except ProductArchived as e:
+            raise Conflict(str(e)) from e
+        if not added:
+            raise Conflict(f"El SKU {values[0]} ya existe")
+        return self.consult(values[0])
+
+    def _writable(self, sku):
+        # Un producto archivado se consulta pero no se modifica: el Cambio o
+        # la Baja no encontrarían la fila en Product.
+        product = self.consult(sku)
+        if product["archived"]:
+            raise Conflict(str(ProductNotFound(product["sku"], archived=True)))
+        return product
+
+    def _update(self, sku, data):
+        # Cambio: la fecha de alta no se modifica y la fecha de baja pasa al
+        # día actual cuando el producto se marca como descontinuado. Sólo se
+        # escriben los campos que cambian, y únicamente si la fila sigue en
+        # la versión leída (o en la row_version que envía el cliente).
+        today = _today()
+        current = self._writable(sku)
+        record = {field: current[field] for field in EDITABLE_FIELDS}
+        record.update(
+            (field, data[field]) for field in EDITABLE_FIELDS if field in data)
+        record.update(
+            sku=current["sku"], record_data=current["record_data"],
+            record_delete=current["record_delete"],
+            discontinued=data.get("discontinued", current["discontinued"]))
+
+        discontinued = str(record["discontinued"]).lower() in ("1", "true")
+        if discontinued and not current["discontinued"]:
+            record["record_delete"] = today
+        values, errors = check_product(record, self.db.catalog(), today)
+        if errors:
+            raise ValidationError(errors)
+
+        changes = {
+            field: value for field, value in zip(PRODUCT_FIELDS, values)
+            if field != "sku" and value != current[field]
+        }
+        if not changes:
+            return current
+        try:
+            self.db.update_product(
+                current["sku"], **changes,
+                expected_version=int(
+                    data.get("row_version", current["row_version"])))
+        except VersionConflict as e:
+            raise Conflict(str(e)) from e
+        except ProductNotFound as e:
+            # Se archivó o se borró después de consultarlo.
+            raise _not_writable(e) from e
+        return self.consult(sku)
+
+    def _delete(self, sku):
+        product = self._writable(sku)
+        try:
+            self.db.delete_product(product["sku"])
+        except ProductNotFound as e:
+            raise _not_writable(e) from e
+        return {"deleted": product["sku"]}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantiene la conexión abierta entre peticiones.
+    protocol_version = "HTTP/1.1"
+    server_version = "ABCC/1.0"
+    timeout = 30
+    # Con keep-alive, Nagle más el ACK retrasado agregan ~40 ms por
+    # respuesta, porque encabezados y cuerpo se envían por separado.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def finish(self):
+        # Cada conexión HTTP usa su propio hilo; al cerrarla se devuelve al
+        # pool la conexión SQLite de ese hilo.
+        try:
+            super().finish()
+        finally:
+            self.server.service.db.pool.release()
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        data = json.loads(self.rfile.read(length))
+        if not isinstance(data, dict):
+            raise ValueError("Se esperaba un objeto JSON")
+        return data
+
+    def _send(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _dispatch(self, method):
+        service = self.server.service
+        url = urlsplit(self.path)
+        segments = [segment for segment in url.path.split("/") if segment]
+        try:
+            if segments == ["health"] and method == "GET":
+                self._send(200, {"status": "ok"})
+            elif segments == ["catalog"] and method == "GET":
+                self._send(200, service.catalog())
+            elif segments == ["rollups"] and method == "GET":
+                self._send(200, service.rollups(**self._rollup_params(url.query)))
+            elif segments == ["products"] and method == "GET":
+                self._send(200, service.search(**self._search_params(url.query)))
+            elif segments == ["products"] and method == "POST":
+                self._send(201, service.add(self._read_json()))
+            elif len(segments) == 2 and segments[0] == "products":
+                sku = segments[1]
+                if method == "GET":
+                    self._send(200, service.consult(sku))
+                elif method == "PUT":
+                    self._send(200, service.update(sku, self._read_json()))
+                elif method == "DELETE":
+                    self._send(200, service.delete(sku))
+                else:
+                    self._send(405, {"error": "Método no permitido"})
+            else:
+                self._send(404, {"error": "Ruta inexistente"})
+        except NotFound as e:
+            self._send(404, {"error": str(e)})
+        except Conflict as e:
+            self._send(409, {"error": str(e)})
+        except ValidationError as e:
+            self._send(422, {"errors": [
+                {"field": field, "message": message}
+                for field, message in e.errors]})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except sqlite3.Error as e:
+            logger.exception("Error de base de datos")
+            self._send(503, {"error": str(e)})
+
+    def _rollup_params(self, query):
+        params = {key: values[-1] for key, values in parse_qs(query).items()}
+        rollup = {"level": params.pop("level", "department")}
+        for key in ("id_department", "id_class"):
+            if key in params:
+                rollup[key] = int(params.pop(key))
+        if params:
+            raise ValueError(f"Parámetro desconocido: {', '.join(params)}")
+        return rollup
+
+    def _search_params(self, query):
+        params = {key: values[-1] for key, values in parse_qs(query).items()}
+        search = {
+            "text": params.pop("q", None),
+            "limit": min(int(params.pop("limit", 50)), 500),
+        }
+        if "after_sku" in params:
+            search["after_sku"] = int(params.pop("after_sku"))
+        for key, value in params.items():
+            if key not in SEARCH_FILTERS:
+                raise ValueError(f"Filtro desconocido: {key}")
+            search[key] = SEARCH_FILTERS[key](value)
+        return search
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        self.service = service
+        super().__init__(address, ServiceHandler)
+
+
+def _parse_pairs(pairs):
+    data = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"Se esperaba campo=valor: {pair}")
+        data[key] = value
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Alta, baja, cambio y consulta de productos sin interfaz "
+                    "gráfica.")
+    parser.add_argument("--db", default="data.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Servicio HTTP/JSON.")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument(
+        "--max-connections", type=int, default=32,
+        help="Conexiones SQLite simultáneas (una por conexión HTTP activa).")
+    serve_parser.add_argument(
+        "--statement-cache", type=int, default=STATEMENT_CACHE_SIZE,
+        help="Sentencias preparadas que conserva cada conexión.")
+
+    get_parser = subparsers.add_parser("get", help="Consulta un SKU.")
+    get_parser.add_argument("sku")
+
+    add_parser = subparsers.add_parser("add", help="Alta: campo=valor ...")
+    add_parser.add_argument("fields", nargs="+")
+
+    update_parser = subparsers.add_parser(
+        "update", help="Cambio: SKU campo=valor ...")
+    update_parser.add_argument("sku")
+    update_parser.add_argument("fields", nargs="+")
+
+    delete_parser = subparsers.add_parser("delete", help="Baja de un SKU.")
+    delete_parser.add_argument("sku")
+    delete_parser.add_argument(
+        "--yes", action="store_true", help="Confirma la eliminación.")
+
+    search_parser = subparsers.add_parser(
+        "search", help="Busca por texto o por filtros campo=valor.")
+    search_parser.add_argument("terms", nargs="*")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "serve":
+        db = open_database(
+            args.db, max_connections=args.max_connections,
+            statement_cache=args.statement_cache)
+    else:
+        db = open_database(args.db)
+    service = ProductService(db)
+
+    try:
+        if args.command == "serve":
+            server = ServiceServer((args.host, args.port), service)
+            logger.info("Escuchando en http://%s:%s", args.host, args.port)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return 0
+
+        if args.command == "get":
+            result = service.consult(args.sku)
+        elif args.command == "add":
+            result = service.add(_parse_pairs(args.fields))
+        elif args.command == "update":
+            result = service.update(args.sku, _parse_pairs(args.fields))
+        elif args.command == "delete":
+            if not args.yes:
+                print("Use --yes para confirmar la eliminación.", file=sys.stderr)
+                return 2
+            result = service.delete(args.sku)
+        else:
+            filters = _parse_pairs(t for t in args.terms if "=" in t)
+            text = " ".join(t for t in args.terms if "=" not in t)
+            result = service.search(
+                text=text or None,
+                **{key: SEARCH_FILTERS[key](value)
+                   for key, value in filters.items()})
+    except (NotFound, Conflict) as e:
+        print(e, file=sys.stderr)
+        return 1
+    except ValidationError as e:
+        for field, message in e.errors:
+            print(f"{field}: {message}", file=sys.stderr)
+        return 1
+    finally:
+        service.close()
+        db.close()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,605 @@
+import argparse
+import heapq
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import chain, islice
+
+from database import (
+    ROLLUP_LEVELS, UPDATABLE_FIELDS, DatabaseManager, ProductArchived,
+    ProductNotFound, VersionConflict, browse_sort_key, product_key,
+    split_statements
+)
+from procedures import STATEMENT_CACHE_SIZE
+from rules import PRODUCT_FIELDS, ValidationError
+from skuindex import SkuIndex
+
+
+logger = logging.getLogger(__name__)
+
+SQL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql.sql")
+
+PRODUCT_COLUMNS = PRODUCT_FIELDS + ("row_version",)
+ARCHIVE_COLUMNS = PRODUCT_COLUMNS + ("archived_at",)
+CATALOG_COPY = (
+    ("Department", "id, name"),
+    ("Class", "id_department, id, name"),
+    ("Family", "id_department, id_class, id, name"),
+)
+
+
+def shard_file(db_file, id_department):
+    # data.db -> data.d3.db, junto al archivo principal.
+    base, extension = os.path.splitext(db_file)
+    return f"{base}.d{id_department}{extension or '.db'}"
+
+
+def shard_paths(db_file):
+    # {departamento: ruta} registrados en la tabla Shard; vacío en el modo
+    # de un solo archivo o si el esquema todavía no tiene la tabla.
+    if not os.path.exists(db_file):
+        return {}
+    directory = os.path.dirname(os.path.abspath(db_file))
+    with closing(sqlite3.connect(db_file)) as conn:
+        try:
+            rows = conn.execute("SELECT id_department, path FROM Shard").fetchall()
+        except sqlite3.OperationalError:
+            return {}
+    return {dept: os.path.join(directory, path) for dept, path in rows}
+
+
+def single_file_error(db_file, tool):
+    # Mensaje para las herramientas que trabajan sobre un solo archivo de
+    # productos cuando db_file es el archivo principal de una base con
+    # shards (su tabla Product está vacía); None si no tiene shards.
+    shards = shard_paths(db_file)
+    if not shards:
+        return None
+    files = ", ".join(f"--db {path}" for _, path in sorted(shards.items()))
+    return (f"{db_file} tiene un archivo de productos por departamento; "
+            f"ejecute {tool} sobre cada uno ({files}).")
+
+
+def open_database(db_file, **options):
+    # Devuelve un ShardedDatabaseManager si data.db tiene shards registrados
+    # y un DatabaseManager en otro caso; ambos tienen la misma interfaz para
+    # la ventana y el servicio.
+    shards = shard_paths(db_file)
+    if shards:
+        return ShardedDatabaseManager(db_file, shards, **options)
+    return DatabaseManager(db_file, **options)
+
+
+class _PoolGroup:
+    # ServiceHandler llama a db.pool.release() al cerrar cada conexión HTTP.
+    def __init__(self, managers):
+        self.managers = managers
+
+    def release(self):
+        for manager in self.managers:
+            manager.pool.release()
+
+
+class ShardedDatabaseManager:
+    def __init__(
+        self, db_file, shards, profile="default", max_connections=8,
+        bootstrap=True, cache_size=1024, cache_ttl=None, metrics=None,
+        statement_cache=STATEMENT_CACHE_SIZE
+    ):
+        # data.db conserva el catálogo y la tabla Shard; los productos de
+        # cada departamento viven en su propio archivo, con su propio candado
+        # de escritura.
+        self.db_file = db_file
+        self.metrics = metrics
+        self._options = dict(
+            profile=profile, max_connections=max_connections,
+            cache_size=cache_size, cache_ttl=cache_ttl, metrics=metrics,
+            statement_cache=statement_cache)
+        self.router = DatabaseManager(
+            db_file, profile=profile, max_connections=max_connections,
+            bootstrap=False, cache_size=0, metrics=metrics,
+            statement_cache=statement_cache)
+        self.shards = {
+            dept: DatabaseManager(path, bootstrap=False, **self._options)
+            for dept, path in sorted(shards.items())
+        }
+        self.pool = _PoolGroup([self.router, *self.shards.values()])
+        self._executor = ThreadPoolExecutor(
+            max(len(self.shards), 1), thread_name_prefix="abcc-shard")
+
+        if bootstrap:
+            self.ensure_schema()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for manager in (self.router, *self.shards.values()):
+            manager.close()
+
+    def shard(self, id_department):
+        try:
+            return self.shards[int(id_department)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(
+                f"El departamento {id_department} no tiene archivo de "
+                f"productos") from None
+
+    def _gather(self, fn, managers=None):
+        # Ejecuta fn(manager) en paralelo en cada shard, en orden de
+        # departamento.
+        managers = list(self.shards.values() if managers is None else managers)
+        if self.metrics is None:
+            return list(self._executor.map(fn, managers))
+        with self.metrics.time("abcc_scatter_gather_seconds"):
+            return list(self._executor.map(fn, managers))
+
+    def ensure_schema(self):
+        version = self.router.ensure_schema()
+        self._gather(lambda manager: manager.ensure_schema())
+        self.sync_catalog()
+        return version
+
+    def sync_catalog(self):
+        # Copia Departamento/Clase/Familia de data.db a los shards que
+        # difieran. Devuelve cuántos shards se actualizaron.
+        rows = self.router.catalog().rows()
+        updated = 0
+        for manager in self.shards.values():
+            if manager.catalog().rows() == rows:
+                continue
+            with manager.transaction() as conn:
+                for (table, columns), table_rows in zip(CATALOG_COPY, rows):
+                    conn.execute(f"DELETE FROM {table}")
+                    placeholders = ", ".join("?" for _ in columns.split(","))
+                    conn.executemany(
+                        f"INSERT INTO {table} ({columns}) "
+                        f"VALUES ({placeholders})", table_rows)
+            updated += 1
+        return updated
+
+    def catalog(self, refresh=False):
+        return self.router.catalog(refresh)
+
+    def generate_hierarchical_data(self):
+        return self.router.generate_hierarchical_data()
+
+    # Directorio SKU -> departamento: el índice de SKU en memoria de cada
+    # shard, que se pone al día con su SkuLog.
+
+    def shard_for(self, sku, refresh=False):
+        if refresh:
+            self.refresh_sku_index()
+        for dept, manager in self.shards.items():
+            if manager.sku_index().contains(sku):
+                return dept
+        return None
+
+    def _route(self, sku):
+        key = product_key(sku)
+        if not isinstance(key, int):
+            return None
+        dept = self.shard_for(key)
+        if dept is None:
+            # Puede ser un alta reciente de otro proceso.
+            dept = self.shard_for(key, refresh=True)
+        return dept
+
+    def sku_index(self):
+        return SkuIndex.union(
+            manager.sku_index() for manager in self.shards.values())
+
+    def refresh_sku_index(self):
+        return sum(self._gather(lambda manager: manager.refresh_sku_index()))
+
+    def sku_exists(self, sku):
+        found = [manager.sku_exists(sku) for manager in self.shards.values()]
+        if any(found):
+            return True
+        return None if None in found else False
+
+    def next_free_sku(self, start=1):
+        self.refresh_sku_index()
+        return self.sku_index().next_free(start)
+
+    def sku_occupancy(self, low, high):
+        self.refresh_sku_index()
+        return self.sku_index().occupancy(low, high)
+
+    def get_product_by_sku(self, sku):
+        dept = self._route(sku)
+        if dept is not None:
+            rows = self.shards[dept].get_product_by_sku(sku)
+            if rows:
+                return rows
+        # Un SKU archivado ya no está en el índice de su shard.
+        for rows in self._gather(lambda manager: manager.get_product_by_sku(sku)):
+            if rows:
+                return rows
+        return []
+
+    def add_product(
+        self, sku, description, id_department, id_class, id_family, stock,
+        quantity, record_delete, model, brand, record_data, discontinued
+    ):
+        shard = self.shard(id_department)
+        # El SKU es único entre todos los shards.
+        if self.shard_for(product_key(sku), refresh=True) is not None:
+            return False
+        # El archivo puede estar en el shard de otro departamento.
+        if self.is_archived(sku):
+            raise ProductArchived(sku)
+        return shard.add_product(
+            sku, description, id_department, id_class, id_family, stock,
+            quantity, record_delete, model, brand, record_data, discontinued)
+
+    def update_product(self, sku, *args, expected_version=None, **changes):
+        changes.update(zip(UPDATABLE_FIELDS, args))
+        dept = self._route(sku)
+        if dept is None:
+            raise ProductNotFound(sku, self.is_archived(sku))
+        target = changes.get("id_department")
+        if target is None or int(target) == dept:
+            return self.shards[dept].update_product(
+                sku, expected_version=expected_version, **changes)
+        return self._move_product(sku, dept, int(target), changes,
+                                  expected_version)
+
+    def _move_product(self, sku, dept, target, changes, expected_version):
+        # Cambio de departamento: la fila pasa de un archivo a otro. Se
+        # inserta primero en el destino; si algo falla entre ambos pasos
+        # queda duplicada (verify lo reporta), nunca perdida.
+        source, destination = self.shards[dept], self.shard(target)
+        columns = ", ".join(PRODUCT_COLUMNS)
+        with source.transaction() as conn:
+            row = conn.execute(
+                f"SELECT {columns} FROM Product WHERE sku = ?", (sku,)
+            ).fetchone()
+            if row is None:
+                raise ProductNotFound(sku, source.is_archived(sku))
+            record = dict(zip(PRODUCT_COLUMNS, row))
+            if expected_version is not None \
+                    and record["row_version"] != expected_version:
+                raise VersionConflict(
+                    sku, expected_version, record["row_version"])
+            # Como en product_update, un campo en None conserva su valor.
+            record.update(
+                (field, value) for field, value in changes.items()
+                if value is not None)
+            record["row_version"] += 1
+            if int(record["quantity"]) > int(record["stock"]):
+                raise ValidationError(
+                    [("quantity", "la cantidad no debe ser mayor al stock")])
+
+            placeholders = ", ".join("?" for _ in PRODUCT_COLUMNS)
+            destination.execute(
+                f"INSERT INTO Product ({columns}) VALUES ({placeholders})",
+                [record[column] for column in PRODUCT_COLUMNS])
+            conn.execute("DELETE FROM Product WHERE sku = ?", (sku,))
+
+        key = product_key(sku)
+        source.product_cache.invalidate(key)
+        destination.product_cache.invalidate(key)
+        source.refresh_sku_index()
+        destination.refresh_sku_index()
+        return 1
+
+    def delete_product(self, sku):
+        dept = self._route(sku)
+        if dept is None:
+            raise ProductNotFound(sku, self.is_archived(sku))
+        self.shards[dept].delete_product(sku)
+
+    def is_archived(self, sku):
+        return any(self._gather(lambda manager: manager.is_archived(sku)))
+
+    def archived_skus(self, skus):
+        skus = list(skus)
+        return set().union(
+            *self._gather(lambda manager: manager.archived_skus(skus)))
+
+    def apply_movements(self, movements, batch_size=1000, on_reject=None):
+        # Cada lote se reparte por shard y los shards lo aplican en
+        # paralelo. Los rechazos se entregan en el hilo que llama.
+        applied = rejected = 0
+        iterator = iter(movements)
+        while True:
+            batch = [m for _, m in zip(range(batch_size), iterator)]
+            if not batch:
+                return applied, rejected
+
+            groups = {}
+            for movement in batch:
+                dept = self._route(movement[0])
+                if dept is None:
+                    rejected += 1
+                    if on_reject is not None:
+                        on_reject(movement, "sku", "el SKU no existe")
+                else:
+                    groups.setdefault(dept, []).append(movement)
+
+            def apply(dept):
+                rejects = []
+                counts = self.shards[dept].apply_movements(
+                    groups[dept], batch_size,
+                    on_reject=lambda *reject: rejects.append(reject))
+                return counts, rejects
+
+            for (done, failed), rejects in self._executor.map(apply, groups):
+                applied += done
+                rejected += failed
+                if on_reject is not None:
+                    for reject in rejects:
+                        on_reject(*reject)
+
+    def search_products(self, after_sku=None, limit=50, **filters):
+        if filters.get("id_department") is not None:
+            dept = int(filters["id_department"])
+            if dept not in self.shards:
+                return [], None
+            return self.shards[dept].search_products(after_sku, limit, **filters)
+
+        # Cada shard devuelve su propia página ordenada por SKU; las primeras
+        # `limit` filas de la mezcla son la página global.
+        pages = self._gather(lambda manager: manager.search_products(
+            after_sku, limit, **filters)[0])
+        rows = list(islice(heapq.merge(*pages, key=lambda row: row[0]), limit))
+        next_sku = rows[-1][0] if len(rows) == limit else None
+        return rows, next_sku
+
+    def browse_products(
+        self, key=None, limit=100, sort="sku", descending=False,
+        backward=False, **filters
+    ):
+        if filters.get("id_department") is not None:
+            dept = int(filters["id_department"])
+            if dept not in self.shards:
+                return []
+            return self.shards[dept].browse_products(
+                key, limit, sort, descending, backward, **filters)
+        pages = self._gather(lambda manager: manager.browse_products(
+            key, limit, sort, descending, backward, **filters))
+        rows = list(heapq.merge(
+            *pages, key=lambda row: browse_sort_key(row, sort),
+            reverse=descending))
+        # Hacia atrás interesan las filas más cercanas a la llave.
+        return rows[-limit:] if backward else rows[:limit]
+
+    def count_products(self, cap=10000, **filters):
+        if filters.get("id_department") is not None:
+            dept = int(filters["id_department"])
+            if dept not in self.shards:
+                return 0, True
+            return self.shards[dept].count_products(cap, **filters)
+        counts = self._gather(
+            lambda manager: manager.count_products(cap, **filters))
+        total = sum(count for count, _ in counts)
+        return min(total, cap), total <= cap and all(exact for _, exact in counts)
+
+    def search_text_ranked(self, text, limit=20):
+        # bm25 depende de las estadísticas de cada shard, así que el orden
+        # entre shards es aproximado.
+        results = self._gather(
+            lambda manager: manager.search_text_ranked(text, limit))
+        return list(islice(
+            heapq.merge(*results, key=lambda row: row[0]), limit))
+
+    def search_text(self, text, limit=20):
+        return [row[1:] for row in self.search_text_ranked(text, limit)]
+
+    def stock_rollup(self, level="department", id_department=None,
+                     id_class=None):
+        if id_department is not None:
+            dept = int(id_department)
+            if dept not in self.shards:
+                return []
+            return self.shards[dept].stock_rollup(level, dept, id_class)
+        size = len(ROLLUP_LEVELS[level])
+        results = self._gather(
+            lambda manager: manager.stock_rollup(level, None, id_class))
+        return sorted(chain(*results), key=lambda row: row[:size])
+
+    def verify_rollups(self):
+        return list(chain(*self._gather(
+            lambda manager: manager.verify_rollups())))
+
+    def rebuild_rollups(self):
+        return sum(self._gather(lambda manager: manager.rebuild_rollups()))
+
+    def verify(self):
+        # Problemas de la distribución: SKU repetidos entre shards y filas
+        # cuyo departamento no corresponde a su archivo.
+        problems = []
+        self.refresh_sku_index()
+        indexes = [manager.sku_index() for manager in self.shards.values()]
+        duplicates = sum(index.count for index in indexes) \
+            - SkuIndex.union(indexes).count
+        if duplicates:
+            problems.append(f"{duplicates} SKU están en más de un shard")
+        for dept, manager in self.shards.items():
+            misplaced = manager.query(
+                "SELECT count(*) FROM Product WHERE id_department <> ?",
+                (dept,))[0][0]
+            if misplaced:
+                problems.append(
+                    f"Shard {dept}: {misplaced} productos de otro departamento")
+        if self.sync_catalog():
+            problems.append("Había shards con el catálogo desactualizado "
+                            "(ya se copiaron)")
+        return problems
+
+
+def base_table_statements(path=SQL_FILE):
+    # Las tablas de sql.sql, sin los datos de ejemplo; schema.sql agrega el
+    # resto al abrir la base.
+    with open(path, encoding="utf-8") as fh:
+        statements = split_statements(fh.read())
+    return [s for s in statements if s.upper().startswith("CREATE TABLE")]
+
+
+def _remove_database_files(path):
+    for suffix in ("", "-wal", "-shm", ".catalog.json"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def create_shard(db_file, path, id_department):
+    # Archivo nuevo con el esquema completo, el catálogo de data.db y los
+    # productos (vivos y archivados) del departamento.
+    _remove_database_files(path)
+    with closing(sqlite3.connect(path, isolation_level=None)) as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("BEGIN")
+        for statement in base_table_statements():
+            conn.execute(statement)
+        conn.execute("COMMIT")
+    DatabaseManager(path, cache_size=0).close()
+
+    product_columns = ", ".join(PRODUCT_COLUMNS)
+    archive_columns = ", ".join(ARCHIVE_COLUMNS)
+    with closing(sqlite3.connect(path, isolation_level=None)) as conn:
+        conn.execute("ATTACH DATABASE ? AS source", (db_file,))
+        conn.execute("BEGIN IMMEDIATE")
+        for table, columns in CATALOG_COPY:
+            conn.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT {columns} FROM source.{table}")
+        copied = conn.execute(
+            f"INSERT INTO Product ({product_columns}) "
+            f"SELECT {product_columns} FROM source.Product "
+            f"WHERE id_department = ?", (id_department,)).rowcount
+        conn.execute(
+            f"INSERT INTO ProductArchive ({archive_columns}) "
+            f"SELECT {archive_columns} FROM source.ProductArchive "
+            f"WHERE id_department = ?", (id_department,))
+        # El shard empieza sin historia propia.
+        conn.execute("DELETE FROM ChangeJournal")
+        conn.execute("DELETE FROM SkuLog")
+        conn.execute("COMMIT")
+        conn.execute("DETACH DATABASE source")
+    return copied
+
+
+def split_database(db_file):
+    # Crea un archivo por departamento y, al final, registra los shards y
+    # vacía Product en data.db en una sola transacción. Si se interrumpe
+    # antes, data.db queda como estaba y se puede repetir.
+    router = DatabaseManager(db_file)
+    try:
+        if router.query("SELECT count(*) FROM Shard")[0][0]:
+            raise ValueError(f"{db_file} ya está dividida en shards")
+        departments = sorted(
+            {dept for dept, in router.query("SELECT id FROM Department")}
+            | {dept for dept, in router.query(
+                "SELECT DISTINCT id_department FROM Product")}
+            | {dept for dept, in router.query(
+                "SELECT DISTINCT id_department FROM ProductArchive")})
+    finally:
+        router.close()
+
+    copied = {}
+    for dept in departments:
+        path = shard_file(db_file, dept)
+        copied[dept] = create_shard(db_file, path, dept)
+        logger.info("Departamento %s: %d productos en %s",
+                    dept, copied[dept], path)
+
+    with closing(sqlite3.connect(db_file, isolation_level=None,
+                                 timeout=30)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT INTO Shard (id_department, path) VALUES (?, ?)",
+            [(dept, os.path.basename(shard_file(db_file, dept)))
+             for dept in departments])
+        conn.execute("DELETE FROM ProductArchive")
+        conn.execute("DELETE FROM Product")
+        conn.execute("COMMIT")
+    return copied
+
+
+def merge_database(db_file, keep_files=False):
+    # Devuelve los productos de cada shard a data.db, un departamento por
+    # transacción; si se interrumpe, repetirlo continúa con los que faltan.
+    # Devuelve {departamento: (copiados, omitidos por SKU repetido)}.
+    shards = shard_paths(db_file)
+    if not shards:
+        raise ValueError(f"{db_file} no está dividida en shards")
+    product_columns = ", ".join(PRODUCT_COLUMNS)
+    archive_columns = ", ".join(ARCHIVE_COLUMNS)
+    merged = {}
+    with closing(sqlite3.connect(db_file, isolation_level=None,
+                                 timeout=30)) as conn:
+        for dept, path in sorted(shards.items()):
+            conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            conn.execute("BEGIN IMMEDIATE")
+            total = conn.execute(
+                "SELECT count(*) FROM shard.Product").fetchone()[0]
+            copied = conn.execute(
+                f"INSERT INTO Product ({product_columns}) "
+                f"SELECT {product_columns} FROM shard.Product "
+                f"WHERE true ON CONFLICT (sku) DO NOTHING").rowcount
+            conn.execute(
+                f"INSERT INTO ProductArchive ({archive_columns}) "
+                f"SELECT {archive_columns} FROM shard.ProductArchive "
+                f"WHERE true ON CONFLICT (sku) DO NOTHING")
+            conn.execute("DELETE FROM Shard WHERE id_department = ?", (dept,))
+            conn.execute("COMMIT")
+            conn.execute("DETACH DATABASE shard")
+            merged[dept] = (copied, total - copied)
+            if not keep_files:
+                _remove_database_files(path)
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Divide la base de productos en un archivo por "
+                    "departamento o la vuelve a unir.")
+    parser.add_argument("--db", default="data.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "split", help="Un archivo de productos por departamento.")
+    merge_parser = subparsers.add_parser(
+        "merge", help="Regresa todos los productos a --db.")
+    merge_parser.add_argument(
+        "--keep-files", action="store_true",
+        help="No borra los archivos de los shards.")
+    subparsers.add_parser(
+        "status", help="Productos por shard y revisión de la distribución.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    if args.command == "split":
+        copied = split_database(args.db)
+        print(f"{sum(copied.values())} productos en {len(copied)} shards "
+              f"({time.perf_counter() - started:.1f} s)")
+        return 0
+    if args.command == "merge":
+        merged = merge_database(args.db, args.keep_files)
+        for dept, (copied, skipped) in merged.items():
+            print(f"Departamento {dept}: {copied} productos"
+                  + (f", {skipped} SKU repetidos omitidos" if skipped else ""))
+        return 0
+
+    db = open_database(args.db)
+    try:
+        if not isinstance(db, ShardedDatabaseManager):
+            print(f"{args.db} usa un solo archivo.")
+            return 0
+        for dept, manager in db.shards.items():
+            count = manager.query("SELECT count(*) FROM Product")[0][0]
+            print(f"Departamento {dept}: {count} productos en "
+                  f"{manager.db_file}")
+        problems = db.verify()
+        for problem in problems:
+            print(problem)
+        return 1 if problems else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
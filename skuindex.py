@@ -0,0 +1,111 @@
+import re
+import threading
+
+from rules import SKU_DIGITS
+
+
+SKU_SPACE = 10 ** SKU_DIGITS
+
+_NOT_FULL = re.compile(rb"[^\xff]")
+
+
+class SkuIndex:
+    def __init__(self, size=SKU_SPACE):
+        # Un bit por SKU posible: 1,000,000 de SKU caben en 125 KB.
+        self.size = size
+        self.count = 0
+        self.last_seq = 0
+        self._bits = bytearray((size + 7) // 8)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def union(cls, indexes):
+        # Índice con los SKU presentes en cualquiera de `indexes`.
+        indexes = list(indexes)
+        index = cls(indexes[0].size if indexes else SKU_SPACE)
+        combined = 0
+        for other in indexes:
+            combined |= int.from_bytes(other._bits, "little")
+        index._bits = bytearray(combined.to_bytes(len(index._bits), "little"))
+        index.count = combined.bit_count()
+        index.last_seq = None
+        return index
+
+    def __contains__(self, sku):
+        return self.contains(sku)
+
+    def __len__(self):
+        return self.count
+
+    def contains(self, sku):
+        sku = int(sku)
+        if not 0 <= sku < self.size:
+            return False
+        return bool(self._bits[sku >> 3] & (1 << (sku & 7)))
+
+    def add(self, sku):
+        sku = int(sku)
+        if not 0 <= sku < self.size:
+            return False
+        with self._lock:
+            byte, mask = sku >> 3, 1 << (sku & 7)
+            if self._bits[byte] & mask:
+                return False
+            self._bits[byte] |= mask
+            self.count += 1
+        return True
+
+    def discard(self, sku):
+        sku = int(sku)
+        if not 0 <= sku < self.size:
+            return False
+        with self._lock:
+            byte, mask = sku >> 3, 1 << (sku & 7)
+            if not self._bits[byte] & mask:
+                return False
+            self._bits[byte] &= ~mask & 0xFF
+            self.count -= 1
+        return True
+
+    def load(self, skus):
+        bits = bytearray(len(self._bits))
+        count = 0
+        for sku in skus:
+            if 0 <= sku < self.size:
+                byte, mask = sku >> 3, 1 << (sku & 7)
+                if not bits[byte] & mask:
+                    bits[byte] |= mask
+                    count += 1
+        with self._lock:
+            self._bits = bits
+            self.count = count
+
+    def next_free(self, start=1):
+        # La búsqueda del primer byte con un bit libre corre en C sobre el
+        # arreglo; dentro del byte se revisan a lo más ocho bits.
+        start = max(int(start), 0)
+        if start >= self.size:
+            return None
+        bits = self._bits
+        byte = start >> 3
+        value = bits[byte] | ((1 << (start & 7)) - 1)
+        if value == 0xFF:
+            match = _NOT_FULL.search(bits, byte + 1)
+            if match is None:
+                return None
+            byte = match.start()
+            value = bits[byte]
+        sku = (byte << 3) + ((~value & (value + 1)).bit_length() - 1)
+        return sku if sku < self.size else None
+
+    def occupancy(self, low, high):
+        # Cantidad de SKU ocupados en el rango cerrado [low, high].
+        low = max(int(low), 0)
+        high = min(int(high), self.size - 1)
+        if low > high:
+            return 0
+        first, last = low >> 3, high >> 3
+        chunk = int.from_bytes(self._bits[first:last + 1], "little")
+        chunk >>= low & 7
+        chunk &= (1 << (high - low + 1)) - 1
+        return chunk.bit_count()
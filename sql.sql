@@ -1,8 +1,20 @@
 -- Create Tables
-DROP TABLE Department;
-DROP TABLE Class;
-DROP TABLE Product;
-DROP TABLE Family;
+-- auto_vacuum sólo se aplica si la base todavía no tiene tablas.
+PRAGMA auto_vacuum = INCREMENTAL;
+-- Los objetos de schema.sql se vuelven a aplicar al abrir la base.
+-- Las operaciones de Alta, Baja, Cambio y Consulta están en procedures.sql.
+PRAGMA user_version = 0;
+DROP TABLE IF EXISTS CatalogVersion;
+DROP TABLE IF EXISTS SkuLog;
+DROP TABLE IF EXISTS ProductRollup;
+DROP TABLE IF EXISTS ProductArchive;
+DROP TABLE IF EXISTS ChangeJournal;
+DROP TABLE IF EXISTS ReplicaCursor;
+DROP TABLE IF EXISTS Shard;
+DROP TABLE IF EXISTS Department;
+DROP TABLE IF EXISTS Class;
+DROP TABLE IF EXISTS Product;
+DROP TABLE IF EXISTS Family;
 
 CREATE TABLE IF NOT EXISTS Department (
     id INTEGER NOT NULL,
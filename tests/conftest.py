@@ -0,0 +1,28 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate_catalog  # noqa: E402
+from database import DatabaseManager  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def catalog_file(tmp_path_factory):
+    # Catálogo sintético de benchmark.py, con ANALYZE, para que los planes
+    # dependan de estadísticas como en una base real.
+    path = tmp_path_factory.mktemp("catalog") / "catalog.db"
+    generate_catalog(str(path), 2000)
+    return str(path)
+
+
+@pytest.fixture
+def db(catalog_file, tmp_path):
+    path = tmp_path / "data.db"
+    shutil.copy(catalog_file, path)
+    manager = DatabaseManager(str(path), bootstrap=False)
+    yield manager
+    manager.close()
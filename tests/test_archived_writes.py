@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from archive import ARCHIVE_COLUMNS, restore_product
+from bulk import import_products
+from database import ProductArchived, ProductNotFound
+from rules import PRODUCT_FIELDS
+from service import Conflict, NotFound, ProductService
+
+
+SKU = 5
+
+
+@pytest.fixture
+def archived(db):
+    with db.transaction() as conn:
+        conn.execute(f"""
+            INSERT INTO ProductArchive ({ARCHIVE_COLUMNS}, archived_at)
+            SELECT {ARCHIVE_COLUMNS}, '2026-01-01' FROM Product WHERE sku = ?
+        """, (SKU,))
+        conn.execute("DELETE FROM Product WHERE sku = ?", (SKU,))
+    db.product_cache.clear()
+    return db
+
+
+@pytest.fixture
+def service(archived):
+    service = ProductService(archived)
+    yield service
+    service.close()
+
+
+def test_update_of_archived_sku_raises(archived):
+    with pytest.raises(ProductNotFound) as error:
+        archived.update_product(SKU, description="NUEVO")
+    assert error.value.archived
+
+
+def test_delete_of_archived_sku_raises(archived):
+    with pytest.raises(ProductNotFound) as error:
+        archived.delete_product(SKU)
+    assert error.value.archived
+
+
+def test_write_to_missing_sku_raises(db):
+    with pytest.raises(ProductNotFound) as error:
+        db.update_product(999999, description="NUEVO")
+    assert not error.value.archived
+    with pytest.raises(ProductNotFound):
+        db.delete_product(999999)
+
+
+def test_service_rejects_archived_sku(service):
+    with pytest.raises(Conflict):
+        service._update(SKU, {"description": "NUEVO"})
+    with pytest.raises(Conflict):
+        service._delete(SKU)
+    with pytest.raises(NotFound):
+        service._delete(999999)
+
+
+def test_restored_sku_is_writable(archived):
+    assert restore_product(archived, SKU)
+    assert archived.update_product(SKU, description="NUEVO") == 1
+    assert archived.get_product_by_sku(SKU)[0].description == "NUEVO"
+
+
+def product_values(db, sku):
+    row = db.get_product_by_sku(sku)[0]
+    return [getattr(row, field) for field in PRODUCT_FIELDS]
+
+
+def test_alta_of_archived_sku_is_rejected(archived):
+    values = product_values(archived, SKU)
+    with pytest.raises(ProductArchived):
+        archived.add_product(*values)
+    assert archived.get_product_by_sku(SKU)[0].archived
+    assert restore_product(archived, SKU)
+
+
+def test_service_alta_of_archived_sku_is_a_conflict(service):
+    record = dict(zip(PRODUCT_FIELDS, product_values(service.db, SKU)))
+    with pytest.raises(Conflict):
+        service._add(record)
+
+
+@pytest.mark.parametrize("mode", ["insert", "upsert", "replace"])
+def test_import_rejects_archived_sku(archived, tmp_path, mode):
+    path = tmp_path / "products.jsonl"
+    fresh = product_values(archived, SKU + 1)
+    fresh[0] = 999999
+    with open(path, "w", encoding="utf-8") as fh:
+        for values in (product_values(archived, SKU), fresh):
+            fh.write(json.dumps(dict(zip(PRODUCT_FIELDS, values))) + "\n")
+
+    report = import_products(archived, str(path), mode=mode)
+    assert report.rejected == 1
+    assert report.samples[0][:2] == (1, "sku")
+    assert report.written == 1
+    assert archived.get_product_by_sku(SKU)[0].archived
+    assert restore_product(archived, SKU)
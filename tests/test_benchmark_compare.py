@@ -0,0 +1,42 @@
+from benchmark import compare, incomparable
+
+
+def report(calibration, ops_per_sec, p95_ms, **meta):
+    return {
+        "meta": {
+            "python": "3.11.7", "sqlite": "3.40.1", "seed": 0, "ops": 2000,
+            "readers": 4, "duration": 3.0, "repeat": 3,
+            "calibration_ops_per_sec": calibration, **meta,
+        },
+        "results": {"10000": {"update_product": {
+            "ops_per_sec": ops_per_sec, "p95_ms": p95_ms,
+        }}},
+    }
+
+
+def test_slower_machine_is_not_a_regression():
+    baseline = report(150_000, 2000, 2.5)
+    assert compare(report(75_000, 1100, 4.6), baseline, 0.4, 1.0, 2.0) == []
+
+
+def test_slower_code_on_the_same_machine_is_a_regression():
+    baseline = report(150_000, 2000, 2.5)
+    regressions = compare(report(150_000, 1000, 2.5), baseline, 0.4, 1.0, 2.0)
+    assert [metric for *_, metric, _, _ in regressions] == ["ops_per_sec"]
+
+
+def test_small_p95_changes_are_noise():
+    baseline = report(150_000, 2000, 0.03)
+    assert compare(report(150_000, 2000, 0.3), baseline, 0.4, 1.0, 2.0) == []
+    regressions = compare(report(150_000, 2000, 9.0), baseline, 0.4, 1.0, 2.0)
+    assert [metric for *_, metric, _, _ in regressions] == ["p95_ms"]
+
+
+def test_baseline_without_calibration_is_not_compared():
+    baseline = report(150_000, 2000, 2.5)
+    del baseline["meta"]["calibration_ops_per_sec"]
+    assert incomparable(report(150_000, 2000, 2.5), baseline)
+    assert incomparable(report(150_000, 2000, 2.5, ops=500),
+                        report(150_000, 2000, 2.5))
+    assert incomparable(report(150_000, 2000, 2.5),
+                        report(150_000, 2000, 2.5)) is None
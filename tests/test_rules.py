@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from bulk import import_products
+from rules import PRODUCT_FIELDS, QUANTITY_REQUIRED, check_product
+
+
+def product_record(db, sku):
+    row = db.get_product_by_sku(sku)[0]
+    return {field: getattr(row, field) for field in PRODUCT_FIELDS}
+
+
+@pytest.mark.parametrize("quantity", ["", None])
+def test_quantity_is_required(db, quantity):
+    record = product_record(db, 1)
+    record["quantity"] = quantity
+    assert check_product(record, db.catalog()) == (
+        None, [("quantity", QUANTITY_REQUIRED)])
+
+
+def test_import_rejects_the_rows_the_window_rejects(db, tmp_path):
+    path = tmp_path / "products.jsonl"
+    missing, fresh = product_record(db, 1), product_record(db, 2)
+    missing["sku"], fresh["sku"] = 999998, 999999
+    del missing["quantity"]
+    with open(path, "w", encoding="utf-8") as fh:
+        for record in (missing, fresh):
+            fh.write(json.dumps(record) + "\n")
+
+    report = import_products(db, str(path))
+    assert report.rejected == 1
+    assert report.samples[0][:2] == (1, "quantity")
+    assert report.written == 1
+    assert not db.get_product_by_sku(999998)
@@ -0,0 +1,48 @@
+import os
+import shutil
+
+import pytest
+
+from database import SEARCH_PLAN_CASES, main, product_filters
+
+
+DATA_DB = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data.db")
+
+
+INDEXES = sorted({index for _, index in SEARCH_PLAN_CASES if index})
+
+
+def test_search_plans_use_their_indexes(db):
+    assert db.verify_search_plans() == []
+
+
+@pytest.mark.parametrize("index", INDEXES)
+def test_dropped_index_is_reported(db, index):
+    db.execute(f"DROP INDEX {index}")
+    failures = db.verify_search_plans()
+    assert failures
+    assert all(expected == index for _, expected, _ in failures)
+
+
+def test_plans_do_not_depend_on_statistics(db):
+    db.execute("DROP TABLE sqlite_stat1")
+    assert db.verify_search_plans() == []
+
+
+def test_check_passes_on_the_shipped_database(tmp_path):
+    # data.db no tiene sqlite_stat1.
+    path = tmp_path / "data.db"
+    shutil.copy(DATA_DB, path)
+    assert main(["--db", str(path), "check"]) == 0
+
+
+@pytest.mark.parametrize(
+    "filters", [filters for filters, _ in SEARCH_PLAN_CASES])
+def test_search_returns_the_filtered_rows_in_sku_order(db, filters):
+    conditions, params = product_filters(**filters)
+    expected = [sku for sku, in db.query(
+        f"SELECT sku FROM Product p WHERE 1 {conditions} "
+        f"ORDER BY sku LIMIT 20", params)]
+    rows, _ = db.search_products(None, 20, **filters)
+    assert [row[0] for row in rows] == expected
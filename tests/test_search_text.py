@@ -0,0 +1,27 @@
+def add_products(db, rows):
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO Product (
+                sku, description, id_department, id_class, id_family, stock,
+                quantity, record_delete, model, brand, record_data,
+                discontinued
+            )
+            SELECT ?, ?, id_department, id_class, id, 1, 0, '1900-01-01',
+                   'BNCPRO', ?, '2026-01-01', 0
+            FROM Family LIMIT 1
+        """, rows)
+
+
+def test_best_match_wins_beyond_the_first_matches(db):
+    # Más coincidencias que las que antes se ordenaban; la mejor tiene el
+    # rowid más alto.
+    add_products(db, [(100000 + i, "Licuadora de prueba", "Mabe")
+                      for i in range(3000)])
+    add_products(db, [(999999, "Licuadora", "Licuadora")])
+    assert db.search_text("licuadora", 5)[0][0] == 999999
+
+
+def test_results_are_in_score_order(db):
+    scores = [row[0] for row in db.search_text_ranked("sof", 50)]
+    assert scores
+    assert scores == sorted(scores)
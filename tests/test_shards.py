@@ -0,0 +1,63 @@
+import shutil
+
+import pytest
+
+from archive import ARCHIVE_COLUMNS
+from database import ProductArchived
+from rules import PRODUCT_FIELDS
+from shards import ShardedDatabaseManager, open_database, split_database
+
+
+@pytest.fixture
+def sharded(catalog_file, tmp_path):
+    path = tmp_path / "data.db"
+    shutil.copy(catalog_file, path)
+    split_database(str(path))
+    manager = open_database(str(path))
+    assert isinstance(manager, ShardedDatabaseManager)
+    yield manager
+    manager.close()
+
+
+def test_partial_update_moves_product_between_files(sharded):
+    product = sharded.get_product_by_sku(1)[0]
+    target = next(dept for dept in sharded.shards
+                  if dept != product.id_department)
+    _, id_class, id_family, _ = next(
+        row for row in sharded.catalog().rows()[2] if row[0] == target)
+
+    assert sharded.update_product(
+        1, description=None, id_department=target, id_class=id_class,
+        id_family=id_family, stock=None, quantity=None) == 1
+
+    moved = sharded.get_product_by_sku(1)[0]
+    assert (moved.id_department, moved.id_class, moved.id_family) == (
+        target, id_class, id_family)
+    assert (moved.description, moved.stock, moved.quantity) == (
+        product.description, product.stock, product.quantity)
+    assert moved.row_version == product.row_version + 1
+    assert sharded.shard_for(1) == target
+    assert sharded.verify() == []
+
+
+def test_alta_of_sku_archived_in_another_file_is_rejected(sharded):
+    product = sharded.get_product_by_sku(1)[0]
+    shard = sharded.shards[product.id_department]
+    with shard.transaction() as conn:
+        conn.execute(f"""
+            INSERT INTO ProductArchive ({ARCHIVE_COLUMNS}, archived_at)
+            SELECT {ARCHIVE_COLUMNS}, '2026-01-01' FROM Product WHERE sku = 1
+        """)
+        conn.execute("DELETE FROM Product WHERE sku = 1")
+    shard.product_cache.clear()
+    sharded.refresh_sku_index()
+
+    values = dict(zip(PRODUCT_FIELDS, (getattr(product, field)
+                                       for field in PRODUCT_FIELDS)))
+    target = next(dept for dept in sharded.shards
+                  if dept != product.id_department)
+    values["id_department"], values["id_class"], values["id_family"], _ = \
+        next(row for row in sharded.catalog().rows()[2] if row[0] == target)
+    with pytest.raises(ProductArchived):
+        sharded.add_product(*values.values())
+    assert sharded.archived_skus([1, 2]) == {1}
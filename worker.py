@@ -0,0 +1,89 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DatabaseWorker:
+    def __init__(self, root, readers=2, poll_ms=16, on_busy=None, on_error=None):
+        # Las operaciones corren en hilos aparte; los resultados se entregan
+        # en el hilo de Tk revisando una cola con root.after mientras haya
+        # operaciones pendientes.
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_busy = on_busy
+        self.on_error = on_error
+        self._reads = ThreadPoolExecutor(readers, thread_name_prefix="db-read")
+        self._writes = ThreadPoolExecutor(1, thread_name_prefix="db-write")
+        self._results = queue.SimpleQueue()
+        self._latest = {}
+        self._pending = 0
+        self._busy = 0
+        self._poll_job = None
+
+    def submit(
+        self, fn, *args, key=None, write=False, busy=True, on_done=None,
+        on_error=None
+    ):
+        # Con `key`, una operación nueva deja obsoleta a la anterior con la
+        # misma llave: se cancela si no ha empezado y su resultado se ignora.
+        if key is not None:
+            self.cancel(key)
+
+        executor = self._writes if write else self._reads
+        future = executor.submit(fn, *args)
+        if key is not None:
+            self._latest[key] = future
+
+        self._pending += 1
+        if busy:
+            self._set_busy(1)
+        future.add_done_callback(
+            lambda f: self._results.put((key, f, busy, on_done, on_error)))
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+        return future
+
+    def cancel(self, key):
+        future = self._latest.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def close(self):
+        if self._poll_job is not None:
+            self.root.after_cancel(self._poll_job)
+            self._poll_job = None
+        self._reads.shutdown(wait=False, cancel_futures=True)
+        self._writes.shutdown(wait=True)
+
+    def _set_busy(self, delta):
+        was_busy = self._busy > 0
+        self._busy += delta
+        if self.on_busy is not None and was_busy != (self._busy > 0):
+            self.on_busy(self._busy > 0)
+
+    def _poll(self):
+        self._poll_job = None
+        while True:
+            try:
+                key, future, busy, on_done, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            self._pending -= 1
+            if busy:
+                self._set_busy(-1)
+            if key is not None:
+                if self._latest.get(key) is not future:
+                    continue
+                del self._latest[key]
+            if future.cancelled():
+                continue
+
+            error = future.exception()
+            if error is None:
+                if on_done is not None:
+                    on_done(future.result())
+            elif (on_error or self.on_error) is not None:
+                (on_error or self.on_error)(error)
+
+        if self._pending:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)